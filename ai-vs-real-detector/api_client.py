@@ -4,6 +4,7 @@ Can be used in Vercel, Supabase Edge Functions, or any Python application
 """
 import requests
 import base64
+import hashlib
 from typing import Dict, List, Optional, Union
 from pathlib import Path
 import io
@@ -20,30 +21,36 @@ class AIDetectorClient:
         print(f"Prediction: {result['top_prediction']} ({result['confidence']*100}%)")
     """
     
-    def __init__(self, api_url: str, api_key: Optional[str] = None):
+    # Seconds to wait for GET /predict/{sha256} before uploading instead
+    LOOKUP_TIMEOUT_S = 5
+    
+    def __init__(self, api_url: str, api_key: Optional[str] = None, lookup_first: bool = True):
         """
         Initialize the client
         
         Args:
             api_url: Base URL of your Modal API endpoint
             api_key: Optional API key for authentication
+            lookup_first: Hash images locally and ask GET /predict/{sha256}
+                before uploading them
         """
         self.api_url = api_url.rstrip("/")
         self.api_key = api_key
+        self.lookup_first = lookup_first
         self.headers = {}
         
         if api_key:
             self.headers["Authorization"] = f"Bearer {api_key}"
     
-    def _encode_image(self, image: Union[str, Path, bytes, Image.Image]) -> str:
+    def _image_bytes(self, image: Union[str, Path, bytes, Image.Image]) -> bytes:
         """
-        Encode image to base64 string
+        Get the encoded bytes of an image
         
         Args:
             image: File path, bytes, or PIL Image
             
         Returns:
-            Base64 encoded string
+            Encoded image bytes
         """
         if isinstance(image, (str, Path)):
             # Read from file
@@ -59,7 +66,58 @@ class AIDetectorClient:
         else:
             raise ValueError(f"Unsupported image type: {type(image)}")
         
-        return base64.b64encode(image_bytes).decode()
+        return image_bytes
+    
+    def _encode_image(self, image: Union[str, Path, bytes, Image.Image]) -> str:
+        """
+        Encode image to base64 string
+        
+        Args:
+            image: File path, bytes, or PIL Image
+            
+        Returns:
+            Base64 encoded string
+        """
+        return base64.b64encode(self._image_bytes(image)).decode()
+    
+    def lookup(self, sha256: str) -> Optional[Dict]:
+        """
+        Stored prediction for an image the API has already scored
+        
+        Args:
+            sha256: Hex SHA-256 of the image bytes
+            
+        Returns:
+            Prediction result dictionary, or None if the hash is unknown or
+            the lookup failed (timeout, server error, or a server without
+            the endpoint); the image can then be uploaded instead
+        """
+        try:
+            response = requests.get(
+                f"{self.api_url}/predict/{sha256}",
+                headers=self.headers,
+                timeout=self.LOOKUP_TIMEOUT_S
+            )
+            if response.status_code != 200:
+                return None
+            return response.json()
+        except (requests.RequestException, ValueError):
+            return None
+    
+    def _lookup_first(self, image_bytes: bytes, return_all_scores: bool = True) -> Optional[Dict]:
+        """
+        Try the content-hash lookup before an upload
+        
+        Returns:
+            The stored result (trimmed to the top prediction unless
+            return_all_scores), or None to upload the image
+        """
+        if not self.lookup_first:
+            return None
+        result = self.lookup(hashlib.sha256(image_bytes).hexdigest())
+        if result is not None and not return_all_scores:
+            result["predictions"] = result["predictions"][:1]
+        return result
     
     def predict(
         self, 
@@ -76,6 +134,14 @@ class AIDetectorClient:
         Returns:
             Prediction result dictionary
         """
+        if self.lookup_first:
+            try:
+                known = self._lookup_first(base64.b64decode(image_base64.split(",")[-1]), return_all_scores)
+            except ValueError:
+                known = None  # malformed base64: let the API report it
+            if known is not None:
+                return known
+        
         response = requests.post(
             f"{self.api_url}/predict",
             headers={**self.headers, "Content-Type": "application/json"},
@@ -102,8 +168,33 @@ class AIDetectorClient:
         Returns:
             Prediction result dictionary
         """
-        image_base64 = self._encode_image(image_path)
-        return self.predict(image_base64, return_all_scores)
+        with open(image_path, "rb") as f:
+            return self.predict_bytes(f.read(), return_all_scores)
+    
+    def predict_bytes(self, image_bytes: bytes, return_all_scores: bool = True) -> Dict:
+        """
+        Predict from raw image bytes (sent as application/octet-stream,
+        a third smaller than the base64 JSON of predict())
+        
+        Args:
+            image_bytes: Encoded image (JPEG, PNG, WebP, ...)
+            return_all_scores: Whether to return all class scores
+            
+        Returns:
+            Prediction result dictionary
+        """
+        known = self._lookup_first(image_bytes, return_all_scores)
+        if known is not None:
+            return known
+        
+        response = requests.post(
+            f"{self.api_url}/predict/raw",
+            headers={**self.headers, "Content-Type": "application/octet-stream"},
+            params={"return_all_scores": return_all_scores},
+            data=image_bytes
+        )
+        response.raise_for_status()
+        return response.json()
     
     def predict_upload(self, image_path: Union[str, Path]) -> Dict:
         """
@@ -116,12 +207,18 @@ class AIDetectorClient:
             Prediction result dictionary
         """
         with open(image_path, "rb") as f:
-            files = {"file": f}
-            response = requests.post(
-                f"{self.api_url}/predict/upload",
-                headers=self.headers,
-                files=files
-            )
+            image_bytes = f.read()
+        
+        known = self._lookup_first(image_bytes)
+        if known is not None:
+            return known
+        
+        files = {"file": (Path(image_path).name, image_bytes)}
+        response = requests.post(
+            f"{self.api_url}/predict/upload",
+            headers=self.headers,
+            files=files
+        )
         response.raise_for_status()
         return response.json()
     
@@ -138,12 +235,16 @@ class AIDetectorClient:
         Returns:
             Batch prediction results
         """
-        encoded_images = [self._encode_image(img) for img in images]
+        # Multipart upload of the raw bytes (no base64 inflation)
+        files = [
+            ("files", (f"image_{i}", self._image_bytes(img), "application/octet-stream"))
+            for i, img in enumerate(images)
+        ]
         
         response = requests.post(
-            f"{self.api_url}/predict/batch",
-            headers={**self.headers, "Content-Type": "application/json"},
-            json={"images": encoded_images}
+            f"{self.api_url}/predict/batch/upload",
+            headers=self.headers,
+            files=files
         )
         response.raise_for_status()
         return response.json()
@@ -12,6 +12,12 @@ export interface PredictionResponse {
   predictions: PredictionResult[];
   top_prediction: string;
   confidence: number;
+  source?: 'model' | 'metadata';
+  evidence?: { rule: string; field: string; value: string } | null;
+  cached?: boolean;
+  match_distance?: number | null;
+  sha256?: string;
+  model_version?: string;
 }
 
 export interface BatchPredictionResponse {
@@ -25,13 +31,22 @@ export interface HealthCheckResponse {
   model_loaded: boolean;
 }
 
+// Milliseconds to wait for GET /predict/{sha256} before uploading instead
+const LOOKUP_TIMEOUT_MS = 5000;
+
 export class AIDetectorClient {
   private apiUrl: string;
   private apiKey?: string;
+  private lookupFirst: boolean;
 
-  constructor(apiUrl: string, apiKey?: string) {
+  /**
+   * @param lookupFirst Hash images locally and ask GET /predict/{sha256}
+   *   before uploading them
+   */
+  constructor(apiUrl: string, apiKey?: string, lookupFirst: boolean = true) {
     this.apiUrl = apiUrl.replace(/\/$/, ''); // Remove trailing slash
     this.apiKey = apiKey;
+    this.lookupFirst = lookupFirst;
   }
 
   private async request<T>(
@@ -60,18 +75,57 @@ export class AIDetectorClient {
   }
 
   /**
-   * Convert File/Blob to base64 string
+   * Stored prediction for an image the API has already scored, or null when
+   * the hash is unknown or the lookup fails (timeout, server error, or a
+   * server without the endpoint), so the caller can upload instead
    */
-  private async fileToBase64(file: File | Blob): Promise<string> {
-    return new Promise((resolve, reject) => {
-      const reader = new FileReader();
-      reader.onload = () => {
-        const base64 = (reader.result as string).split(',')[1];
-        resolve(base64);
-      };
-      reader.onerror = reject;
-      reader.readAsDataURL(file);
-    });
+  async lookup(sha256: string): Promise<PredictionResponse | null> {
+    const headers: HeadersInit = {};
+    if (this.apiKey) {
+      headers['Authorization'] = `Bearer ${this.apiKey}`;
+    }
+
+    try {
+      const response = await fetch(`${this.apiUrl}/predict/${sha256}`, {
+        headers,
+        signal: AbortSignal.timeout(LOOKUP_TIMEOUT_MS),
+      });
+      if (response.status !== 200) {
+        return null;
+      }
+      return await response.json();
+    } catch {
+      return null;
+    }
+  }
+
+  /**
+   * Try the content-hash lookup before an upload (null: upload the image)
+   */
+  private async lookupBeforeUpload(
+    data: Blob | BufferSource,
+    returnAllScores: boolean = true
+  ): Promise<PredictionResponse | null> {
+    if (!this.lookupFirst) {
+      return null;
+    }
+
+    let sha256: string;
+    try {
+      const bytes = data instanceof Blob ? await data.arrayBuffer() : data;
+      const digest = await crypto.subtle.digest('SHA-256', bytes);
+      sha256 = Array.from(new Uint8Array(digest))
+        .map((b) => b.toString(16).padStart(2, '0'))
+        .join('');
+    } catch {
+      return null; // no WebCrypto (e.g. plain-HTTP pages): just upload
+    }
+
+    const result = await this.lookup(sha256);
+    if (result && !returnAllScores) {
+      result.predictions = result.predictions.slice(0, 1);
+    }
+    return result;
   }
 
   /**
@@ -81,6 +135,19 @@ export class AIDetectorClient {
     imageBase64: string,
     returnAllScores: boolean = true
   ): Promise<PredictionResponse> {
+    if (this.lookupFirst) {
+      let known: PredictionResponse | null = null;
+      try {
+        const bytes = Uint8Array.from(atob(imageBase64.split(',').pop()!), (c) => c.charCodeAt(0));
+        known = await this.lookupBeforeUpload(bytes, returnAllScores);
+      } catch {
+        // Malformed base64: let the API report it
+      }
+      if (known) {
+        return known;
+      }
+    }
+
     return this.request<PredictionResponse>('/predict', {
       method: 'POST',
       headers: {
@@ -94,20 +161,38 @@ export class AIDetectorClient {
   }
 
   /**
-   * Predict from File object (browser)
+   * Predict from File object (browser), sent as raw bytes
    */
   async predictFile(
-    file: File,
+    file: File | Blob,
     returnAllScores: boolean = true
   ): Promise<PredictionResponse> {
-    const base64 = await this.fileToBase64(file);
-    return this.predict(base64, returnAllScores);
+    const known = await this.lookupBeforeUpload(file, returnAllScores);
+    if (known) {
+      return known;
+    }
+
+    return this.request<PredictionResponse>(
+      `/predict/raw?return_all_scores=${returnAllScores}`,
+      {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/octet-stream',
+        },
+        body: file,
+      }
+    );
   }
 
   /**
    * Predict by uploading file
    */
   async predictUpload(file: File): Promise<PredictionResponse> {
+    const known = await this.lookupBeforeUpload(file);
+    if (known) {
+      return known;
+    }
+
     const formData = new FormData();
     formData.append('file', file);
 
@@ -123,17 +208,19 @@ export class AIDetectorClient {
   async predictBatch(
     images: string[] | File[]
   ): Promise<BatchPredictionResponse> {
-    let imageBase64Array: string[];
-
     if (images.length > 0 && images[0] instanceof File) {
-      // Convert Files to base64
-      imageBase64Array = await Promise.all(
-        (images as File[]).map((file) => this.fileToBase64(file))
-      );
-    } else {
-      imageBase64Array = images as string[];
+      // Upload Files as multipart (raw bytes, no base64)
+      const formData = new FormData();
+      (images as File[]).forEach((file) => formData.append('files', file));
+
+      return this.request<BatchPredictionResponse>('/predict/batch/upload', {
+        method: 'POST',
+        body: formData,
+      });
     }
 
+    const imageBase64Array = images as string[];
+
     return this.request<BatchPredictionResponse>('/predict/batch', {
       method: 'POST',
       headers: {
@@ -0,0 +1,192 @@
+"""
+Startup autotuner for the serving backend
+Benchmarks the execution modes available on this machine and keeps the
+fastest one whose scores stay within a parity tolerance of eager fp32
+"""
+import copy
+import os
+import statistics
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import torch
+import torch.nn as nn
+from PIL import Image
+
+from inference_engine import InferenceEngine, parity_report
+from model_utils import create_preprocessing_transform
+
+# Tried in this order (cheapest to build first); "fp32" is always the reference
+AUTOTUNE_CANDIDATES = ["fp32", "reduced", "onnx", "onnx-int8", "compiled"]
+
+
+def synthetic_images(count: int) -> List[Image.Image]:
+    """Deterministic noise images used to time and compare the candidates"""
+    return [
+        Image.effect_noise((320, 240), 32 + i).convert("RGB").rotate(i * 7)
+        for i in range(count)
+    ]
+
+
+def _torch_candidate(model: nn.Module, device: torch.device, idx_to_class: Dict[int, str],
+                     config: Dict[str, Any], max_batch_size: int):
+    """InferenceEngine on a private copy of the model, plus its transform"""
+    engine = InferenceEngine(copy.deepcopy(model), device, idx_to_class, config, max_batch_size)
+    return engine, create_preprocessing_transform(config)
+
+
+def _onnx_candidate(model: nn.Module, idx_to_class: Dict[int, str], config: Dict[str, Any],
+                    repo_path: str, max_batch_size: int, int8: bool):
+    """
+    OnnxEngine over the repo's exported graph.
+
+    The fp32 graph is exported on the fly when the repo does not ship one;
+    the INT8 graph is only used if present, since it has to pass the
+    accuracy gate in quantize_model.py first.
+    """
+    from onnx_engine import OnnxEngine
+
+    key, default = ("int8_onnx_path", "model.int8.onnx") if int8 else ("onnx_path", "model.onnx")
+    onnx_path = os.path.join(repo_path, config.get(key, default))
+
+    if os.path.exists(onnx_path):
+        engine = OnnxEngine(onnx_path, idx_to_class, config, max_batch_size)
+        return engine, engine.preprocess
+
+    if int8:
+        raise FileNotFoundError(f"{os.path.basename(onnx_path)} not found (run quantize_model.py)")
+
+    from export_onnx import export_onnx
+
+    with tempfile.TemporaryDirectory() as tmp:
+        exported = export_onnx(
+            copy.deepcopy(model), os.path.join(tmp, "model.onnx"),
+            image_size=config.get("image_size", 224), verbose=False
+        )
+        # The session holds the graph in memory, so the file can go
+        engine = OnnxEngine(exported, idx_to_class, config, max_batch_size)
+
+    return engine, engine.preprocess
+
+
+def autotune(
+    model: nn.Module,
+    device: torch.device,
+    idx_to_class: Dict[int, str],
+    config: Dict[str, Any],
+    repo_path: str = "",
+    max_batch_size: int = None
+) -> Tuple[Any, Callable, Dict[str, Any]]:
+    """
+    Pick the fastest serving backend that matches eager fp32.
+
+    Each candidate is built, checked against the fp32 scores on a synthetic
+    batch and timed at the largest serving batch size. Candidates that are
+    unavailable (e.g. onnxruntime not installed) or fail are recorded and
+    skipped; once "autotune_budget_s" is spent the remaining ones are skipped.
+
+    Args:
+        model: fp32 detector with weights loaded (left untouched)
+        device: Device for the PyTorch candidates
+        idx_to_class: Class index to label mapping
+        config: Parsed config.json (reads "autotune_candidates",
+            "autotune_budget_s", "autotune_tolerance", "autotune_iterations")
+        repo_path: Model directory holding the .onnx files
+        max_batch_size: Largest batch served (defaults to config "max_batch_size")
+
+    Returns:
+        (engine, transform, report) where report holds the selected backend
+        and the timing table for every candidate
+    """
+    max_batch_size = max_batch_size or config.get("max_batch_size", 16)
+    budget = config.get("autotune_budget_s", 60.0)
+    tolerance = config.get("autotune_tolerance", 0.01)
+    iterations = max(1, config.get("autotune_iterations", 3))
+
+    reduced = "fp16" if device.type == "cuda" else "bf16"
+    # Only the winner is warmed up on every batch size
+    base = {**config, "compile": False, "warmup": False}
+    builders = {
+        "fp32": ("torch-fp32", lambda: _torch_candidate(
+            model, device, idx_to_class, {**base, "inference_dtype": "fp32"}, max_batch_size)),
+        "reduced": (f"torch-{reduced}", lambda: _torch_candidate(
+            model, device, idx_to_class, {**base, "inference_dtype": reduced}, max_batch_size)),
+        "onnx": ("onnx", lambda: _onnx_candidate(
+            model, idx_to_class, base, repo_path, max_batch_size, int8=False)),
+        "onnx-int8": ("onnx-int8", lambda: _onnx_candidate(
+            model, idx_to_class, base, repo_path, max_batch_size, int8=True)),
+        "compiled": ("torch-compiled", lambda: _torch_candidate(
+            model, device, idx_to_class, {**config, "compile": True}, max_batch_size)),
+    }
+
+    requested = config.get("autotune_candidates", AUTOTUNE_CANDIDATES)
+    unknown = [name for name in requested if name not in builders]
+    if unknown:
+        raise ValueError(f"Unknown autotune candidates {unknown}, expected {AUTOTUNE_CANDIDATES}")
+    order = ["fp32"] + [name for name in AUTOTUNE_CANDIDATES if name in requested and name != "fp32"]
+
+    images = synthetic_images(max_batch_size)
+    start = time.perf_counter()
+    reference = None
+    best = None
+    table = []
+
+    print(f"🔧 Autotuning backends on {device} (batch {max_batch_size}, budget {budget:.0f}s)")
+
+    for key in order:
+        name, build = builders[key]
+        row = {"name": name, "status": "ok"}
+        table.append(row)
+
+        # The fp32 reference always runs, even if the budget is tiny
+        if reference is not None and time.perf_counter() - start > budget:
+            row["status"] = "skipped: budget"
+            print(f"  {name:16s} skipped (budget spent)")
+            continue
+
+        try:
+            engine, transform = build()
+            inputs = [transform(image) for image in images]
+            probs = torch.as_tensor(engine.forward_tensors(inputs))
+
+            timings = []
+            for _ in range(iterations):
+                t0 = time.perf_counter()
+                engine.forward_tensors(inputs)
+                timings.append((time.perf_counter() - t0) * 1000.0)
+        except Exception as e:
+            if reference is None:
+                raise
+            row["status"] = f"unavailable: {e}"
+            print(f"  {name:16s} unavailable ({e})")
+            continue
+
+        ms = statistics.median(timings)
+        row["ms_per_batch"] = round(ms, 2)
+        row["images_per_sec"] = round(len(inputs) * 1000.0 / ms, 1)
+
+        if reference is None:
+            reference = probs
+        row["max_abs_diff"] = parity_report(reference, probs)["max_abs_diff"]
+
+        if row["max_abs_diff"] > tolerance:
+            row["status"] = "rejected: parity"
+        elif best is None or row["images_per_sec"] > best[2]["images_per_sec"]:
+            best = (engine, transform, row)
+
+        print(f"  {name:16s} {ms:8.1f} ms  {row['status']}")
+
+    engine, transform, selected = best
+    if not engine.ready:
+        engine.warmup()
+    report = {
+        "selected": selected["name"],
+        "batch_size": max_batch_size,
+        "tolerance": tolerance,
+        "seconds": round(time.perf_counter() - start, 1),
+        "candidates": table,
+    }
+
+    print(f"✓ Autotuner selected {report['selected']} ({selected['images_per_sec']} img/s)")
+    return engine, transform, report
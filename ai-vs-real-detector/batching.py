@@ -0,0 +1,363 @@
+"""
+Dynamic micro-batching for the inference container
+Collects concurrent single-image requests into one batched forward pass
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+def serving_batch_sizes(max_batch_size: int) -> List[int]:
+    """
+    Batch sizes the engine serves: powers of two up to max_batch_size.
+
+    Warmup runs each of these once; compiled graphs are specialized per
+    shape, so batches are padded up to the nearest one instead of recompiling.
+
+    Args:
+        max_batch_size: Largest batch the container serves
+
+    Returns:
+        Sorted list of batch sizes, always ending with max_batch_size
+    """
+    sizes = []
+    size = 1
+    while size < max_batch_size:
+        sizes.append(size)
+        size *= 2
+    sizes.append(max(1, max_batch_size))
+    return sizes
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on (respects container CPU affinity)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def plan_cpu_threads(config: Dict[str, Any], device_type: str, cpus: int = None) -> Tuple[int, int]:
+    """
+    Split the container's CPUs between decode workers and torch intra-op threads.
+
+    Unset (or 0) values are derived from the CPU count: with a GPU most of
+    the CPU work is decoding, so decode gets half the cores; on CPU-only
+    hosts the forward pass needs them, so decode gets a quarter. torch gets
+    whatever decode does not use, so the two never oversubscribe the cores.
+
+    Args:
+        config: Parsed config.json (reads "decode_workers", "torch_threads")
+        device_type: "cuda" or "cpu"
+        cpus: CPU count (defaults to available_cpus())
+
+    Returns:
+        (decode_workers, torch_threads)
+    """
+    cpus = cpus or available_cpus()
+    share = 2 if device_type == "cuda" else 4
+
+    decode_workers = config.get("decode_workers", 0) or max(1, cpus // share)
+    torch_threads = config.get("torch_threads", 0) or max(1, cpus - decode_workers)
+    return decode_workers, torch_threads
+
+
+class StageTimer:
+    """
+    Busy-time counter for one pipeline stage.
+
+    Utilization is the fraction of wall time the stage spent working, per
+    thread: near 1.0 means the stage is the bottleneck.
+
+    Usage:
+        timer = StageTimer()
+        with timer:
+            work()
+    """
+
+    def __init__(self, parallelism: int = 1):
+        """
+        Args:
+            parallelism: Threads that run this stage (utilization is per thread)
+        """
+        self.parallelism = max(1, parallelism)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._started = time.monotonic()
+        self._busy = 0.0
+        self._items = 0
+
+    def __enter__(self):
+        self._local.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.monotonic() - self._local.start
+        with self._lock:
+            self._busy += elapsed
+            self._items += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for health checks"""
+        with self._lock:
+            wall = max(time.monotonic() - self._started, 1e-9)
+            return {
+                "runs": self._items,
+                "busy_seconds": round(self._busy, 3),
+                "utilization": round(self._busy / (wall * self.parallelism), 4),
+            }
+
+
+class MicroBatcher:
+    """
+    Groups items submitted from concurrent threads into batches.
+
+    A background worker waits for the first pending item, then keeps
+    collecting until either `max_batch_size` items are queued or
+    `max_wait_ms` has passed since the oldest one arrived. The batch goes
+    through `process_batch` in a single call and every caller receives its
+    own result (or the exception raised for the batch).
+
+    With `stages`, the output of `process_batch` is handed on through further
+    functions, each on its own thread and connected by bounded queues
+    (`queue_depth`). While one batch is in a later stage (e.g. the forward
+    pass) the next one is already being assembled; the last stage must
+    return one result per item.
+
+    Usage:
+        batcher = MicroBatcher(run_batch, max_batch_size=16, max_wait_ms=10)
+        result = batcher.submit(item)  # blocks until the batch has run
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], Any],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 10.0,
+        stages: Sequence[Tuple[str, Callable[[Any], Any]]] = (),
+        queue_depth: int = 1,
+    ):
+        """
+        Args:
+            process_batch: Function mapping a list of items to a list of results (same
+                order), or to the input of the first stage
+            max_batch_size: Largest batch handed to process_batch
+            max_wait_ms: Longest time the oldest queued item waits for companions
+            stages: (name, function) pairs run in order on their own threads
+            queue_depth: Batches that may wait between two stages
+        """
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be >= 1, got {max_batch_size}")
+
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+
+        self._cond = threading.Condition()
+        self._pending: List[Tuple[Any, Future, float]] = []
+        self._closed = False
+
+        self._batches = 0
+        self._items = 0
+        self._largest_batch = 0
+
+        self._stages = list(stages)
+        self._timers = {"batch": StageTimer()}
+        self._timers.update((name, StageTimer()) for name, _ in self._stages)
+        self._queues = [queue.Queue(maxsize=max(1, queue_depth)) for _ in self._stages]
+
+        self._stage_threads = [
+            threading.Thread(
+                target=self._run_stage, args=(i,), name=f"micro-batcher-{name}", daemon=True
+            )
+            for i, (name, _) in enumerate(self._stages)
+        ]
+        for thread in self._stage_threads:
+            thread.start()
+
+        self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+    def submit_async(self, item: Any) -> Future:
+        """Queue an item and return a Future for its result"""
+        future: Future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            self._pending.append((item, future, time.monotonic()))
+            self._cond.notify()
+        return future
+
+    def submit_many(self, items: Sequence[Any]) -> List[Future]:
+        """
+        Queue several items at once, so they share a batch (up to
+        max_batch_size) instead of racing other callers for slots
+        """
+        futures = [Future() for _ in items]
+        now = time.monotonic()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            self._pending.extend((item, future, now) for item, future in zip(items, futures))
+            self._cond.notify()
+        return futures
+
+    def submit(self, item: Any, timeout: Optional[float] = None) -> Any:
+        """Queue an item and block until its result is ready"""
+        return self.submit_async(item).result(timeout=timeout)
+
+    def close(self):
+        """Stop accepting items, flush what is queued and stop the workers"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join()
+
+        # The sentinel follows the last batch through every stage
+        if self._queues:
+            self._queues[0].put(None)
+        for thread in self._stage_threads:
+            thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """Batching counters for health checks"""
+        with self._cond:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "batches": self._batches,
+                "items": self._items,
+                "largest_batch": self._largest_batch,
+                "avg_batch_size": self._items / self._batches if self._batches else 0.0,
+                "queued": len(self._pending),
+                "in_flight": sum(q.qsize() for q in self._queues),
+                "stages": {name: timer.stats() for name, timer in self._timers.items()},
+            }
+
+    def _next_batch(self) -> List[Tuple[Any, Future, float]]:
+        """Block until a batch is ready; an empty list means the batcher is closed"""
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+
+            if not self._pending:
+                return []
+
+            # The deadline follows the oldest request, so no caller waits longer than max_wait
+            deadline = self._pending[0][2] + self.max_wait
+            while len(self._pending) < self.max_batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+
+            self._batches += 1
+            self._items += len(batch)
+            self._largest_batch = max(self._largest_batch, len(batch))
+            return batch
+
+    def _run(self):
+        """Worker loop: collect a batch, process it, hand results back"""
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+
+            items = [item for item, _, _ in batch]
+            futures = [future for _, future, _ in batch]
+
+            try:
+                with self._timers["batch"]:
+                    output = self.process_batch(items)
+            except Exception as e:
+                self._fail(futures, e)
+                continue
+
+            if self._queues:
+                # Blocks while the next stage is behind (bounded hand-off)
+                self._queues[0].put((futures, output))
+            else:
+                self._resolve(futures, output)
+
+    def _run_stage(self, index: int):
+        """Stage loop: take a batch from the previous stage, process it, pass it on"""
+        name, function = self._stages[index]
+        inbox = self._queues[index]
+        outbox = self._queues[index + 1] if index + 1 < len(self._queues) else None
+
+        while True:
+            entry = inbox.get()
+            if entry is None:
+                if outbox is not None:
+                    outbox.put(None)
+                return
+
+            futures, payload = entry
+            try:
+                with self._timers[name]:
+                    output = function(payload)
+            except Exception as e:
+                self._fail(futures, e)
+                continue
+
+            if outbox is not None:
+                outbox.put((futures, output))
+            else:
+                self._resolve(futures, output)
+
+    @staticmethod
+    def _resolve(futures: List[Future], results: List[Any]):
+        """Hand each caller its result"""
+        if len(results) != len(futures):
+            MicroBatcher._fail(futures, RuntimeError(
+                f"Batch produced {len(results)} results for {len(futures)} items"
+            ))
+            return
+
+        for future, result in zip(futures, results):
+            future.set_result(result)
+
+    @staticmethod
+    def _fail(futures: List[Future], error: Exception):
+        """Raise the batch's exception for every caller"""
+        for future in futures:
+            future.set_exception(error)
+
+
+def engine_pipeline(engine: Any, max_batch_size: int, max_wait_ms: float = 10.0,
+                    queue_depth: int = 1) -> MicroBatcher:
+    """
+    Micro-batcher that runs an inference engine as a three-stage pipeline.
+
+    batch:       collect requests and copy them into an input buffer (engine.load_batch)
+    forward:     run the model on the filled buffer (engine.run_batch)
+    postprocess: turn probabilities into label/score lists (engine.format_batch)
+
+    While batch N is in the forward pass, batch N+1 is copied into a second
+    buffer, so host-side work overlaps the accelerator (or, on CPU-only
+    hosts, the intra-op thread pool).
+
+    Args:
+        engine: InferenceEngine or OnnxEngine
+        max_batch_size: Largest batch (the engine's largest serving size)
+        max_wait_ms: Longest time the oldest request waits for companions
+        queue_depth: Batches that may wait between two stages
+
+    Returns:
+        MicroBatcher whose submit() takes one preprocessed tensor
+    """
+    return MicroBatcher(
+        engine.load_batch,
+        max_batch_size=max_batch_size,
+        max_wait_ms=max_wait_ms,
+        stages=[
+            ("forward", lambda staged: engine.run_batch(*staged)),
+            ("postprocess", engine.format_batch),
+        ],
+        queue_depth=queue_depth,
+    )
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for batched inference
+Compares the per-image loop against a single batched forward pass
+
+Usage:
+    python benchmark_batch.py
+    python benchmark_batch.py --batch-sizes 1 4 8 16 32 --iters 20 --device cuda
+"""
+import argparse
+import base64
+import io
+import os
+import time
+
+import timm
+import torch
+from PIL import Image
+
+from model_utils import load_model_from_checkpoint, create_preprocessing_transform
+
+
+def load_benchmark_model(repo_path: str, device: torch.device):
+    """Load the detector, falling back to random weights if the checkpoint is unavailable"""
+    checkpoint_path = os.path.join(repo_path, "pytorch_model.bin")
+    config_path = os.path.join(repo_path, "config.json")
+
+    try:
+        model, metadata = load_model_from_checkpoint(
+            checkpoint_path, config_path, device=device, verbose=False
+        )
+        return model, metadata
+    except Exception as e:
+        # Throughput does not depend on the weights, so random init is fine here
+        print(f"⚠ Could not load checkpoint ({e}), benchmarking with random weights")
+        model = timm.create_model("efficientformerv2_s1", pretrained=False, num_classes=2)
+        model.to(device)
+        model.eval()
+        return model, {}
+
+
+def make_test_images(count: int, size: int = 512):
+    """Create synthetic JPEGs as base64 strings, like the /predict payloads"""
+    images = []
+    for i in range(count):
+        img = Image.effect_noise((size, size), 64 + i % 64).convert("RGB")
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=90)
+        images.append(base64.b64encode(buffer.getvalue()).decode())
+    return images
+
+
+def preprocess(image_data: str, transform):
+    """Decode + transform, as AIDetectorModel._decode and _infer do (full-size PIL decode, no fast_decode)"""
+    image_bytes = base64.b64decode(image_data)
+    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    return transform(image)
+
+
+def run_looped(model, images, transform, device):
+    """Old predict_batch: one decode/forward/copy round trip per image"""
+    for image_data in images:
+        tensor = preprocess(image_data, transform).unsqueeze(0).to(device)
+        with torch.no_grad():
+            torch.softmax(model(tensor), dim=1).cpu()
+
+
+def run_batched(model, images, transform, device):
+    """New predict_batch: stack once, one forward, one device-to-host copy"""
+    batch = torch.stack([preprocess(image_data, transform) for image_data in images]).to(device)
+    with torch.no_grad():
+        torch.softmax(model(batch), dim=1).cpu()
+
+
+def images_per_second(fn, images, iters: int, device: torch.device) -> float:
+    """Time fn over several iterations and return throughput"""
+    fn(images)  # warmup
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+
+    start = time.perf_counter()
+    for _ in range(iters):
+        fn(images)
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    elapsed = time.perf_counter() - start
+
+    return len(images) * iters / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched vs looped inference")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 10, 16, 32])
+    parser.add_argument("--iters", type=int, default=10)
+    parser.add_argument("--image-size", type=int, default=512, help="Side of the synthetic input JPEGs")
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    repo_path = os.path.dirname(os.path.abspath(__file__))
+
+    model, metadata = load_benchmark_model(repo_path, device)
+    transform = create_preprocessing_transform(metadata)
+
+    print(f"🏁 Benchmarking on {device} ({args.iters} iterations per batch size)")
+    print("=" * 60)
+    print(f"{'batch':>6s} {'looped img/s':>14s} {'batched img/s':>14s} {'speedup':>9s}")
+    print("-" * 60)
+
+    for batch_size in args.batch_sizes:
+        images = make_test_images(batch_size, args.image_size)
+
+        looped = images_per_second(
+            lambda imgs: run_looped(model, imgs, transform, device), images, args.iters, device
+        )
+        batched = images_per_second(
+            lambda imgs: run_batched(model, imgs, transform, device), images, args.iters, device
+        )
+
+        print(f"{batch_size:6d} {looped:14.1f} {batched:14.1f} {batched / looped:8.2f}x")
+
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
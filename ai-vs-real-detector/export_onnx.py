@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Export the detector to ONNX for ONNX Runtime serving
+Turns pytorch_model.bin + config.json into an ONNX graph with a dynamic batch axis
+
+Usage:
+    python export_onnx.py
+    python export_onnx.py --output model.onnx --opset 17
+
+Requires torch, timm and onnx at export time; serving only needs
+onnxruntime (see requirements-onnx.txt and "backend": "onnx" in config.json).
+"""
+import argparse
+import inspect
+import os
+import sys
+
+import torch
+import torch.nn as nn
+
+from model_utils import load_model_from_checkpoint
+
+# Graph input/output names shared with onnx_engine.OnnxEngine
+ONNX_INPUT_NAME = "pixel_values"
+ONNX_OUTPUT_NAME = "logits"
+
+
+def export_onnx(
+    model: nn.Module,
+    output_path: str,
+    image_size: int = 224,
+    opset: int = 17,
+    verbose: bool = True
+) -> str:
+    """
+    Export a loaded model to ONNX with a dynamic batch dimension.
+
+    Args:
+        model: Detector in eval mode (exported from the CPU)
+        output_path: Where to write the .onnx file
+        image_size: Spatial size of the (fixed) input resolution
+        opset: ONNX opset version
+        verbose: Whether to print export information
+
+    Returns:
+        The output path
+    """
+    model = model.to("cpu").float().eval()
+    dummy = torch.zeros(1, 3, image_size, image_size)
+
+    export_kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # The TorchScript exporter handles dynamic_axes directly
+        export_kwargs["dynamo"] = False
+
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            dummy,
+            output_path,
+            input_names=[ONNX_INPUT_NAME],
+            output_names=[ONNX_OUTPUT_NAME],
+            dynamic_axes={ONNX_INPUT_NAME: {0: "batch"}, ONNX_OUTPUT_NAME: {0: "batch"}},
+            opset_version=opset,
+            do_constant_folding=True,
+            **export_kwargs
+        )
+
+    if verbose:
+        size_mb = os.path.getsize(output_path) / 1024 / 1024
+        print(f"✓ Exported ONNX graph to {output_path} ({size_mb:.1f} MB, opset {opset})")
+
+    return output_path
+
+
+def verify_onnx(model: nn.Module, onnx_path: str, image_size: int = 224, batch_size: int = 4) -> float:
+    """
+    Compare ONNX Runtime logits against PyTorch on a random batch.
+
+    Returns:
+        Maximum absolute logit difference
+    """
+    import onnxruntime as ort
+
+    batch = torch.randn(batch_size, 3, image_size, image_size)
+    with torch.no_grad():
+        expected = model.to("cpu").float().eval()(batch).numpy()
+
+    session = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+    actual = session.run([ONNX_OUTPUT_NAME], {ONNX_INPUT_NAME: batch.numpy()})[0]
+
+    return float(abs(expected - actual).max())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the detector to ONNX")
+    parser.add_argument("--checkpoint", default="pytorch_model.bin")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--output", default="model.onnx")
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--tolerance", type=float, default=1e-3,
+                        help="Maximum logit difference accepted by the ORT check")
+    args = parser.parse_args()
+
+    model, metadata = load_model_from_checkpoint(args.checkpoint, args.config, device="cpu")
+
+    image_size = 224
+    if os.path.exists(args.config):
+        import json
+        with open(args.config, "r") as f:
+            image_size = json.load(f).get("image_size", 224)
+
+    export_onnx(model, args.output, image_size=image_size, opset=args.opset)
+
+    try:
+        max_diff = verify_onnx(model, args.output, image_size=image_size)
+    except ImportError:
+        print("⚠ onnxruntime not installed, skipping the parity check")
+        return
+
+    print(f"  ONNX Runtime vs PyTorch max logit diff: {max_diff:.2e}")
+    if max_diff > args.tolerance:
+        print(f"❌ Exceeds tolerance of {args.tolerance}")
+        sys.exit(1)
+
+    print("✅ Export verified")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Multi-frame inputs: animated GIF / WebP and short videos
+Samples a few frames, decodes only those at model size and aggregates
+the per-frame scores
+"""
+import io
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from image_io import ImageRejected, check_size, input_limits, open_validated, reduce_image
+
+# Values for config.json "frame_sampling"
+FRAME_SAMPLING = ["uniform", "scene"]
+
+# Side of the RGB thumbnails compared to find scene changes (colour, so
+# cuts between scenes of similar brightness still register)
+_SIGNATURE_SIZE = 16
+# Mean absolute thumbnail change (0-255) that counts as a cut
+_SCENE_CHANGE_THRESHOLD = 12.0
+
+
+def video_format(data: bytes) -> Optional[str]:
+    """Container of a video upload from its magic bytes, or None if it is not a video"""
+    if data[4:8] == b"ftyp":
+        return "MP4"  # also MOV / 3GP
+    if data[:4] == b"\x1a\x45\xdf\xa3":
+        return "WEBM"  # also MKV
+    return None
+
+
+def uniform_indices(total: int, count: int) -> List[int]:
+    """`count` frame indices spread evenly over `total`, each centred in its span"""
+    if count >= total:
+        return list(range(total))
+    return [int((i + 0.5) * total / count) for i in range(count)]
+
+
+def scene_change_indices(signatures: Sequence[np.ndarray], count: int) -> List[int]:
+    """
+    Frame indices at the largest scene changes.
+
+    The first frame always opens a scene; the other picks are the frames
+    that differ most from their predecessor, as long as the change passes
+    the cut threshold. Inputs with fewer cuts are topped up with uniformly
+    spaced frames.
+
+    Args:
+        signatures: Small RGB thumbnail per frame
+        count: Number of frames to pick
+
+    Returns:
+        Sorted frame indices
+    """
+    total = len(signatures)
+    if count >= total:
+        return list(range(total))
+
+    changes = {
+        i: float(np.abs(signatures[i] - signatures[i - 1]).mean()) for i in range(1, total)
+    }
+    cuts = sorted(changes, key=changes.get, reverse=True)[:count - 1]
+    picked = {0} | {i for i in cuts if changes[i] >= _SCENE_CHANGE_THRESHOLD}
+
+    for i in uniform_indices(total, count) + list(range(total)):
+        if len(picked) == count:
+            break
+        picked.add(i)
+
+    return sorted(picked)
+
+
+def _signature(image: Image.Image) -> np.ndarray:
+    """RGB thumbnail used to compare frames"""
+    thumbnail = image.convert("RGB").resize((_SIGNATURE_SIZE, _SIGNATURE_SIZE), Image.BOX)
+    return np.asarray(thumbnail, dtype=np.float32)
+
+
+class _AnimatedImage:
+    """Frames of a (possibly single-frame) image, read by seeking"""
+
+    def __init__(self, image: Image.Image, target_size: Optional[int]):
+        self.image = image
+        if target_size:
+            # JPEG DCT scaling, as in decode_image; no-op for animated formats
+            image.draft("RGB", (target_size, target_size))
+
+    def frame_count(self) -> int:
+        return getattr(self.image, "n_frames", 1)
+
+    def signatures(self) -> List[np.ndarray]:
+        signatures = []
+        for index in range(self.frame_count()):
+            self.image.seek(index)
+            signatures.append(_signature(self.image))
+        return signatures
+
+    def frames(self, indices: Sequence[int]) -> Iterator[Image.Image]:
+        for index in indices:
+            self.image.seek(index)
+            yield self.image
+
+
+class _Video:
+    """Frames of a video container, decoded with PyAV (optional dependency)"""
+
+    def __init__(self, data: bytes, limits: Dict[str, Any]):
+        try:
+            import av
+        except ImportError as e:
+            raise ImageRejected("Video input needs PyAV (pip install av)", status_code=415) from e
+
+        self.data = data
+        self.max_frames = limits["max_frames"]
+
+        # Header only: stream geometry and the frame count, if the container records it
+        try:
+            with av.open(io.BytesIO(data)) as container:
+                stream = container.streams.video[0]
+                width, height = stream.codec_context.width, stream.codec_context.height
+                self.total = stream.frames or None
+        except Exception as e:
+            raise ImageRejected("Not a recognized video file") from e
+
+        if width * height > limits["max_pixels"]:
+            raise ImageRejected(
+                f"Video is {width}x{height} ({width * height / 1e6:.0f} MP), "
+                f"limit is {limits['max_pixels'] / 1e6:.0f} MP"
+            )
+        if self.total and self.total > self.max_frames:
+            raise ImageRejected(f"Video has {self.total} frames, limit is {self.max_frames}")
+
+    def _decode(self) -> Iterator["av.VideoFrame"]:
+        import av
+
+        with av.open(io.BytesIO(self.data)) as container:
+            stream = container.streams.video[0]
+            stream.thread_type = "AUTO"
+            for index, frame in enumerate(container.decode(stream)):
+                if index >= self.max_frames:
+                    raise ImageRejected(f"Video has more than {self.max_frames} frames")
+                yield frame
+
+    def frame_count(self) -> int:
+        if self.total is None:
+            self.total = sum(1 for _ in self._decode())
+        return self.total
+
+    def signatures(self) -> List[np.ndarray]:
+        signatures = [
+            frame.reformat(width=_SIGNATURE_SIZE, height=_SIGNATURE_SIZE, format="rgb24")
+            .to_ndarray().astype(np.float32)
+            for frame in self._decode()
+        ]
+        self.total = len(signatures)
+        return signatures
+
+    def frames(self, indices: Sequence[int]) -> Iterator[Image.Image]:
+        # Inter-frame codecs decode sequentially; only the picked frames are converted
+        wanted = set(indices)
+        last = max(indices)
+        for index, frame in enumerate(self._decode()):
+            if index in wanted:
+                yield frame.to_image()
+            if index >= last:
+                break
+
+
+def open_frames(data: bytes, limits: Optional[Dict[str, Any]] = None,
+                target_size: Optional[int] = None) -> Union[_AnimatedImage, _Video]:
+    """
+    Check an animated image or video against the limits from its header.
+
+    Images go through open_validated; videos must be one of
+    "video_formats" and pass the pixel and frame limits.
+
+    Raises:
+        ImageRejected: If any check fails
+    """
+    limits = limits if limits is not None else input_limits()
+    check_size(len(data), limits)
+
+    container = video_format(data)
+    if container is None:
+        return _AnimatedImage(open_validated(data, limits), target_size)
+
+    if container not in limits.get("video_formats", []):
+        raise ImageRejected(
+            f"Unsupported video format {container}, expected one of {limits.get('video_formats', [])}"
+        )
+    return _Video(data, limits)
+
+
+def decode_frames(
+    data: bytes,
+    count: int = 8,
+    sampling: str = "uniform",
+    target_size: Optional[int] = None,
+    as_tensor: bool = False,
+    limits: Optional[Dict[str, Any]] = None
+) -> Tuple[List[Union[Image.Image, "torch.Tensor"]], List[int], int]:
+    """
+    Sample `count` frames of an animated image or short video and decode
+    only those, at the reduced size decode_image would use.
+
+    "uniform" spreads the frames evenly over the input. "scene" compares
+    small thumbnails of every frame and takes the frames that open a new
+    scene. Still images yield their single frame.
+
+    Args:
+        data: Encoded GIF, WebP, still image or video (MP4 / WebM)
+        count: Frames to sample
+        sampling: "uniform" or "scene"
+        target_size: Model input size, or None for a full-resolution decode
+        as_tensor: Return uint8 CHW tensors instead of PIL images
+        limits: Checked from the header before decoding (defaults to DEFAULT_INPUT_LIMITS)
+
+    Returns:
+        (frames, indices, total): the decoded frames, their positions and
+        the number of frames in the input
+
+    Raises:
+        ImageRejected: If the input fails the limits
+    """
+    if sampling not in FRAME_SAMPLING:
+        raise ValueError(f"Unknown frame sampling '{sampling}', expected one of {FRAME_SAMPLING}")
+    if count < 1:
+        raise ValueError("Frame count must be at least 1")
+
+    source = open_frames(data, limits, target_size)
+
+    if sampling == "scene":
+        indices = scene_change_indices(source.signatures(), count)
+    else:
+        indices = uniform_indices(source.frame_count(), count)
+
+    if not indices:
+        raise ImageRejected("Input has no frames")
+
+    frames = [reduce_image(frame, target_size, as_tensor) for frame in source.frames(indices)]
+    return frames, indices, source.frame_count()
+
+
+def aggregate_predictions(frame_predictions: Sequence[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Mean score per label over the frames, highest first
+
+    Args:
+        frame_predictions: One prediction list per frame (as returned by the engine)
+
+    Returns:
+        Prediction list in the same format
+    """
+    totals: Dict[str, float] = {}
+    for predictions in frame_predictions:
+        for prediction in predictions:
+            totals[prediction["label"]] = totals.get(prediction["label"], 0.0) + prediction["score"]
+
+    count = max(len(frame_predictions), 1)
+    results = [{"label": label, "score": total / count} for label, total in totals.items()]
+    results.sort(key=lambda x: x["score"], reverse=True)
+    return results
@@ -1,18 +1,27 @@
-from typing import Dict, List, Any
-import torch
-import timm
-from PIL import Image
-from torchvision import transforms
-import io
+from concurrent.futures import Future
+from typing import Dict, List, Any, Optional
 import base64
 import json
 import os
 
+from batching import StageTimer, engine_pipeline
+from image_io import check_encoded_size, decode_image, input_limits, reduce_image
+from near_duplicates import NearDuplicateIndex, dhash
+from prediction_cache import PredictionCache, SingleFlight, content_hash, model_version
+from provenance import ProvenanceCheck
+
 
 class EndpointHandler:
     """
     Custom handler for AI vs Real Image Detection using EfficientFormerV2
     Handles checkpoints with 'module.' prefix from DataParallel/DDP training
+    
+    Serving backends (config.json "backend"):
+        "torch": eager PyTorch from pytorch_model.bin (default)
+        "onnx":  ONNX Runtime from "onnx_path" (no torch/timm/torchvision needed)
+        "onnx-int8": ONNX Runtime from "int8_onnx_path" (see quantize_model.py)
+        "auto":  benchmark the above at startup and keep the fastest one
+                 that matches fp32 (see autotune.py)
     """
     
     def __init__(self, path: str = ""):
@@ -21,9 +30,6 @@ class EndpointHandler:
         Args:
             path: Path to the model directory
         """
-        # Set device
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        
         # Load config if available
         config_path = os.path.join(path, "config.json") if path else "config.json"
         self.config = {}
@@ -40,6 +46,98 @@ class EndpointHandler:
                 "idx_to_class": {"0": "ai", "1": "real"}
             }
         
+        # Largest batch served: the frames of one animation and the tiles of
+        # one image are queued together, so they must fit in one forward pass
+        self.max_batch_size = max(
+            self.config.get("max_batch_size", 16),
+            self.config.get("frame_count", 8),
+            self.config.get("max_tiles", 16),
+        )
+        
+        # Pick the serving backend
+        self.backend = self.config.get("backend", "torch")
+        self.autotune = None
+        if self.backend in ("onnx", "onnx-int8"):
+            self._init_onnx_backend(path)
+        elif self.backend == "auto":
+            self._init_autotuned_backend(path)
+        else:
+            self._init_torch_backend(path)
+        
+        # Opt-in: decode large JPEGs at reduced size ("fast_decode"), never below the input size
+        self.decode_size = self.config.get("image_size", 224) if self.config.get("fast_decode", False) else None
+        # "preprocessing": "tensor" decodes straight to uint8 tensors (torch backends only)
+        self.decode_tensors = getattr(self.engine, "tensor_preprocessing", False)
+        # Byte/pixel/frame limits checked before base64 decoding and from the image header
+        self.input_limits = input_limits(self.config)
+        # Opt-in metadata fast path: generator tags decide without the model
+        self.provenance = ProvenanceCheck(self.config, self.idx_to_class.values())
+        # Repeat uploads answered from the content-hash cache ("prediction_cache"),
+        # keyed by the weights' hash so a new checkpoint starts cold
+        self.cache = PredictionCache.from_config(self.config, model_version(self.config, self.weights_path))
+        # Identical uploads arriving while the first is still in the model
+        # share its result ("single_flight")
+        self.inflight = SingleFlight() if self.config.get("single_flight", True) else None
+        # Opt-in reuse of predictions for re-encoded copies, by perceptual hash ("near_duplicates")
+        self.near_duplicates = NearDuplicateIndex.from_config(self.config, self.idx_to_class.values())
+        
+        # Forward and postprocess run on their own threads, so concurrent
+        # requests decode while the previous one is in the model. Nothing
+        # waits for companions: frames and tiles arrive together through
+        # submit_many, and requests that overlap share a batch anyway
+        self.decode_timer = StageTimer()
+        self.pipeline = engine_pipeline(self.engine, max_batch_size=self.max_batch_size, max_wait_ms=0)
+        
+        print(f"✓ Handler initialized on {self.device} ({self.backend} backend)")
+        print(f"  Class mapping: {self.idx_to_class}")
+    
+    def _init_torch_backend(self, path: str):
+        """
+        Load pytorch_model.bin and build the PyTorch inference engine
+        Args:
+            path: Path to the model directory
+        """
+        from inference_engine import InferenceEngine
+        from model_utils import create_preprocessing_transform
+        
+        self._load_torch_model(path)
+        
+        # Define image transformation (uint8 output when "fold_preprocessing" is enabled)
+        self.transform = create_preprocessing_transform(self.config)
+        
+        # Forward passes at the configured precision ("inference_dtype"),
+        # warmed up here (and compiled when "compile" is enabled)
+        self.engine = InferenceEngine(
+            self.model, self.device, self.idx_to_class, self.config, max_batch_size=self.max_batch_size
+        )
+    
+    def _init_autotuned_backend(self, path: str):
+        """
+        Load pytorch_model.bin, then benchmark the serving backends on this
+        machine and keep the fastest one within "autotune_tolerance" of fp32
+        Args:
+            path: Path to the model directory
+        """
+        from autotune import autotune
+        
+        self._load_torch_model(path)
+        self.engine, self.transform, self.autotune = autotune(
+            self.model, self.device, self.idx_to_class, self.config,
+            repo_path=path, max_batch_size=self.max_batch_size
+        )
+    
+    def _load_torch_model(self, path: str):
+        """
+        Build the architecture and load pytorch_model.bin into it
+        Args:
+            path: Path to the model directory
+        """
+        import torch
+        import timm
+        
+        # Set device
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        
         # Create model architecture
         self.model = timm.create_model(
             self.config.get("architecture", "efficientformerv2_s1"),
@@ -52,6 +150,7 @@ class EndpointHandler:
         # Load checkpoint from path
         try:
             checkpoint_path = os.path.join(path, "pytorch_model.bin") if path else "pytorch_model.bin"
+            self.weights_path = checkpoint_path
             checkpoint = torch.load(checkpoint_path, map_location=self.device, weights_only=False)
             
             # Handle different checkpoint formats
@@ -109,29 +208,64 @@ class EndpointHandler:
         # Move model to device and set to eval mode
         self.model.to(self.device)
         self.model.eval()
+    
+    def _init_onnx_backend(self, path: str):
+        """
+        Load the exported ONNX graph (see export_onnx.py) or its INT8
+        version (see quantize_model.py) into ONNX Runtime
+        Args:
+            path: Path to the model directory
+        """
+        from onnx_engine import OnnxEngine
         
-        # Define image transformation
-        img_size = self.config.get("image_size", 224)
-        mean = self.config.get("mean", [0.485, 0.456, 0.406])
-        std = self.config.get("std", [0.229, 0.224, 0.225])
+        self.idx_to_class = self.config.get("idx_to_class", {0: "ai", 1: "real"})
+        self.idx_to_class = {int(k): v for k, v in self.idx_to_class.items()}
         
-        self.transform = transforms.Compose([
-            transforms.Resize((img_size, img_size)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=mean, std=std),
-        ])
+        if self.backend == "onnx-int8":
+            onnx_file = self.config.get("int8_onnx_path", "model.int8.onnx")
+        else:
+            onnx_file = self.config.get("onnx_path", "model.onnx")
+        onnx_path = os.path.join(path, onnx_file) if path else onnx_file
+        self.weights_path = onnx_path
         
-        print(f"✓ Handler initialized on {self.device}")
-        print(f"  Class mapping: {self.idx_to_class}")
+        self.model = None
+        self.engine = OnnxEngine(onnx_path, self.idx_to_class, self.config, max_batch_size=self.max_batch_size)
+        self.device = self.engine.device
+        self.transform = self.engine.preprocess
+    
+    def health_check(self) -> Dict[str, Any]:
+        """
+        Report readiness and the active serving backend
+        Returns:
+            Status dict with "ready" (every serving batch size warmed up), the
+            warmup timings and the autotuner's timing table when "backend" is "auto"
+        """
+        return {
+            "status": "healthy" if self.engine.ready else "warming_up",
+            "device": str(self.device),
+            **self.engine.describe(),
+            "autotune": self.autotune,
+            "provenance": self.provenance.stats(),
+            "prediction_cache": self.cache.stats() if self.cache is not None else {"enabled": False},
+            "single_flight": self.inflight.stats() if self.inflight is not None else {"enabled": False},
+            "near_duplicates": self.near_duplicates.stats() if self.near_duplicates is not None else {"enabled": False},
+            "pipeline": {**self.pipeline.stats()["stages"], "decode": self.decode_timer.stats()},
+        }
     
-    def __call__(self, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def __call__(self, data: Dict[str, Any]) -> Any:
         """
         Handle inference request
         Args:
             data: Dictionary containing input data
-                  Expected format: {"inputs": "<base64_image>" or PIL Image}
+                  Expected format: {"inputs": <image bytes>, "<base64_image>" or PIL Image}
+                  Add {"parameters": {"num_frames": 8, "sampling": "scene"}} to score
+                  an animated GIF / WebP or short video frame by frame, or
+                  {"parameters": {"tiles": true}} to score a large image tile by tile
         Returns:
-            List of predictions with labels and scores
+            List of predictions with labels and scores ("cached": True when
+            the same bytes, or with "match_distance" a near-duplicate, were
+            scored before), or for frame / tile mode a dict with per-view
+            predictions and their mean ("aggregate")
         """
         try:
             # Extract input
@@ -140,49 +274,174 @@ class EndpointHandler:
             if inputs is None:
                 return [{"error": "No 'inputs' key found in request"}]
             
-            # Handle different input formats
-            if isinstance(inputs, str):
-                # Base64 encoded image
-                if inputs.startswith("data:image"):
-                    # Remove data URL prefix
-                    inputs = inputs.split(",")[1]
-                image_bytes = base64.b64decode(inputs)
-                image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-            elif isinstance(inputs, dict) and "image" in inputs:
-                # Handle {"image": "<base64>"} format
-                image_str = inputs["image"]
-                if image_str.startswith("data:image"):
-                    image_str = image_str.split(",")[1]
-                image_bytes = base64.b64decode(image_str)
-                image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-            elif hasattr(inputs, 'read'):
-                # File-like object
-                image = Image.open(inputs).convert("RGB")
-            else:
-                # Assume it's already a PIL Image
-                image = inputs.convert("RGB")
-            
-            # Transform image
-            tensor = self.transform(image).unsqueeze(0).to(self.device)
-            
-            # Run inference
-            with torch.no_grad():
-                logits = self.model(tensor)
-                probs = torch.softmax(logits, dim=1).cpu().squeeze(0)
+            parameters = data.get("parameters") or {}
+            if "num_frames" in parameters or "sampling" in parameters:
+                return self._predict_frames(inputs, parameters)
+            if parameters.get("tiles"):
+                return self._predict_tiles(inputs, parameters)
             
-            # Prepare response with proper label mapping
-            results = []
-            for idx, prob in enumerate(probs.tolist()):
-                label = self.idx_to_class.get(idx, f"class_{idx}")
-                results.append({
-                    "label": label.upper(),  # Return "AI" or "REAL"
-                    "score": prob
-                })
+            if hasattr(inputs, "convert"):
+                return self._infer(inputs, None).result()
             
-            # Sort by score (highest first)
-            results.sort(key=lambda x: x["score"], reverse=True)
-            
-            return results
+            # Repeat uploads ("prediction_cache") and generator tags in the
+            # header ("provenance") answer without decoding; copies of an
+            # upload already in the model share its result ("single_flight")
+            inputs = self._input_bytes(inputs)
+            digest = content_hash(inputs) if self.cache is not None or self.inflight is not None else None
+            known = self.cache.get(digest) if self.cache is not None else None
+            if known is None:
+                known = self.provenance(inputs)
+            if known is not None:
+                return known
             
+            if self.inflight is not None:
+                return self.inflight.run(digest, lambda: self._infer(inputs, digest)).result()
+            return self._infer(inputs, digest).result()
+
         except Exception as e:
-            return [{"error": f"Inference failed: {str(e)}"}]
\ No newline at end of file
+            return [{"error": f"Inference failed: {str(e)}"}]
+
+    def _infer(self, inputs: Any, digest: Optional[str]) -> Future:
+        """
+        Decode and transform here; the pipeline runs forward + postprocess
+        (labels are returned as "AI" / "REAL", highest score first).
+        Re-encoded copies of an image scored before are matched by
+        perceptual hash ("near_duplicates") and skip the model.
+        Args:
+            inputs: PIL image or encoded image bytes
+            digest: Content hash to cache the result under, or None
+        Returns:
+            Future for the prediction list
+        """
+        with self.decode_timer:
+            image = self._decode_inputs(inputs)
+        
+        phash = dhash(image) if self.near_duplicates is not None else 0
+        known = self.near_duplicates.lookup(phash) if phash else None
+        if known is not None:
+            future = Future()
+            future.set_result(known)
+            return future
+        
+        with self.decode_timer:
+            tensor = self.transform(image)
+        future = self.pipeline.submit_async(tensor)
+        if digest and self.cache is not None:
+            self.cache.put_when_done(digest, future)
+        if phash:
+            self.near_duplicates.add_when_done(phash, future)
+        return future
+    
+    def _predict_frames(self, inputs: Any, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Sample frames of an animated image or video and score them together
+        (a PIL image is scored as its current frame)
+        Args:
+            inputs: Raw bytes, base64 string, {"image": base64}, file-like object or PIL Image
+            parameters: "num_frames" and "sampling" (defaults from config.json)
+        Returns:
+            Per-frame predictions, their mean, the input's frame count and the sampling used
+        """
+        from frames import FRAME_SAMPLING, aggregate_predictions, decode_frames
+
+        sampling = parameters.get("sampling") or self.config.get("frame_sampling", "uniform")
+        with self.decode_timer:
+            if hasattr(inputs, "convert"):
+                if sampling not in FRAME_SAMPLING:
+                    raise ValueError(f"Unknown frame sampling '{sampling}', expected one of {FRAME_SAMPLING}")
+                frames, indices, total = [reduce_image(inputs, self.decode_size, self.decode_tensors)], [0], 1
+            else:
+                frames, indices, total = decode_frames(
+                    self._input_bytes(inputs),
+                    parameters.get("num_frames") or self.config.get("frame_count", 8),
+                    sampling, self.decode_size, as_tensor=self.decode_tensors, limits=self.input_limits
+                )
+            tensors = [self.transform(frame) for frame in frames]
+
+        predictions = [future.result() for future in self.pipeline.submit_many(tensors)]
+        return {
+            "frames": [
+                {"index": index, "predictions": frame_predictions}
+                for index, frame_predictions in zip(indices, predictions)
+            ],
+            "aggregate": aggregate_predictions(predictions),
+            "frame_count": total,
+            "sampling": sampling,
+        }
+
+    def _predict_tiles(self, inputs: Any, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Score a high-resolution image as a grid of full-resolution tiles
+        Args:
+            inputs: Raw bytes, base64 string, {"image": base64}, file-like object or PIL Image
+            parameters: "max_tiles" and "global_view" (defaults from config.json)
+        Returns:
+            Per-tile predictions, the AI-score heatmap and the mean over all views
+        """
+        from tiling import score_tiles, tile_limit
+
+        limit = tile_limit(self.engine, self.config)
+        global_view = parameters.get("global_view", self.config.get("tile_global_view", True))
+        with self.decode_timer:
+            if hasattr(inputs, "convert"):
+                image = reduce_image(inputs, as_tensor=self.decode_tensors)
+            else:
+                image = decode_image(
+                    self._input_bytes(inputs), as_tensor=self.decode_tensors, limits=self.input_limits
+                )
+
+        return score_tiles(
+            image, self.transform,
+            lambda views: [future.result() for future in self.pipeline.submit_many(views)],
+            tile_size=self.config.get("image_size", 224),
+            max_tiles=min(parameters.get("max_tiles") or limit, limit, self.max_batch_size),
+            global_view=global_view,
+        )
+
+    def _input_bytes(self, inputs: Any) -> bytes:
+        """
+        Encoded bytes of any non-PIL "inputs" format
+        Args:
+            inputs: Raw image bytes, base64 string (optionally a data URL),
+                    {"image": base64} or file-like object
+        Returns:
+            Encoded image bytes
+        """
+        if isinstance(inputs, (bytes, bytearray, memoryview)):
+            # Raw image bytes (binary request body), no base64 round trip
+            return bytes(inputs)
+
+        if isinstance(inputs, dict) and "image" in inputs:
+            # Handle {"image": "<base64>"} format
+            inputs = inputs["image"]
+
+        if isinstance(inputs, str):
+            # Base64 encoded image
+            if inputs.startswith("data:"):
+                # Remove data URL prefix
+                inputs = inputs.split(",")[1]
+            check_encoded_size(inputs, self.input_limits)
+            return base64.b64decode(inputs)
+
+        if hasattr(inputs, 'read'):
+            # File-like object (read one byte past the limit at most)
+            return inputs.read(self.input_limits["max_bytes"] + 1)
+
+        raise ValueError(f"Unsupported input type: {type(inputs).__name__}")
+
+    def _decode_inputs(self, inputs: Any):
+        """
+        Decode any supported "inputs" format
+        Args:
+            inputs: Raw image bytes, base64 string (optionally a data URL),
+                    {"image": base64}, file-like object or PIL Image
+        Returns:
+            RGB PIL Image, or uint8 CHW tensor with "preprocessing": "tensor"
+        """
+        if hasattr(inputs, "convert"):
+            # Already a PIL Image
+            return inputs.convert("RGB")
+
+        return decode_image(
+            self._input_bytes(inputs), self.decode_size, as_tensor=self.decode_tensors, limits=self.input_limits
+        )
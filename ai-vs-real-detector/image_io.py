@@ -0,0 +1,197 @@
+"""
+Image decoding for the serving paths
+Validates uploads from their headers, then decodes them at the smallest
+size that still covers the model input
+"""
+import io
+import warnings
+from typing import Any, Dict, Optional, Union
+
+from PIL import Image
+
+# Defaults for config.json "input_limits"
+DEFAULT_INPUT_LIMITS = {
+    "max_bytes": 20 * 1024 * 1024,
+    "max_pixels": 50_000_000,
+    "max_frames": 500,
+    "formats": ["JPEG", "PNG", "WEBP", "GIF", "BMP"],
+    # Containers accepted by the multi-frame path (see frames.py)
+    "video_formats": ["MP4", "WEBM"],
+}
+
+
+class ImageRejected(ValueError):
+    """Input refused before decoding (too large, malformed or unsupported)"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def input_limits(config: Dict[str, Any] = None) -> Dict[str, Any]:
+    """DEFAULT_INPUT_LIMITS with any overrides from config.json "input_limits" applied"""
+    return {**DEFAULT_INPUT_LIMITS, **(config or {}).get("input_limits", {})}
+
+
+def check_encoded_size(encoded: str, limits: Dict[str, Any]):
+    """
+    Reject a base64 payload whose decoded size would exceed "max_bytes",
+    without decoding it.
+    """
+    # Every 4 base64 characters carry 3 bytes
+    check_size(len(encoded) * 3 // 4, limits)
+
+
+def check_size(size: int, limits: Dict[str, Any]):
+    """Reject an upload of `size` bytes if it exceeds "max_bytes" (413)"""
+    if size > limits["max_bytes"]:
+        raise ImageRejected(
+            f"Image is {size / 1024 / 1024:.1f} MB, limit is {limits['max_bytes'] / 1024 / 1024:.1f} MB",
+            status_code=413
+        )
+
+
+def open_validated(image_bytes: bytes, limits: Dict[str, Any]) -> Image.Image:
+    """
+    Open an image lazily and check it against the limits from its header.
+
+    Only the header is parsed (frame counting skips over frame data), so
+    oversized, malformed or unsupported inputs are refused before any
+    pixel is decoded.
+
+    Args:
+        image_bytes: Encoded image
+        limits: Dict with max_bytes, max_pixels, max_frames and formats
+
+    Returns:
+        The opened, not yet decoded, PIL image
+
+    Raises:
+        ImageRejected: If any check fails
+    """
+    check_size(len(image_bytes), limits)
+
+    try:
+        with warnings.catch_warnings():
+            # The pixel limit below is the real check
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            image = Image.open(io.BytesIO(image_bytes))
+    except Image.DecompressionBombError as e:
+        raise ImageRejected(str(e)) from e
+    except Exception as e:
+        raise ImageRejected("Not a recognized image file") from e
+
+    if image.format not in limits["formats"]:
+        raise ImageRejected(f"Unsupported image format {image.format}, expected one of {limits['formats']}")
+
+    width, height = image.size
+    if width * height > limits["max_pixels"]:
+        raise ImageRejected(
+            f"Image is {width}x{height} ({width * height / 1e6:.0f} MP), "
+            f"limit is {limits['max_pixels'] / 1e6:.0f} MP"
+        )
+
+    frames = getattr(image, "n_frames", 1)
+    if frames > limits["max_frames"]:
+        raise ImageRejected(f"Image has {frames} frames, limit is {limits['max_frames']}")
+
+    return image
+
+
+def decode_image(
+    image_bytes: bytes,
+    target_size: Optional[int] = None,
+    as_tensor: bool = False,
+    limits: Optional[Dict[str, Any]] = None
+) -> Union[Image.Image, "torch.Tensor"]:
+    """
+    Decode image bytes to RGB, shrinking early when possible.
+
+    With a target size, JPEGs are decoded with DCT scaling (`Image.draft`,
+    1/2, 1/4 or 1/8 scale) and any format is then box-reduced by an integer
+    factor (`Image.reduce`), in both cases keeping each side at least
+    `target_size` pixels. The transform's single resize does the rest, so
+    a 12 MP photo is never materialized at full resolution.
+
+    With `as_tensor`, the result is a uint8 [3, H, W] tensor for the
+    "preprocessing": "tensor" pipeline. Images that draft mode cannot shrink
+    are decoded by torchvision straight into the tensor.
+
+    Args:
+        image_bytes: Encoded image (JPEG, PNG, WebP, ...)
+        target_size: Model input size, or None for a full-resolution decode
+        as_tensor: Return a uint8 CHW tensor instead of a PIL image
+        limits: Checked from the header before decoding (see open_validated)
+
+    Returns:
+        RGB PIL image, or uint8 [3, H, W] tensor
+
+    Raises:
+        ImageRejected: If the header fails the limits
+    """
+    if limits is not None:
+        image = open_validated(image_bytes, limits)
+    else:
+        image = Image.open(io.BytesIO(image_bytes))
+
+    if as_tensor:
+        can_shrink = target_size and image.format == "JPEG" and min(image.size) >= 2 * target_size
+        if not can_shrink:
+            tensor = _decode_with_torchvision(image_bytes)
+            if tensor is not None:
+                return tensor
+
+    if target_size:
+        # No-op for formats without a draft mode
+        image.draft("RGB", (target_size, target_size))
+
+    return reduce_image(image, target_size, as_tensor)
+
+
+def reduce_image(
+    image: Image.Image,
+    target_size: Optional[int] = None,
+    as_tensor: bool = False
+) -> Union[Image.Image, "torch.Tensor"]:
+    """
+    Convert a decoded image (or animation frame) to RGB and box-reduce it
+    by the largest integer factor that keeps each side at least
+    `target_size` pixels.
+
+    Args:
+        image: Opened PIL image, positioned on the frame to use
+        target_size: Model input size, or None to keep full resolution
+        as_tensor: Return a uint8 CHW tensor instead of a PIL image
+
+    Returns:
+        RGB PIL image, or uint8 [3, H, W] tensor
+    """
+    image = image.convert("RGB")
+
+    if target_size:
+        factor = min(image.width, image.height) // target_size
+        if factor >= 2:
+            image = image.reduce(factor)
+
+    if as_tensor:
+        import numpy as np
+        import torch
+
+        # HWC -> CHW as a view; the engine's input buffer absorbs the layout
+        return torch.from_numpy(np.array(image)).permute(2, 0, 1)
+
+    return image
+
+
+def _decode_with_torchvision(image_bytes: bytes) -> Optional["torch.Tensor"]:
+    """uint8 RGB tensor from torchvision's decoders, or None if the format is not supported"""
+    import torch
+    from torchvision.io import ImageReadMode, decode_image as tv_decode_image
+
+    data = torch.frombuffer(bytearray(image_bytes), dtype=torch.uint8)
+    try:
+        tensor = tv_decode_image(data, mode=ImageReadMode.RGB)
+    except RuntimeError:
+        return None
+    # Animated GIFs decode to [N, 3, H, W]; single-image scoring uses the first frame, like PIL
+    return tensor[0] if tensor.ndim == 4 else tensor
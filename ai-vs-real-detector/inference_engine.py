@@ -0,0 +1,390 @@
+"""
+Shared inference engine for the Modal app and the endpoint handler
+Runs batched forward passes at the precision configured in config.json
+"""
+import queue
+import time
+
+import torch
+import torch.nn as nn
+from typing import Dict, List, Any, Sequence, Tuple
+
+from batching import serving_batch_sizes
+from model_utils import prepare_inference_model
+
+
+# Accepted values for "inference_dtype" in config.json
+INFERENCE_DTYPES = {
+    "fp32": torch.float32,
+    "fp16": torch.float16,
+    "bf16": torch.bfloat16,
+}
+
+
+def resolve_inference_dtype(name: str, device: torch.device) -> torch.dtype:
+    """
+    Map an "inference_dtype" config value to a dtype the device runs well.
+
+    fp16 is meant for CUDA tensor cores; on CPU it falls back to bf16.
+    bf16 on a GPU without native support (e.g. T4) falls back to fp16.
+
+    Args:
+        name: One of "fp32", "fp16", "bf16"
+        device: Device the model will run on
+
+    Returns:
+        torch.dtype to cast weights and inputs to
+    """
+    name = (name or "fp32").lower()
+    if name not in INFERENCE_DTYPES:
+        raise ValueError(
+            f"Unknown inference_dtype '{name}', expected one of {sorted(INFERENCE_DTYPES)}"
+        )
+
+    dtype = INFERENCE_DTYPES[name]
+
+    if dtype == torch.float16 and device.type == "cpu":
+        print("⚠ fp16 is not efficient on CPU, using bf16 instead")
+        dtype = torch.bfloat16
+    elif dtype == torch.bfloat16 and device.type == "cuda" and not torch.cuda.is_bf16_supported():
+        print("⚠ bf16 is not supported on this GPU, using fp16 instead")
+        dtype = torch.float16
+
+    return dtype
+
+
+def parity_report(reference: torch.Tensor, candidate: torch.Tensor) -> Dict[str, float]:
+    """
+    Compare two [N, num_classes] probability tensors.
+
+    Args:
+        reference: Probabilities from the fp32 model
+        candidate: Probabilities from the model under test
+
+    Returns:
+        Dict with max/mean absolute difference and top-1 agreement
+    """
+    reference = reference.float().cpu()
+    candidate = candidate.float().cpu()
+    diff = (reference - candidate).abs()
+
+    return {
+        "max_abs_diff": diff.max().item(),
+        "mean_abs_diff": diff.mean().item(),
+        "top1_agreement": (reference.argmax(dim=1) == candidate.argmax(dim=1)).float().mean().item(),
+    }
+
+
+class InferenceEngine:
+    """
+    Batched inference around a loaded detector model.
+
+    Casts the model to the configured precision once, then scores stacked
+    NCHW batches with a single forward pass and a single device-to-host copy.
+    With "fold_preprocessing": true, Conv+BN pairs are fused and Normalize is
+    folded into the stem, so batches are raw 0-255 pixels (uint8 is fine).
+    With "preprocessing": "tensor" (and no folding) batches also arrive as
+    uint8 and are normalized on the device in one vectorized operation.
+    Every serving batch size is run once on synthetic input before the
+    engine is returned ("warmup": false skips this), so CUDA context setup,
+    cuDNN algorithm selection, allocator growth and (with "compile": true)
+    torch.compile all happen at load time instead of on a real request.
+
+    Inputs are copied into a small pool of preallocated host buffers sized
+    for the largest serving batch (pinned on CUDA, channels_last when
+    "channels_last" is set), then moved to the device with a non-blocking copy.
+
+    Usage:
+        engine = InferenceEngine(model, device, idx_to_class, config)
+        results = engine.predict_tensors([transform(image) for image in images])
+    """
+
+    def __init__(
+        self,
+        model: nn.Module,
+        device: torch.device,
+        idx_to_class: Dict[int, str],
+        config: Dict[str, Any] = None,
+        max_batch_size: int = None
+    ):
+        """
+        Args:
+            model: Detector with weights already loaded
+            device: Device to run on
+            idx_to_class: Class index to label mapping
+            config: Parsed config.json (reads "inference_dtype", "fold_preprocessing",
+                "preprocessing", "channels_last", "input_buffers", "compile",
+                "compile_mode", "warmup", "image_size", "mean", "std", "max_batch_size")
+            max_batch_size: Largest batch served (defaults to config "max_batch_size")
+        """
+        if config is None:
+            config = {}
+
+        self.device = device
+        self.idx_to_class = idx_to_class
+        self.dtype = resolve_inference_dtype(config.get("inference_dtype", "fp32"), device)
+
+        # Fold in fp32 before any precision cast
+        self.folded = config.get("fold_preprocessing", False)
+        if self.folded:
+            model = prepare_inference_model(model.to(device).float(), config)
+
+        # Cast weights once so activations stay in reduced precision end to end
+        self.model = model.to(device=device, dtype=self.dtype)
+        self.model.eval()
+
+        self.channels_last = config.get("channels_last", False)
+        self.memory_format = torch.channels_last if self.channels_last else torch.contiguous_format
+        if self.channels_last:
+            self.model = self.model.to(memory_format=torch.channels_last)
+
+        self.image_size = config.get("image_size", 224)
+        self.batch_sizes = serving_batch_sizes(max_batch_size or config.get("max_batch_size", 16))
+
+        # uint8 pixels in: the folded stem takes them as is, otherwise the
+        # batch is normalized after the (4x smaller) host-to-device copy
+        self.tensor_preprocessing = config.get("preprocessing", "pil") == "tensor"
+        self.normalize_on_device = self.tensor_preprocessing and not self.folded
+        if self.normalize_on_device:
+            self.mean = torch.tensor(config.get("mean", [0.485, 0.456, 0.406]), device=device).view(1, 3, 1, 1) * 255.0
+            self.std = torch.tensor(config.get("std", [0.229, 0.224, 0.225]), device=device).view(1, 3, 1, 1) * 255.0
+
+        # Reusable host input buffers; uint8 when the model takes raw pixels
+        self.input_dtype = torch.uint8 if self.folded or self.tensor_preprocessing else torch.float32
+        self._buffers: queue.Queue = queue.Queue()
+        for _ in range(config.get("input_buffers", 3)):
+            self._buffers.put(self._new_buffer())
+        self._pooled_ids = {id(buffer) for buffer in self._buffers.queue}
+        self.buffer_misses = 0
+
+        self.compiled = False
+        self.compile_seconds = None
+        self.warmup_timings: Dict[int, float] = {}
+
+        if config.get("compile", False):
+            self._compile(config.get("compile_mode", "default"))
+
+        # Compiling already warmed every batch size
+        if config.get("warmup", True) and not self.compiled:
+            self.warmup()
+
+        print(f"✓ Inference engine ready ({self.dtype_name} on {device})")
+        if self.warmup_timings:
+            print("  Warmup: " + ", ".join(
+                f"batch {size} {ms:.0f} ms" for size, ms in self.warmup_timings.items()
+            ))
+
+    @property
+    def dtype_name(self) -> str:
+        """Config-style name of the active precision"""
+        for name, dtype in INFERENCE_DTYPES.items():
+            if dtype == self.dtype:
+                return name
+        return str(self.dtype)
+
+    def describe(self) -> Dict[str, Any]:
+        """Serving settings reported by health checks"""
+        return {
+            "backend": "torch",
+            "ready": self.ready,
+            "warmup_ms": {size: round(ms, 1) for size, ms in self.warmup_timings.items()},
+            "inference_dtype": self.dtype_name,
+            "compiled": self.compiled,
+            "compile_seconds": self.compile_seconds,
+            "folded": self.folded,
+            "preprocessing": "tensor" if self.tensor_preprocessing else "pil",
+            "channels_last": self.channels_last,
+            "input_buffer_misses": self.buffer_misses,
+        }
+
+    def _new_buffer(self) -> torch.Tensor:
+        """Host tensor for the largest serving batch, pinned on CUDA for async copies"""
+        n, c, h, w = self.batch_sizes[-1], 3, self.image_size, self.image_size
+        if self.channels_last:
+            strides = (c * h * w, 1, w * c, c)
+        else:
+            strides = (c * h * w, h * w, w, 1)
+
+        buffer = torch.empty_strided(
+            (n, c, h, w), strides, dtype=self.input_dtype,
+            pin_memory=self.device.type == "cuda"
+        )
+        return buffer.zero_()
+
+    def _compile(self, mode: str):
+        """
+        Compile the model and trace every serving batch size up front.
+
+        Compilation happens here, at load time, so no request pays for it.
+        If the backend is unavailable the engine keeps running eagerly.
+        """
+        eager_model = self.model
+        start = time.perf_counter()
+
+        try:
+            self.model = torch.compile(eager_model, mode=mode, dynamic=False)
+            self.compiled = True
+            self.warmup()
+        except Exception as e:
+            print(f"⚠ torch.compile failed, falling back to eager mode: {e}")
+            self.model = eager_model
+            self.compiled = False
+            self.warmup_timings = {}
+            return
+
+        self.compile_seconds = time.perf_counter() - start
+        print(f"✓ Compiled model (mode={mode}) in {self.compile_seconds:.1f}s")
+
+    @property
+    def ready(self) -> bool:
+        """True once every serving batch size has been run (or compiled)"""
+        return len(self.warmup_timings) == len(self.batch_sizes)
+
+    def warmup(self):
+        """Run a synthetic batch at each serving batch size and record the timings (ms)"""
+        blank = torch.zeros(3, self.image_size, self.image_size, dtype=self.input_dtype)
+
+        for batch_size in self.batch_sizes:
+            # Through the serving path, so the pooled buffers are touched too
+            start = time.perf_counter()
+            self.forward_tensors([blank] * batch_size)
+            self.warmup_timings[batch_size] = (time.perf_counter() - start) * 1000.0
+
+    def forward(self, batch: torch.Tensor) -> torch.Tensor:
+        """
+        Run one forward pass and return fp32 probabilities on the CPU.
+
+        Args:
+            batch: Preprocessed [N, 3, H, W] tensor (uint8 pixels when folded)
+
+        Returns:
+            [N, num_classes] probability tensor
+        """
+        if self.compiled:
+            return self._forward_bucketed(batch)
+        return self._forward(batch)
+
+    def _forward_bucketed(self, batch: torch.Tensor) -> torch.Tensor:
+        """Pad (or split) the batch to serving sizes so the compiled graph is reused"""
+        n = batch.shape[0]
+        largest = self.batch_sizes[-1]
+
+        if n > largest:
+            return torch.cat([
+                self._forward_bucketed(batch[i:i + largest]) for i in range(0, n, largest)
+            ])
+
+        bucket = next(size for size in self.batch_sizes if size >= n)
+        if bucket > n:
+            padding = batch.new_zeros((bucket - n, *batch.shape[1:]))
+            batch = torch.cat([batch, padding])
+
+        return self._forward(batch)[:n]
+
+    def _forward(self, batch: torch.Tensor) -> torch.Tensor:
+        """Single forward pass + softmax with one device-to-host copy"""
+        # Non-blocking from pinned memory; the .cpu() below synchronizes
+        if self.normalize_on_device:
+            batch = batch.to(self.device, non_blocking=True, memory_format=self.memory_format)
+            batch = ((batch.float() - self.mean) / self.std).to(self.dtype)
+        else:
+            batch = batch.to(
+                self.device, dtype=self.dtype, non_blocking=True, memory_format=self.memory_format
+            )
+
+        with torch.no_grad():
+            logits = self.model(batch)
+            # Softmax in fp32 so reduced precision does not skew the scores
+            probs = torch.softmax(logits.float(), dim=1).cpu()
+
+        return probs
+
+    def format_predictions(self, probs: Sequence[float]) -> List[Dict[str, Any]]:
+        """Map class probabilities to labels, highest score first"""
+        results = []
+        for idx, prob in enumerate(probs):
+            label = self.idx_to_class.get(idx, f"class_{idx}")
+            results.append({
+                "label": label.upper(),
+                "score": prob
+            })
+
+        results.sort(key=lambda x: x["score"], reverse=True)
+        return results
+
+    def predict_tensors(self, tensors: List[torch.Tensor]) -> List[List[Dict[str, Any]]]:
+        """
+        Score preprocessed CHW tensors in a single batched forward pass.
+
+        Args:
+            tensors: List of [3, H, W] tensors
+
+        Returns:
+            List of prediction lists, one per input
+        """
+        return self.format_batch(self.forward_tensors(tensors))
+
+    def format_batch(self, probs: torch.Tensor) -> List[List[Dict[str, Any]]]:
+        """Prediction lists for an [N, num_classes] probability tensor"""
+        return [self.format_predictions(row) for row in probs.tolist()]
+
+    def forward_tensors(self, tensors: List[torch.Tensor]) -> torch.Tensor:
+        """
+        Copy CHW tensors into a pooled input buffer and run one forward pass.
+
+        Args:
+            tensors: List of [3, H, W] tensors
+
+        Returns:
+            [N, num_classes] probability tensor
+        """
+        n = len(tensors)
+        largest = self.batch_sizes[-1]
+
+        if n > largest:
+            return torch.cat([
+                self.forward_tensors(tensors[i:i + largest]) for i in range(0, n, largest)
+            ])
+
+        return self.run_batch(*self.load_batch(tensors))
+
+    def load_batch(self, tensors: List[torch.Tensor]) -> Tuple[torch.Tensor, int]:
+        """
+        Copy up to the largest serving batch of CHW tensors into an input buffer.
+
+        The buffer is handed back to the pool by run_batch, so a batch can be
+        loaded on one thread while the previous one runs on another.
+
+        Returns:
+            (buffer, number of filled rows)
+        """
+        n = len(tensors)
+        if n > self.batch_sizes[-1]:
+            raise ValueError(f"Batch of {n} exceeds the largest serving size {self.batch_sizes[-1]}")
+
+        try:
+            buffer = self._buffers.get_nowait()
+        except queue.Empty:
+            # Every pooled buffer is in flight: use a one-off allocation
+            buffer = self._new_buffer()
+            self.buffer_misses += 1
+
+        for i, tensor in enumerate(tensors):
+            buffer[i].copy_(tensor)
+        return buffer, n
+
+    def run_batch(self, buffer: torch.Tensor, n: int) -> torch.Tensor:
+        """
+        Score the first n rows of a buffer from load_batch and release it.
+
+        Returns:
+            [n, num_classes] probability tensor
+        """
+        # Compiled graphs only exist for serving sizes; spare rows are ignored
+        size = next(s for s in self.batch_sizes if s >= n) if self.compiled else n
+
+        try:
+            return self._forward(buffer[:size])[:n]
+        finally:
+            if id(buffer) in self._pooled_ids:
+                self._buffers.put(buffer)
@@ -3,7 +3,8 @@ Modal deployment for AI vs Real Image Detector
 Hosts the PyTorch model with T4 GPU support and provides REST API endpoints
 """
 import modal
-from typing import Dict, List, Any
+from concurrent.futures import Future
+from typing import Dict, List, Any, Optional, Union
 
 # Define the Modal app
 app = modal.App("ai-vs-real-detector")
@@ -11,6 +12,7 @@ app = modal.App("ai-vs-real-detector")
 # Create the container image with all dependencies
 image = (
     modal.Image.debian_slim(python_version="3.11")
+    .apt_install("build-essential")  # C/C++ toolchain for torch.compile ("compile": true)
     .pip_install(
         "torch>=2.0.0",
         "timm>=0.9.0", 
@@ -20,9 +22,24 @@ image = (
         "pydantic>=2.0.0",
         "huggingface_hub>=0.20.0",
         "python-multipart>=0.0.6",
+        "av>=12.0",  # video decoding for /predict/frames
+        "ijson>=3.2",  # incremental JSON parsing for /predict/batch
+        "orjson>=3.9",  # response serialization for the batch endpoints
+    )
+    .add_local_python_source(
+        "autotune", "batching", "export_onnx", "frames", "image_io", "inference_engine",
+        "model_utils", "near_duplicates", "onnx_engine", "prediction_cache", "provenance", "tiling"
     )
 )
 
+# Shared tier of the prediction cache ("prediction_cache"): one key-value
+# store read and written by every GPU container and by GET /predict/{sha256}
+prediction_store = modal.Dict.from_name("ai-detector-predictions", create_if_missing=True)
+
+# Concurrent inputs per container; single-image calls that land together
+# are grouped by the in-container micro-batching pipeline
+MAX_CONCURRENT_INPUTS = 32
+
 
 @app.cls(
     image=image,
@@ -30,6 +47,7 @@ image = (
     scaledown_window=300,  # Keep container warm for 5 minutes
     timeout=600,  # Max execution time
 )
+@modal.concurrent(max_inputs=MAX_CONCURRENT_INPUTS)
 class AIDetectorModel:
     """
     Modal class for AI vs Real Image Detection
@@ -45,8 +63,18 @@ class AIDetectorModel:
         import torch
         import timm
         import json
-        from torchvision import transforms
+        import os
+        from concurrent.futures import ThreadPoolExecutor
         from pathlib import Path
+        from autotune import autotune
+        from batching import StageTimer, engine_pipeline, plan_cpu_threads
+        from image_io import input_limits
+        from inference_engine import InferenceEngine
+        from model_utils import create_preprocessing_transform
+        from near_duplicates import NearDuplicateIndex
+        from prediction_cache import PredictionCache, SingleFlight, model_version
+        from provenance import ProvenanceCheck
+        from tiling import tile_limit
         
         print("🚀 Initializing AI Detector Model...")
         
@@ -79,6 +107,11 @@ class AIDetectorModel:
         # Set device
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         
+        # Split the CPUs between image decoding and torch so they don't compete
+        self.decode_workers, self.torch_threads = plan_cpu_threads(self.config, self.device.type)
+        torch.set_num_threads(self.torch_threads)
+        self.decode_pool = ThreadPoolExecutor(self.decode_workers, thread_name_prefix="decode")
+        
         # Create model architecture
         self.model = timm.create_model(
             self.config.get("architecture", "efficientformerv2_s1"),
@@ -121,92 +154,352 @@ class AIDetectorModel:
         self.model.to(self.device)
         self.model.eval()
         
-        # Setup transforms
-        img_size = self.config.get("image_size", 224)
-        mean = self.config.get("mean", [0.485, 0.456, 0.406])
-        std = self.config.get("std", [0.229, 0.224, 0.225])
+        self.autotune = None
+        if self.config.get("backend") == "auto":
+            # Benchmark fp32 / reduced precision / ONNX / INT8 / compiled on
+            # this GPU and keep the fastest one that matches fp32
+            self.engine, self.transform, self.autotune = autotune(
+                self.model, self.device, self.idx_to_class, self.config,
+                repo_path=os.path.dirname(os.path.abspath(config_path))
+            )
+        else:
+            # Setup transforms (uint8 output when "fold_preprocessing" is enabled)
+            self.transform = create_preprocessing_transform(self.config)
+            
+            # Batched forward passes at the configured precision ("inference_dtype"),
+            # warmed up on every serving batch size (and compiled when "compile"
+            # is enabled) so cold-start costs never land on a request
+            self.engine = InferenceEngine(self.model, self.device, self.idx_to_class, self.config)
+        
+        # Opt-in: decode large JPEGs at reduced size ("fast_decode"), never below the input size
+        self.decode_size = self.config.get("image_size", 224) if self.config.get("fast_decode", False) else None
+        # "preprocessing": "tensor" decodes straight to uint8 tensors (torch backends only)
+        self.decode_tensors = getattr(self.engine, "tensor_preprocessing", False)
+        # Byte/pixel/frame limits checked before base64 decoding and from the image header
+        self.input_limits = input_limits(self.config)
+        # Opt-in metadata fast path ("provenance"): generator tags decide without the model
+        self.provenance = ProvenanceCheck(self.config, self.idx_to_class.values())
+        # Repeat uploads answered from the content-hash cache ("prediction_cache"),
+        # keyed by the weights' hash so a new checkpoint starts cold; results
+        # are shared with the other containers through prediction_store
+        self.cache = PredictionCache.from_config(
+            self.config, model_version(self.config, model_path), shared=prediction_store
+        )
+        # Identical uploads arriving while the first is still in the model
+        # share its result ("single_flight")
+        self.inflight = SingleFlight() if self.config.get("single_flight", True) else None
+        # Opt-in reuse of predictions for re-encoded copies, by perceptual hash ("near_duplicates")
+        self.near_duplicates = NearDuplicateIndex.from_config(self.config, self.idx_to_class.values())
+        # Tiles per /predict/tiles request: "max_tiles", capped by "tile_budget_ms"
+        # and by the batch size so every tile shares one forward pass
+        self.max_tiles = min(tile_limit(self.engine, self.config), self.config.get("max_batch_size", 16))
         
-        self.transform = transforms.Compose([
-            transforms.Resize((img_size, img_size)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=mean, std=std),
-        ])
+        # Group concurrent requests into batches and run them through
+        # batch -> forward -> postprocess threads, so the next batch is
+        # loaded into a second input buffer while the current one runs
+        self.decode_timer = StageTimer(parallelism=self.decode_workers)
+        self.batcher = engine_pipeline(
+            self.engine,
+            max_batch_size=self.config.get("max_batch_size", 16),
+            max_wait_ms=self.config.get("batch_wait_ms", 10),
+            queue_depth=self.config.get("pipeline_queue_depth", 1),
+        )
         
         print(f"✅ Model loaded on {self.device}")
         print(f"   Classes: {self.idx_to_class}")
     
-    @modal.method()
-    def predict(self, image_data: str) -> List[Dict[str, Any]]:
+    @modal.exit()
+    def shutdown(self):
+        """Flush queued requests before the container stops"""
+        self.batcher.close()
+        self.decode_pool.shutdown()
+        if self.cache is not None:
+            self.cache.close()
+    
+    def _decode(self, image_data: Union[bytes, str]):
         """
-        Run inference on a single image
+        Decode an image at the reduced size the model needs
+        
+        Raw bytes go straight to the decoder; base64 strings are still
+        accepted for older callers. Oversized payloads are refused before
+        base64 decoding, and images that fail the "input_limits" header
+        checks before pixel decoding.
         
         Args:
-            image_data: Base64 encoded image string
+            image_data: Encoded image bytes, or a base64 string (optionally a data URL)
             
         Returns:
-            List of predictions with labels and scores
+            RGB PIL image, or uint8 CHW tensor with "preprocessing": "tensor"
         """
-        import torch
+        from image_io import decode_image
+        
+        image_bytes = self._image_bytes(image_data)
+        
+        with self.decode_timer:
+            return decode_image(
+                image_bytes, self.decode_size, as_tensor=self.decode_tensors, limits=self.input_limits
+            )
+    
+    def _image_bytes(self, image_data: Union[bytes, str]) -> bytes:
+        """Raw bytes as-is; base64 strings size-checked, then decoded"""
         import base64
-        import io
-        from PIL import Image
+        from image_io import check_encoded_size
+        
+        if not isinstance(image_data, str):
+            return image_data
+        
+        if image_data.startswith("data:"):
+            image_data = image_data.split(",")[1]
+        check_encoded_size(image_data, self.input_limits)
+        
+        with self.decode_timer:
+            return base64.b64decode(image_data)
+    
+    def _submit(self, image_data: Union[bytes, str]) -> Future:
+        """
+        Queue one image on the batching pipeline
+        
+        Images seen before (same bytes, same model) come from the
+        prediction cache, and generator tags in the header ("provenance"
+        rules) answer straight away; neither decodes the image or runs the
+        model. Copies of an image that is already being scored wait for
+        that result instead of queueing again. The shared cache tier is
+        read in _infer, so only the first copy pays for it.
+        
+        Returns:
+            Future for the image's prediction list
+        """
+        from prediction_cache import content_hash
+        
+        image_bytes = self._image_bytes(image_data)
+        
+        digest = content_hash(image_bytes) if self.cache is not None or self.inflight is not None else None
+        known = self.cache.get(digest, shared=False) if self.cache is not None else None
+        if known is None:
+            known = self.provenance(image_bytes)
+        if known is not None:
+            future = Future()
+            future.set_result(known)
+            return future
+        
+        if self.inflight is not None:
+            return self.inflight.run(digest, lambda: self._infer(image_bytes, digest))
+        return self._infer(image_bytes, digest)
+    
+    def _infer(self, image_bytes: bytes, digest: Optional[str]) -> Future:
+        """
+        Decode, queue for the model and cache the result once it is ready
+        
+        Re-encoded copies of an image scored before (resized, recompressed,
+        metadata stripped) are matched by perceptual hash ("near_duplicates")
+        after decoding and skip the model. The shared cache read runs while
+        the image decodes; if it has not answered by then (plus the cache's
+        shared_timeout_ms) it counts as a miss.
+        """
+        from near_duplicates import dhash
+        
+        shared = self.cache is not None and self.cache.shared is not None
+        pending = self.cache.fetch_shared(digest) if shared else None
+        image = self._decode(image_bytes)
+        
+        known = self.cache.shared_result(pending) if pending is not None else None
+        if known is not None:
+            future = Future()
+            future.set_result(known)
+            return future
+        
+        phash = dhash(image) if self.near_duplicates is not None else 0
+        known = self.near_duplicates.lookup(phash) if phash else None
+        if known is not None:
+            future = Future()
+            future.set_result(known)
+            return future
+        
+        with self.decode_timer:
+            tensor = self.transform(image)
+        future = self.batcher.submit_async(tensor)
+        if self.cache is not None:
+            self.cache.put_when_done(digest, future)
+        if phash:
+            self.near_duplicates.add_when_done(phash, future)
+        return future
+    
+    @modal.method()
+    def predict(self, image_data: Union[bytes, str]) -> List[Dict[str, Any]]:
+        """
+        Run inference on a single image
         
+        Concurrent calls are collected by the micro-batcher and scored
+        together, so each caller waits at most `batch_wait_ms` extra.
+        
+        Args:
+            image_data: Encoded image bytes (base64 strings still accepted)
+            
+        Returns:
+            List of predictions with labels and scores ("source": "metadata"
+            when a provenance rule answered without running the model,
+            "cached": True when it came from the prediction cache, plus
+            "match_distance" when it matched a near-duplicate)
+        """
         try:
-            # Decode base64 image
-            if image_data.startswith("data:image"):
-                image_data = image_data.split(",")[1]
+            return self._submit(image_data).result()
             
-            image_bytes = base64.b64decode(image_data)
-            image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+        except Exception as e:
+            return [{"error": f"Prediction failed: {str(e)}"}]
+    
+    @modal.method()
+    def predict_batch(self, images: List[Union[bytes, str]]) -> List[List[Dict[str, Any]]]:
+        """
+        Run inference on multiple images
+        
+        Images are decoded in parallel on the decode pool ("decode_workers")
+        and each one joins the batching pipeline as soon as it is decoded,
+        so decoding the rest overlaps with the forward pass. Images that fail
+        to decode get an error entry at their own position.
+        
+        Args:
+            images: List of encoded image bytes (base64 strings still accepted)
+            
+        Returns:
+            List of prediction results for each image
+        """
+        futures = [self.decode_pool.submit(self._submit, image_data) for image_data in images]
+        
+        results: List[List[Dict[str, Any]]] = []
+        for future in futures:
+            try:
+                results.append(future.result().result())
+            except Exception as e:
+                results.append([{"error": f"Prediction failed: {str(e)}"}])
+        
+        return results
+    
+    @modal.method()
+    def predict_frames(
+        self,
+        image_data: Union[bytes, str],
+        num_frames: int = None,
+        sampling: str = None
+    ) -> Dict[str, Any]:
+        """
+        Score an animated GIF / WebP or a short video frame by frame
+        
+        Only the sampled frames are decoded, and they are queued together so
+        the micro-batcher scores them in one forward pass (up to
+        `max_batch_size` frames).
+        
+        Args:
+            image_data: Encoded image or video bytes (base64 strings still accepted)
+            num_frames: Frames to sample (default config "frame_count")
+            sampling: "uniform" or "scene" (default config "frame_sampling")
             
-            # Transform and predict
-            tensor = self.transform(image).unsqueeze(0).to(self.device)
+        Returns:
+            Dict with per-frame predictions ("frames"), their mean ("aggregate"),
+            the input's frame count and the sampling used
+        """
+        from frames import aggregate_predictions, decode_frames
+        
+        num_frames = num_frames or self.config.get("frame_count", 8)
+        sampling = sampling or self.config.get("frame_sampling", "uniform")
+        
+        try:
+            image_bytes = self._image_bytes(image_data)
             
-            with torch.no_grad():
-                logits = self.model(tensor)
-                probs = torch.softmax(logits, dim=1).cpu().squeeze(0)
+            with self.decode_timer:
+                frames, indices, total = decode_frames(
+                    image_bytes, num_frames, sampling, self.decode_size,
+                    as_tensor=self.decode_tensors, limits=self.input_limits
+                )
+                tensors = [self.transform(frame) for frame in frames]
             
-            # Format results
-            results = []
-            for idx, prob in enumerate(probs.tolist()):
-                label = self.idx_to_class.get(idx, f"class_{idx}")
-                results.append({
-                    "label": label.upper(),
-                    "score": prob
-                })
+            predictions = [future.result() for future in self.batcher.submit_many(tensors)]
             
-            results.sort(key=lambda x: x["score"], reverse=True)
-            return results
+            return {
+                "frames": [
+                    {"index": index, "predictions": frame_predictions}
+                    for index, frame_predictions in zip(indices, predictions)
+                ],
+                "aggregate": aggregate_predictions(predictions),
+                "frame_count": total,
+                "sampling": sampling,
+            }
             
         except Exception as e:
-            return [{"error": f"Prediction failed: {str(e)}"}]
+            return {"error": f"Prediction failed: {str(e)}"}
     
     @modal.method()
-    def predict_batch(self, images: List[str]) -> List[List[Dict[str, Any]]]:
+    def predict_tiles(
+        self,
+        image_data: Union[bytes, str],
+        max_tiles: int = None,
+        global_view: bool = None
+    ) -> Dict[str, Any]:
         """
-        Run inference on multiple images
+        Score a high-resolution image as a grid of native-resolution tiles
+        
+        The image is decoded at full size and cut into image_size crops
+        (thinned to an even spread past the tile limit), plus an optional
+        downscaled global view. All views are queued together and scored in
+        one forward pass.
         
         Args:
-            images: List of base64 encoded image strings
+            image_data: Encoded image bytes (base64 strings still accepted)
+            max_tiles: Fewer views than the server limit (see load_model)
+            global_view: Also score the whole image (default config "tile_global_view")
             
         Returns:
-            List of prediction results for each image
+            Dict with per-tile predictions, the AI-score "heatmap" on the tile
+            grid, the global view's predictions and their mean ("aggregate")
         """
-        results = []
-        for image_data in images:
-            result = self.predict(image_data)
-            results.append(result)
-        return results
+        from image_io import decode_image
+        from tiling import score_tiles
+        
+        if global_view is None:
+            global_view = self.config.get("tile_global_view", True)
+        
+        try:
+            image_bytes = self._image_bytes(image_data)
+            
+            with self.decode_timer:
+                # Full resolution: the point is to keep the fine detail
+                image = decode_image(image_bytes, as_tensor=self.decode_tensors, limits=self.input_limits)
+            
+            return score_tiles(
+                image, self.transform,
+                lambda views: [future.result() for future in self.batcher.submit_many(views)],
+                tile_size=self.config.get("image_size", 224),
+                max_tiles=min(max_tiles or self.max_tiles, self.max_tiles),
+                global_view=global_view,
+            )
+            
+        except Exception as e:
+            return {"error": f"Prediction failed: {str(e)}"}
     
     @modal.method()
-    def health_check(self) -> Dict[str, str]:
-        """Health check endpoint"""
+    def health_check(self) -> Dict[str, Any]:
+        """
+        Health check endpoint
+        
+        "ready" turns true once every serving batch size has been warmed up
+        (see "warmup_ms"); load_model does this before the container takes traffic.
+        """
         import torch
         return {
-            "status": "healthy",
+            "status": "healthy" if self.engine.ready else "warming_up",
             "device": str(self.device),
             "cuda_available": torch.cuda.is_available(),
-            "model_loaded": self.model is not None
+            "model_loaded": self.model is not None,
+            **self.engine.describe(),
+            "autotune": self.autotune,
+            "max_tiles": self.max_tiles,
+            "provenance": self.provenance.stats(),
+            "prediction_cache": self.cache.stats() if self.cache is not None else {"enabled": False},
+            "single_flight": self.inflight.stats() if self.inflight is not None else {"enabled": False},
+            "near_duplicates": self.near_duplicates.stats() if self.near_duplicates is not None else {"enabled": False},
+            "decode_workers": self.decode_workers,
+            "torch_threads": self.torch_threads,
+            "batching": self.batcher.stats(),
+            "decode": self.decode_timer.stats()
         }
 
 
@@ -214,12 +507,27 @@ class AIDetectorModel:
 # FastAPI Web Endpoints (for Vercel/Supabase integration)
 # ============================================================================
 
-from fastapi import FastAPI, HTTPException, File, UploadFile
+import asyncio
+import base64
+
+from fastapi import FastAPI, HTTPException, File, Path, Query, Request, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
 web_app = FastAPI(title="AI vs Real Detector API")
 
+# Images per /predict/batch and /predict/batch/upload request
+MAX_BATCH_IMAGES = 10
+# Images per AIDetectorModel.predict_batch call from the batch endpoints
+BATCH_IN_FLIGHT = 4
+# predict_batch calls one batch request may have outstanding; with the
+# chunk being filled, at most (this + 1) * BATCH_IN_FLIGHT images are held
+BATCH_CHUNKS_IN_FLIGHT = 2
+# Frames sampled per /predict/frames request
+MAX_SAMPLED_FRAMES = 32
+# How long browsers and CDNs may reuse a GET /predict/{sha256} result
+LOOKUP_MAX_AGE_S = 86400
+
 # Enable CORS for Vercel integration
 web_app.add_middleware(
     CORSMiddleware,
@@ -241,6 +549,10 @@ class PredictionResponse(BaseModel):
     predictions: List[Dict[str, Any]]
     top_prediction: str
     confidence: float
+    source: str = "model"  # "metadata" when a provenance rule answered
+    evidence: Optional[Dict[str, Any]] = None
+    cached: bool = False  # answered from the prediction cache
+    match_distance: Optional[int] = None  # dHash distance of a near-duplicate match
 
 
 class BatchPredictionRequest(BaseModel):
@@ -248,6 +560,143 @@ class BatchPredictionRequest(BaseModel):
     images: List[str]  # List of base64 encoded images
 
 
+def _result_fields(top_pred: Dict[str, Any]) -> Dict[str, Any]:
+    """Who answered ("model" or "metadata"), the rule that decided, and whether (and how closely) it was cached"""
+    return {
+        "source": top_pred.get("source", "model"),
+        "evidence": top_pred.get("evidence"),
+        "cached": top_pred.get("cached", False),
+        "match_distance": top_pred.get("match_distance"),
+    }
+
+
+def _format_batch_results(results: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Shape AIDetectorModel.predict_batch output into per-image responses"""
+    formatted_results = []
+    for predictions in results:
+        if predictions and "error" in predictions[0]:
+            formatted_results.append({"error": predictions[0]["error"]})
+        else:
+            top_pred = predictions[0]
+            formatted_results.append({
+                "predictions": predictions,
+                "top_prediction": top_pred["label"],
+                "confidence": top_pred["score"],
+                **_result_fields(top_pred)
+            })
+    return formatted_results
+
+
+class _BodyReader:
+    """Async file-like view of a request body, one network chunk per read (for ijson)"""
+    
+    def __init__(self, request: Request):
+        self._chunks = request.stream()
+    
+    async def read(self, size: int = -1) -> bytes:
+        if size == 0:
+            # ijson probes with read(0) to tell bytes from text
+            return b""
+        # ijson takes b"" as end of input, so skip empty ASGI messages
+        async for chunk in self._chunks:
+            if chunk:
+                return chunk
+        return b""
+
+
+def _decode_base64(image_data: str) -> bytes:
+    """Bytes of a base64 image (optionally a data URL); ValueError when malformed"""
+    if image_data.startswith("data:image"):
+        image_data = image_data.split(",")[1]
+    return base64.b64decode(image_data)
+
+
+async def _predict_encoded(model, image_data: str) -> List[Dict[str, Any]]:
+    """Decode one base64 image here and send the model its raw bytes"""
+    try:
+        image_bytes = _decode_base64(image_data)
+    except ValueError as e:
+        return [{"error": f"Prediction failed: {str(e)}"}]
+    return await model.predict.remote.aio(image_bytes)
+
+
+class _ChunkedBatch:
+    """
+    Sends a batch request's images to AIDetectorModel.predict_batch in
+    chunks of BATCH_IN_FLIGHT as they are read, so the model container
+    decodes each chunk on its decode pool and scores it together, while
+    the web function holds a bounded number of images
+    """
+    
+    def __init__(self, model):
+        self.model = model
+        self.results: List[Optional[List[Dict[str, Any]]]] = []
+        self._chunk: List[tuple] = []
+        self._tasks: List[asyncio.Task] = []
+        self._slots = asyncio.Semaphore(BATCH_CHUNKS_IN_FLIGHT)
+    
+    def __len__(self) -> int:
+        return len(self.results)
+    
+    async def add(self, image_bytes: bytes):
+        """Queue an image; sends the chunk once it is full (waits for a free slot)"""
+        self.results.append(None)
+        self._chunk.append((len(self.results) - 1, image_bytes))
+        if len(self._chunk) == BATCH_IN_FLIGHT:
+            await self._send()
+    
+    def add_error(self, message: str):
+        """Record an image that failed before reaching the model, at its position"""
+        self.results.append([{"error": message}])
+    
+    async def finish(self) -> List[List[Dict[str, Any]]]:
+        """Send the last partial chunk and wait for every result, in input order"""
+        if self._chunk:
+            await self._send()
+        await asyncio.gather(*self._tasks)
+        return self.results
+    
+    async def cancel(self):
+        """Stop waiting on chunks already sent (the request was rejected)"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+    
+    async def _send(self):
+        chunk, self._chunk = self._chunk, []
+        await self._slots.acquire()
+        self._tasks.append(asyncio.ensure_future(self._score(chunk)))
+    
+    async def _score(self, chunk: List[tuple]):
+        try:
+            scored = await self.model.predict_batch.remote.aio([image_bytes for _, image_bytes in chunk])
+            for (index, _), predictions in zip(chunk, scored):
+                self.results[index] = predictions
+        finally:
+            self._slots.release()
+
+
+def _json_response(payload: Dict[str, Any]) -> Response:
+    """Serialize with orjson, skipping FastAPI's jsonable_encoder pass over every result"""
+    import orjson
+    return Response(content=orjson.dumps(payload), media_type="application/json")
+
+
+async def _read_body(request: Request, max_bytes: int) -> bytes:
+    """
+    Read a raw request body, stopping one byte past max_bytes
+    
+    Like UploadFile.read(max_bytes + 1): an oversized body is never held in
+    full, and open_validated turns the extra byte into a 413.
+    """
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_bytes:
+            break
+    return bytes(body)
+
+
 @web_app.get("/")
 async def root():
     """Root endpoint with API information"""
@@ -259,6 +708,11 @@ async def root():
             "POST /predict": "Single image prediction",
             "POST /predict/batch": "Batch image prediction",
             "POST /predict/upload": "Upload image file for prediction",
+            "POST /predict/raw": "Raw image bytes (application/octet-stream) for prediction",
+            "POST /predict/batch/upload": "Upload several image files for batch prediction",
+            "POST /predict/frames": "Per-frame and aggregate scores for a GIF, animated WebP or short video",
+            "POST /predict/tiles": "Tiled full-resolution scores with a heatmap for large images",
+            "GET /predict/{sha256}": "Stored prediction for an already-scored image, by SHA-256 of its bytes",
             "GET /health": "Health check"
         },
         "gpu": "NVIDIA T4",
@@ -282,6 +736,9 @@ async def predict(request: PredictionRequest):
     """
     Predict whether an image is AI-generated or real
     
+    Base64 JSON is kept for compatibility; /predict/raw takes the same image
+    as raw bytes, a third smaller on the wire.
+    
     Example request:
     ```json
     {
@@ -290,9 +747,15 @@ async def predict(request: PredictionRequest):
     }
     ```
     """
+    from image_io import DEFAULT_INPUT_LIMITS, ImageRejected, check_encoded_size
+    
     try:
+        # Refuse oversized payloads here, before a model container sees them
+        check_encoded_size(request.image, DEFAULT_INPUT_LIMITS)
+        
+        # Decoded here so the model gets raw bytes, as on every other path
         model = AIDetectorModel()
-        predictions = model.predict.remote(request.image)
+        predictions = await _predict_encoded(model, request.image)
         
         if predictions and "error" in predictions[0]:
             raise HTTPException(status_code=400, detail=predictions[0]["error"])
@@ -303,20 +766,41 @@ async def predict(request: PredictionRequest):
         response = {
             "predictions": predictions if request.return_all_scores else [top_pred],
             "top_prediction": top_pred["label"],
-            "confidence": top_pred["score"]
+            "confidence": top_pred["score"],
+            **_result_fields(top_pred)
         }
         
         return response
         
+    except ImageRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@web_app.post("/predict/batch")
-async def predict_batch(request: BatchPredictionRequest):
+@web_app.post(
+    "/predict/batch",
+    openapi_extra={"requestBody": {"content": {"application/json": {
+        "schema": BatchPredictionRequest.model_json_schema()
+    }}}},
+)
+async def predict_batch(request: Request):
     """
     Predict multiple images in a single request
     
+    Base64 JSON is kept for compatibility; /predict/batch/upload takes the
+    same images as multipart files.
+    
+    The body is parsed incrementally: each image is size-checked and
+    base64-decoded as soon as its string has been read, and every
+    BATCH_IN_FLIGHT images go to AIDetectorModel.predict_batch together.
+    At most BATCH_CHUNKS_IN_FLIGHT chunks are outstanding and parsing waits
+    for a free slot, so memory scales with that bound rather than with the
+    batch size, and the model starts on the first chunk before the last
+    image has arrived. Malformed base64 gets an error entry at its position.
+    
     Example request:
     ```json
     {
@@ -324,55 +808,71 @@ async def predict_batch(request: BatchPredictionRequest):
     }
     ```
     """
+    import ijson
+    from image_io import DEFAULT_INPUT_LIMITS, ImageRejected, check_encoded_size
+    
+    batch = None
     try:
-        if len(request.images) > 10:
-            raise HTTPException(
-                status_code=400, 
-                detail="Maximum 10 images per batch request"
-            )
+        batch = _ChunkedBatch(AIDetectorModel())
         
-        model = AIDetectorModel()
-        results = model.predict_batch.remote(request.images)
-        
-        # Format response
-        formatted_results = []
-        for predictions in results:
-            if predictions and "error" in predictions[0]:
-                formatted_results.append({"error": predictions[0]["error"]})
-            else:
-                top_pred = predictions[0]
-                formatted_results.append({
-                    "predictions": predictions,
-                    "top_prediction": top_pred["label"],
-                    "confidence": top_pred["score"]
-                })
-        
-        return {"results": formatted_results}
+        async for image_data in ijson.items(_BodyReader(request), "images.item"):
+            if len(batch) == MAX_BATCH_IMAGES:
+                raise HTTPException(
+                    status_code=400, 
+                    detail=f"Maximum {MAX_BATCH_IMAGES} images per batch request"
+                )
+            if not isinstance(image_data, str):
+                raise HTTPException(status_code=400, detail="Images must be base64 encoded strings")
+            
+            check_encoded_size(image_data, DEFAULT_INPUT_LIMITS)
+            try:
+                image_bytes = _decode_base64(image_data)
+            except ValueError as e:
+                batch.add_error(f"Prediction failed: {str(e)}")
+                continue
+            await batch.add(image_bytes)
+        
+        if len(batch) == 0:
+            raise HTTPException(status_code=422, detail='"images" must be a non-empty array of base64 strings')
+        
+        results = await batch.finish()
         
+        return _json_response({"results": _format_batch_results(results)})
+        
+    except ijson.JSONError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON body: {str(e)}")
+    except ImageRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Chunks already sent for a rejected batch are not waited on
+        if batch is not None:
+            await batch.cancel()
 
 
 @web_app.post("/predict/upload")
 async def predict_upload(file: UploadFile = File(...)):
     """
     Upload an image file for prediction
-    Accepts: JPEG, PNG, WebP
+    Accepts: JPEG, PNG, WebP, GIF, BMP (see image_io.DEFAULT_INPUT_LIMITS)
     """
-    import base64
+    from image_io import DEFAULT_INPUT_LIMITS, ImageRejected, open_validated
     
     try:
         # Validate file type
         if not file.content_type.startswith("image/"):
             raise HTTPException(status_code=400, detail="File must be an image")
         
-        # Read and encode image
-        image_bytes = await file.read()
-        image_base64 = base64.b64encode(image_bytes).decode()
+        # Read at most one byte past the limit, then check the header only
+        image_bytes = await file.read(DEFAULT_INPUT_LIMITS["max_bytes"] + 1)
+        open_validated(image_bytes, DEFAULT_INPUT_LIMITS)
         
-        # Run prediction
+        # Run prediction (the bytes are passed as-is, no base64 round trip)
         model = AIDetectorModel()
-        predictions = model.predict.remote(image_base64)
+        predictions = await model.predict.remote.aio(image_bytes)
         
         if predictions and "error" in predictions[0]:
             raise HTTPException(status_code=400, detail=predictions[0]["error"])
@@ -383,13 +883,267 @@ async def predict_upload(file: UploadFile = File(...)):
             "filename": file.filename,
             "predictions": predictions,
             "top_prediction": top_pred["label"],
-            "confidence": top_pred["score"]
+            "confidence": top_pred["score"],
+            **_result_fields(top_pred)
+        }
+        
+    except ImageRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@web_app.post("/predict/raw", response_model=PredictionResponse)
+async def predict_raw(request: Request, return_all_scores: bool = True):
+    """
+    Predict from raw image bytes sent as the request body
+    
+    Same response as /predict without the base64 overhead (a third of the
+    payload) or the JSON parse:
+    ```
+    curl -X POST -H "Content-Type: application/octet-stream" \\
+         --data-binary @image.jpg "$API_URL/predict/raw?return_all_scores=true"
+    ```
+    """
+    from image_io import DEFAULT_INPUT_LIMITS, ImageRejected, open_validated
+    
+    try:
+        content_type = request.headers.get("content-type", "application/octet-stream")
+        if not (content_type.startswith("application/octet-stream") or content_type.startswith("image/")):
+            raise HTTPException(
+                status_code=415,
+                detail="Body must be application/octet-stream or image/*"
+            )
+        
+        image_bytes = await _read_body(request, DEFAULT_INPUT_LIMITS["max_bytes"])
+        open_validated(image_bytes, DEFAULT_INPUT_LIMITS)
+        
+        model = AIDetectorModel()
+        predictions = await model.predict.remote.aio(image_bytes)
+        
+        if predictions and "error" in predictions[0]:
+            raise HTTPException(status_code=400, detail=predictions[0]["error"])
+        
+        top_pred = predictions[0]
+        
+        return {
+            "predictions": predictions if return_all_scores else [top_pred],
+            "top_prediction": top_pred["label"],
+            "confidence": top_pred["score"],
+            **_result_fields(top_pred)
         }
         
+    except ImageRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@web_app.post("/predict/batch/upload")
+async def predict_batch_upload(files: List[UploadFile] = File(...)):
+    """
+    Upload several image files (multipart, repeated "files" field) for prediction
+    
+    Same response as /predict/batch, with the images sent as raw bytes.
+    Files are read and checked one by one and go to the model in chunks of
+    BATCH_IN_FLIGHT, as in /predict/batch.
+    """
+    from image_io import DEFAULT_INPUT_LIMITS, ImageRejected, open_validated
+    
+    batch = None
+    try:
+        if len(files) > MAX_BATCH_IMAGES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Maximum {MAX_BATCH_IMAGES} images per batch request"
+            )
+        
+        batch = _ChunkedBatch(AIDetectorModel())
+        
+        for file in files:
+            image_bytes = await file.read(DEFAULT_INPUT_LIMITS["max_bytes"] + 1)
+            open_validated(image_bytes, DEFAULT_INPUT_LIMITS)
+            await batch.add(image_bytes)
+        
+        results = await batch.finish()
+        
+        return _json_response({"results": _format_batch_results(results)})
+        
+    except ImageRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if batch is not None:
+            await batch.cancel()
+
+
+@web_app.post("/predict/frames")
+async def predict_frames(
+    request: Request,
+    num_frames: int = Query(None, ge=1, le=MAX_SAMPLED_FRAMES),
+    sampling: str = Query(None, pattern="^(uniform|scene)$"),
+):
+    """
+    Score an animated GIF / WebP or a short video (MP4, WebM) sent as raw bytes
+    
+    Samples `num_frames` frames, evenly ("uniform") or at scene changes
+    ("scene"), scores them in one batch and returns each frame's scores
+    plus their mean:
+    ```
+    curl -X POST -H "Content-Type: application/octet-stream" \\
+         --data-binary @clip.gif "$API_URL/predict/frames?num_frames=8&sampling=scene"
+    ```
+    """
+    from frames import open_frames
+    from image_io import DEFAULT_INPUT_LIMITS, ImageRejected
+    
+    try:
+        content_type = request.headers.get("content-type", "application/octet-stream")
+        if not content_type.startswith(("application/octet-stream", "image/", "video/")):
+            raise HTTPException(
+                status_code=415,
+                detail="Body must be application/octet-stream, image/* or video/*"
+            )
+        
+        image_bytes = await _read_body(request, DEFAULT_INPUT_LIMITS["max_bytes"])
+        open_frames(image_bytes, DEFAULT_INPUT_LIMITS)
+        
+        model = AIDetectorModel()
+        result = await model.predict_frames.remote.aio(image_bytes, num_frames, sampling)
+        
+        if "error" in result:
+            raise HTTPException(status_code=400, detail=result["error"])
+        
+        top_pred = result["aggregate"][0]
+        
+        return _json_response({
+            **result,
+            "top_prediction": top_pred["label"],
+            "confidence": top_pred["score"]
+        })
+        
+    except ImageRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@web_app.post("/predict/tiles")
+async def predict_tiles(
+    request: Request,
+    max_tiles: int = Query(None, ge=1),
+    global_view: bool = Query(None),
+):
+    """
+    Score a large image as a grid of full-resolution tiles, sent as raw bytes
+    
+    Returns each tile's box and scores, a heatmap of AI scores on the tile
+    grid and the mean over all tiles (and the downscaled global view):
+    ```
+    curl -X POST -H "Content-Type: application/octet-stream" \\
+         --data-binary @photo.jpg "$API_URL/predict/tiles?max_tiles=9"
+    ```
+    """
+    from image_io import DEFAULT_INPUT_LIMITS, ImageRejected, open_validated
+    
+    try:
+        content_type = request.headers.get("content-type", "application/octet-stream")
+        if not content_type.startswith(("application/octet-stream", "image/")):
+            raise HTTPException(
+                status_code=415,
+                detail="Body must be application/octet-stream or image/*"
+            )
+        
+        image_bytes = await _read_body(request, DEFAULT_INPUT_LIMITS["max_bytes"])
+        open_validated(image_bytes, DEFAULT_INPUT_LIMITS)
+        
+        model = AIDetectorModel()
+        result = await model.predict_tiles.remote.aio(image_bytes, max_tiles, global_view)
+        
+        if "error" in result:
+            raise HTTPException(status_code=400, detail=result["error"])
+        
+        top_pred = result["aggregate"][0]
+        
+        return _json_response({
+            **result,
+            "top_prediction": top_pred["label"],
+            "confidence": top_pred["score"]
+        })
+        
+    except ImageRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@web_app.get("/predict/{sha256}")
+async def predict_lookup(
+    request: Request,
+    sha256: str = Path(..., pattern="^[0-9a-fA-F]{64}$"),
+):
+    """
+    Stored prediction for an image scored before, addressed by the SHA-256
+    of its bytes, so repeat checks need no upload
+    
+    Answered from the cache tier the GPU containers share, for the model
+    version they last published. Hits carry a strong ETag (model version +
+    hash) and are cacheable by browsers and CDNs for LOOKUP_MAX_AGE_S;
+    If-None-Match answers 304.
+    Unknown hashes are 404 (not cached): upload the image instead.
+    """
+    import time
+    from prediction_cache import PredictionCache
+    
+    sha256 = sha256.lower()
+    
+    # Read the shared cache tier directly: no GPU container is involved,
+    # and every container's results are visible
+    try:
+        version = await prediction_store.get.aio(PredictionCache.VERSION_KEY)
+        stored = await prediction_store.get.aio(f"{version}:{sha256}") if version else None
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if stored is None or stored["expires"] < time.time():
+        raise HTTPException(
+            status_code=404, detail="No stored prediction for this hash",
+            headers={"Cache-Control": "no-store"}
+        )
+    
+    headers = {
+        "ETag": f'"{version}-{sha256}"',
+        "Cache-Control": f"public, max-age={LOOKUP_MAX_AGE_S}",
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if headers["ETag"] in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    
+    predictions = [{**p, "cached": True} for p in stored["predictions"]]
+    top_pred = predictions[0]
+    response = _json_response({
+        "sha256": sha256,
+        "model_version": version,
+        "predictions": predictions,
+        "top_prediction": top_pred["label"],
+        "confidence": top_pred["score"],
+        **_result_fields(top_pred)
+    })
+    response.headers.update(headers)
+    return response
+
+
 # Deploy the FastAPI app on Modal
 @app.function(image=image)
 @modal.asgi_app()
@@ -410,17 +1164,14 @@ def main(image_path: str = "test_image.jpg"):
     Usage:
         modal run modal_app.py --image-path test_image.jpg
     """
-    import base64
-    
-    # Read and encode image
+    # Read image
     with open(image_path, "rb") as f:
         image_bytes = f.read()
-        image_base64 = base64.b64encode(image_bytes).decode()
     
     # Run prediction
     print(f"🔍 Analyzing image: {image_path}")
     model = AIDetectorModel()
-    predictions = model.predict.remote(image_base64)
+    predictions = model.predict.remote(image_bytes)
     
     print("\n📊 Results:")
     for pred in predictions:
@@ -4,10 +4,12 @@ Handles various checkpoint formats and key prefixes
 """
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import timm
+import copy
 import json
 import os
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Tuple, Sequence
 
 
 def safe_load_state_dict(
@@ -179,8 +181,17 @@ def create_preprocessing_transform(config: Dict[str, Any] = None):
     """
     Create the preprocessing transform for images.
     
+    With "fold_preprocessing" enabled the model expects raw 0-255 pixels
+    (see prepare_inference_model), so the transform stops at a uint8 tensor.
+    
+    With "preprocessing": "tensor" the transform also stays in uint8 and
+    accepts either a PIL image or a decoded uint8 CHW tensor (see
+    image_io.decode_image); InferenceEngine then normalizes the whole batch
+    in one operation on the device.
+    
     Args:
-        config: Optional config dict with image_size, mean, std
+        config: Optional config dict with image_size, mean, std,
+            fold_preprocessing, preprocessing
         
     Returns:
         torchvision.transforms.Compose object
@@ -194,8 +205,270 @@ def create_preprocessing_transform(config: Dict[str, Any] = None):
     mean = config.get("mean", [0.485, 0.456, 0.406])
     std = config.get("std", [0.229, 0.224, 0.225])
     
+    if config.get("preprocessing", "pil") == "tensor":
+        from torchvision.transforms import v2
+        
+        # PILToTensor only touches PIL images; uint8 tensors go straight to Resize
+        return v2.Compose([
+            v2.PILToTensor(),
+            v2.Resize((img_size, img_size), antialias=True),
+        ])
+    
+    if config.get("fold_preprocessing", False):
+        return transforms.Compose([
+            transforms.Resize((img_size, img_size)),
+            transforms.PILToTensor(),
+        ])
+    
     return transforms.Compose([
         transforms.Resize((img_size, img_size)),
         transforms.ToTensor(),
         transforms.Normalize(mean=mean, std=std),
     ])
+
+
+class FoldedInputConv(nn.Module):
+    """
+    First convolution with the input Normalize folded into its weights.
+    
+    Takes raw 0-255 pixels. Scaling by 1/(255*std) goes into the weights and
+    the mean shift into the bias. Zero padding of raw pixels is not zero
+    padding of normalized pixels, so the few output rows/columns whose
+    receptive field touches the padding get a precomputed correction. That
+    keeps the outputs equal to Normalize + original conv.
+    """
+    
+    def __init__(
+        self,
+        conv: nn.Conv2d,
+        mean: Sequence[float],
+        std: Sequence[float],
+        image_size: int = 224,
+        scale: float = 255.0
+    ):
+        super().__init__()
+        
+        if conv.groups != 1 or conv.padding_mode != "zeros" or isinstance(conv.padding, str):
+            raise ValueError(f"Cannot fold normalization into {conv}")
+        
+        weight = conv.weight.detach().float()
+        bias = conv.bias.detach().float() if conv.bias is not None else torch.zeros(conv.out_channels)
+        mean = torch.tensor(mean, dtype=torch.float32, device=weight.device).view(1, -1, 1, 1)
+        std = torch.tensor(std, dtype=torch.float32, device=weight.device).view(1, -1, 1, 1)
+        
+        # Contribution of the mean per tap: W * mean / std
+        shift = weight * (mean / std)
+        
+        self.conv = nn.Conv2d(
+            conv.in_channels, conv.out_channels, conv.kernel_size,
+            stride=conv.stride, padding=conv.padding, dilation=conv.dilation, bias=True
+        ).to(weight.device)
+        self.conv.weight.data.copy_(weight / (scale * std))
+        self.conv.bias.data.copy_(bias - shift.sum(dim=(1, 2, 3)))
+        
+        self.register_buffer("shift", shift)
+        self.image_size = image_size
+        self.register_buffer("border", self._border_correction(image_size, image_size))
+        
+        # Thickness (top, bottom, left, right) of the corrected band, so only
+        # those slices are touched instead of the whole output
+        out_h, out_w = self.border.shape[1:]
+        rows = self._touches_padding(image_size, 0, out_h).tolist()
+        cols = self._touches_padding(image_size, 1, out_w).tolist()
+        self.border_extent = (
+            self._run_length(rows), self._run_length(rows[::-1]),
+            self._run_length(cols), self._run_length(cols[::-1]),
+        )
+    
+    @staticmethod
+    def _run_length(flags) -> int:
+        """Number of leading True values"""
+        count = 0
+        for flag in flags:
+            if not flag:
+                break
+            count += 1
+        return count
+    
+    def _border_correction(self, height: int, width: int) -> torch.Tensor:
+        """
+        [C_out, H_out, W_out] correction, non-zero only where padding is read.
+        
+        Folded bias subtracts the mean over every tap; positions reading
+        padding must add back the part that fell on padded pixels.
+        """
+        ones = torch.ones(1, self.conv.in_channels, height, width, device=self.shift.device)
+        inside = F.conv2d(
+            ones, self.shift, None,
+            stride=self.conv.stride, padding=self.conv.padding, dilation=self.conv.dilation
+        )[0]
+        correction = self.shift.sum(dim=(1, 2, 3)).view(-1, 1, 1) - inside
+        
+        # Zero the interior exactly (from geometry, not from rounding noise)
+        rows = self._touches_padding(height, 0, correction.shape[1])
+        cols = self._touches_padding(width, 1, correction.shape[2])
+        mask = rows.view(-1, 1) | cols.view(1, -1)
+        return correction * mask
+    
+    def _touches_padding(self, size: int, dim: int, out_size: int) -> torch.Tensor:
+        """Which output positions along one axis read padded input"""
+        kernel = (self.conv.kernel_size[dim] - 1) * self.conv.dilation[dim]
+        start = torch.arange(out_size) * self.conv.stride[dim] - self.conv.padding[dim]
+        return ((start < 0) | (start + kernel > size - 1)).to(self.shift.device)
+    
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        out = self.conv(x)
+        
+        if x.shape[-2:] != (self.image_size, self.image_size):
+            return out + self._border_correction(x.shape[-2], x.shape[-1]).to(out.dtype)
+        
+        top, bottom, left, right = self.border_extent
+        height, width = out.shape[-2:]
+        
+        if top:
+            out[..., :top, :] += self.border[:, :top, :]
+        if bottom:
+            out[..., height - bottom:, :] += self.border[:, height - bottom:, :]
+        if left:
+            out[..., top:height - bottom, :left] += self.border[:, top:height - bottom, :left]
+        if right:
+            out[..., top:height - bottom, width - right:] += self.border[:, top:height - bottom, width - right:]
+        
+        return out
+
+
+def fuse_conv_bn(model: nn.Module, verbose: bool = True) -> int:
+    """
+    Fold eval-mode BatchNorm layers into the preceding convolution (in place).
+    
+    Handles timm ConvNorm / ConvNormAct blocks (`.conv` followed by `.bn`,
+    keeping the activation of BatchNormAct2d) and Conv2d -> BatchNorm2d
+    pairs inside nn.Sequential.
+    
+    Args:
+        model: Model in eval mode
+        verbose: Whether to print how many pairs were fused
+        
+    Returns:
+        Number of fused Conv+BN pairs
+    """
+    from torch.nn.utils.fusion import fuse_conv_bn_eval
+    
+    model.eval()
+    fused = 0
+    
+    for module in list(model.modules()):
+        conv = getattr(module, "conv", None)
+        bn = getattr(module, "bn", None)
+        
+        if isinstance(conv, nn.Conv2d) and isinstance(bn, nn.BatchNorm2d):
+            module.conv = fuse_conv_bn_eval(conv, bn)
+            # BatchNormAct2d also applies drop + activation after the norm
+            if hasattr(bn, "act"):
+                module.bn = nn.Sequential(getattr(bn, "drop", nn.Identity()), bn.act)
+            else:
+                module.bn = nn.Identity()
+            fused += 1
+        
+        elif isinstance(module, nn.Sequential):
+            names = list(module._modules.keys())
+            for first, second in zip(names, names[1:]):
+                a, b = module._modules[first], module._modules[second]
+                if isinstance(a, nn.Conv2d) and type(b) is nn.BatchNorm2d:
+                    module._modules[first] = fuse_conv_bn_eval(a, b)
+                    module._modules[second] = nn.Identity()
+                    fused += 1
+    
+    if verbose:
+        print(f"✓ Fused {fused} Conv+BN pairs")
+    
+    return fused
+
+
+def fold_input_normalization(
+    model: nn.Module,
+    mean: Sequence[float],
+    std: Sequence[float],
+    image_size: int = 224,
+    verbose: bool = True
+) -> nn.Module:
+    """
+    Replace the first RGB convolution with a FoldedInputConv (in place).
+    
+    Afterwards the model takes 0-255 pixel values instead of normalized input.
+    
+    Args:
+        model: Model to modify
+        mean: Per-channel mean used by transforms.Normalize
+        std: Per-channel std used by transforms.Normalize
+        image_size: Serving resolution (its border correction is precomputed)
+        verbose: Whether to print which layer was folded
+        
+    Returns:
+        The same model
+    """
+    for name, module in model.named_modules():
+        if isinstance(module, nn.Conv2d) and module.in_channels == 3:
+            parent_name, _, child_name = name.rpartition(".")
+            parent = model.get_submodule(parent_name) if parent_name else model
+            setattr(parent, child_name, FoldedInputConv(module, mean, std, image_size))
+            
+            if verbose:
+                print(f"✓ Folded input normalization into {name}")
+            return model
+    
+    raise ValueError("No 3-channel input convolution found to fold normalization into")
+
+
+def prepare_inference_model(
+    model: nn.Module,
+    config: Dict[str, Any] = None,
+    verify: bool = True,
+    verbose: bool = True
+) -> nn.Module:
+    """
+    Build the inference-only graph: Conv+BN fused, Normalize folded into the stem.
+    
+    The returned model takes uint8-scaled input (0-255, any float dtype) and
+    matches Normalize + original model up to float rounding.
+    
+    Args:
+        model: Loaded model in eval mode (modified in place)
+        config: Config dict with image_size, mean, std
+        verify: Compare against the unmodified model on a random batch
+        verbose: Whether to print progress
+        
+    Returns:
+        The folded model
+    """
+    if config is None:
+        config = {}
+    
+    img_size = config.get("image_size", 224)
+    mean = config.get("mean", [0.485, 0.456, 0.406])
+    std = config.get("std", [0.229, 0.224, 0.225])
+    
+    model.eval()
+    reference = copy.deepcopy(model) if verify else None
+    
+    fuse_conv_bn(model, verbose=verbose)
+    fold_input_normalization(model, mean, std, img_size, verbose=verbose)
+    
+    if verify:
+        device = next(model.parameters()).device
+        pixels = torch.randint(0, 256, (2, 3, img_size, img_size), device=device).float()
+        mean_t = torch.tensor(mean, device=device).view(1, -1, 1, 1)
+        std_t = torch.tensor(std, device=device).view(1, -1, 1, 1)
+        
+        with torch.no_grad():
+            expected = reference(((pixels / 255.0) - mean_t) / std_t)
+            actual = model(pixels)
+        
+        max_diff = (expected - actual).abs().max().item()
+        if max_diff > 1e-3 * (1.0 + expected.abs().max().item()):
+            raise RuntimeError(f"Folded model diverges from the original (max logit diff {max_diff:.2e})")
+        
+        if verbose:
+            print(f"✓ Folded model verified (max logit diff {max_diff:.2e})")
+    
+    return model
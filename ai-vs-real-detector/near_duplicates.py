@@ -0,0 +1,177 @@
+"""
+Perceptual-hash near-duplicate index
+Reuses predictions for resized, recompressed or metadata-stripped copies
+of images already scored, matched by 64-bit dHash within a Hamming distance
+"""
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+from PIL import Image
+
+# Set bits per byte, for numpy < 2.0 (no np.bitwise_count)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def dhash(image: Union[Image.Image, "torch.Tensor"]) -> int:
+    """
+    64-bit difference hash of a decoded image.
+
+    The image is shrunk to 9x8 grey and each bit records whether a pixel is
+    brighter than its right-hand neighbour, so the hash survives resizing,
+    recompression and metadata changes.
+
+    Args:
+        image: RGB PIL image or uint8 [3, H, W] tensor (as decode_image returns)
+
+    Returns:
+        Hash as an int; 0 for featureless (flat) images
+    """
+    if not isinstance(image, Image.Image):
+        image = Image.fromarray(image.permute(1, 2, 0).numpy())
+    grey = np.asarray(image.convert("L").resize((9, 8), Image.BOX), dtype=np.int16)
+    bits = (grey[:, 1:] > grey[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distances(hashes: np.ndarray, query: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Bit differences between every uint64 hash and the query (`out`: uint64 scratch of the same length)"""
+    diff = np.bitwise_xor(hashes, np.uint64(query), out=out)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(diff, out=diff)
+    return _POPCOUNT[diff.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class NearDuplicateIndex:
+    """
+    Bounded index of dHashes and their predictions.
+
+    Hashes live in one packed uint64 array and scores in a float32
+    [max_entries, num_classes] array, so a million entries take 16 MB
+    (two classes). Lookups are a vectorised XOR + popcount scan in
+    SCAN_CHUNK slices (about 3 ms per million entries on one CPU core).
+    The scan runs outside the lock, so concurrent lookups proceed in
+    parallel and adds only wait for the final check of the best slot.
+    Once full, the oldest entries are overwritten. Thread-safe.
+
+    Args:
+        labels: Class labels, in the engine's index order
+        max_distance: Largest Hamming distance (of 64 bits) that counts as a match
+        max_entries: Index capacity
+    """
+
+    # Hashes scanned per step; each lookup's scratch buffer is this many uint64s (512 KB)
+    SCAN_CHUNK = 1 << 16
+
+    def __init__(self, labels: Sequence[str], max_distance: int = 4, max_entries: int = 1_000_000):
+        self.labels = [label.upper() for label in labels]
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._hashes = np.zeros(max_entries, dtype=np.uint64)
+        self._scores = np.zeros((max_entries, len(self.labels)), dtype=np.float32)
+        self._size = 0
+        self._next = 0
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], labels: Sequence[str]) -> Optional["NearDuplicateIndex"]:
+        """
+        Index configured by config.json "near_duplicates", or None when disabled
+
+        Args:
+            config: Parsed config.json ("near_duplicates": {"enabled",
+                "max_distance", "max_entries"})
+            labels: Class labels, in the engine's index order
+        """
+        settings = config.get("near_duplicates", {})
+        if not settings.get("enabled", False):
+            return None
+        return cls(
+            labels,
+            max_distance=settings.get("max_distance", 4),
+            max_entries=settings.get("max_entries", 1_000_000),
+        )
+
+    def lookup(self, phash: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Predictions of the closest indexed image, or None
+
+        Returns:
+            Prediction list (highest score first), each entry marked
+            "cached": True with the Hamming "match_distance"; None when
+            nothing is within max_distance or the image is featureless
+        """
+        if not phash:
+            return None
+
+        with self._lock:
+            size = self._size
+
+        best = self._nearest(phash, size) if size else None
+
+        with self._lock:
+            # The slot may have been overwritten during the scan, so the
+            # match is re-checked against what it holds now
+            distance = bin(int(self._hashes[best]) ^ phash).count("1") if best is not None else 64
+            if distance > self.max_distance:
+                self._counters["misses"] += 1
+                return None
+            self._counters["hits"] += 1
+            scores = self._scores[best].tolist()
+
+        results = [
+            {"label": label, "score": score, "cached": True, "match_distance": distance}
+            for label, score in zip(self.labels, scores)
+        ]
+        results.sort(key=lambda x: x["score"], reverse=True)
+        return results
+
+    def _nearest(self, phash: int, size: int) -> Optional[int]:
+        """Slot of the closest of the first `size` hashes (scanned without the lock)"""
+        scratch = np.empty(min(size, self.SCAN_CHUNK), dtype=np.uint64)
+        best, best_distance = None, 65
+        for start in range(0, size, self.SCAN_CHUNK):
+            hashes = self._hashes[start:min(start + self.SCAN_CHUNK, size)]
+            distances = hamming_distances(hashes, phash, out=scratch[:len(hashes)])
+            offset = int(np.argmin(distances))
+            if distances[offset] < best_distance:
+                best, best_distance = start + offset, int(distances[offset])
+                if best_distance == 0:
+                    break
+        return best
+
+    def add(self, phash: int, predictions: List[Dict[str, Any]]):
+        """Index a prediction list (failures and featureless images are skipped)"""
+        if not phash or not predictions or any("error" in p for p in predictions):
+            return
+
+        scores = {p["label"]: p["score"] for p in predictions}
+        row = [scores.get(label, 0.0) for label in self.labels]
+
+        with self._lock:
+            if self._size == self.max_entries:
+                self._counters["evictions"] += 1
+            else:
+                self._size += 1
+            self._hashes[self._next] = phash
+            self._scores[self._next] = row
+            self._next = (self._next + 1) % self.max_entries
+
+    def add_when_done(self, phash: int, future: Future):
+        """Index a Future's prediction list once it finishes"""
+        future.add_done_callback(
+            lambda done: self.add(phash, done.result()) if done.exception() is None else None
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit / miss / eviction counters for health checks"""
+        with self._lock:
+            return {
+                "entries": self._size,
+                "max_entries": self.max_entries,
+                "max_distance": self.max_distance,
+                **self._counters,
+            }
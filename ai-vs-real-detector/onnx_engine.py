@@ -0,0 +1,175 @@
+"""
+ONNX Runtime inference engine for CPU-only serving
+Needs only onnxruntime, numpy and Pillow - no torch, timm or torchvision
+"""
+import os
+import time
+from typing import Dict, List, Any, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+from batching import serving_batch_sizes
+
+
+class OnnxEngine:
+    """
+    Batched inference over an exported ONNX graph (see export_onnx.py).
+
+    Mirrors InferenceEngine: `preprocess` turns a PIL image into a CHW array
+    (same pixels as the torchvision Resize/ToTensor/Normalize pipeline) and
+    `predict_tensors` scores a list of them in one session run. Each serving
+    batch size is run once at startup so ORT's arena allocation and kernel
+    selection do not land on the first request.
+
+    Usage:
+        engine = OnnxEngine("model.onnx", idx_to_class, config)
+        results = engine.predict_tensors([engine.preprocess(image)])
+    """
+
+    def __init__(
+        self,
+        onnx_path: str,
+        idx_to_class: Dict[int, str],
+        config: Dict[str, Any] = None,
+        max_batch_size: int = None
+    ):
+        """
+        Args:
+            onnx_path: Path to the exported .onnx file
+            idx_to_class: Class index to label mapping
+            config: Parsed config.json (reads "image_size", "mean", "std",
+                "ort_intra_op_threads", "ort_providers", "warmup", "max_batch_size")
+            max_batch_size: Largest batch served (defaults to config "max_batch_size")
+        """
+        import onnxruntime as ort
+
+        if config is None:
+            config = {}
+
+        if not os.path.exists(onnx_path):
+            raise FileNotFoundError(
+                f"ONNX model not found at {onnx_path} (create it with export_onnx.py)"
+            )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        # 0 lets ORT use one thread per physical core
+        options.intra_op_num_threads = config.get("ort_intra_op_threads", 0)
+        options.inter_op_num_threads = 1
+
+        available = ort.get_available_providers()
+        requested = config.get("ort_providers", ["CUDAExecutionProvider", "CPUExecutionProvider"])
+        providers = [p for p in requested if p in available] or ["CPUExecutionProvider"]
+
+        self.session = ort.InferenceSession(onnx_path, options, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+        self.device = self.session.get_providers()[0]
+        self.model_name = os.path.basename(onnx_path)
+        self.idx_to_class = idx_to_class
+
+        self.image_size = config.get("image_size", 224)
+        self.mean = np.array(config.get("mean", [0.485, 0.456, 0.406]), dtype=np.float32).reshape(3, 1, 1)
+        self.std = np.array(config.get("std", [0.229, 0.224, 0.225]), dtype=np.float32).reshape(3, 1, 1)
+
+        self.batch_sizes = serving_batch_sizes(max_batch_size or config.get("max_batch_size", 16))
+        self.warmup_timings: Dict[int, float] = {}
+        if config.get("warmup", True):
+            self.warmup()
+
+        print(f"✓ ONNX Runtime engine ready ({self.model_name} on {self.device})")
+
+    @property
+    def ready(self) -> bool:
+        """True once every serving batch size has been run"""
+        return len(self.warmup_timings) == len(self.batch_sizes)
+
+    def warmup(self):
+        """Run a synthetic batch at each serving batch size and record the timings (ms)"""
+        for batch_size in self.batch_sizes:
+            batch = np.zeros((batch_size, 3, self.image_size, self.image_size), dtype=np.float32)
+
+            start = time.perf_counter()
+            self.forward(batch)
+            self.warmup_timings[batch_size] = (time.perf_counter() - start) * 1000.0
+
+    def preprocess(self, image: Image.Image) -> np.ndarray:
+        """
+        Resize, scale and normalize an RGB image.
+
+        Uses the same PIL bilinear resize as transforms.Resize, so the
+        resulting pixels match the torch pipeline.
+
+        Returns:
+            [3, H, W] float32 array
+        """
+        image = image.resize((self.image_size, self.image_size), Image.BILINEAR)
+        array = np.asarray(image, dtype=np.float32).transpose(2, 0, 1) / 255.0
+        return (array - self.mean) / self.std
+
+    def forward(self, batch: np.ndarray) -> np.ndarray:
+        """
+        Run the graph once and return probabilities.
+
+        Args:
+            batch: [N, 3, H, W] float32 array
+
+        Returns:
+            [N, num_classes] probability array
+        """
+        logits = self.session.run(None, {self.input_name: np.ascontiguousarray(batch, dtype=np.float32)})[0]
+        logits = logits - logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def format_predictions(self, probs: Sequence[float]) -> List[Dict[str, Any]]:
+        """Map class probabilities to labels, highest score first"""
+        results = []
+        for idx, prob in enumerate(probs):
+            label = self.idx_to_class.get(idx, f"class_{idx}")
+            results.append({
+                "label": label.upper(),
+                "score": float(prob)
+            })
+
+        results.sort(key=lambda x: x["score"], reverse=True)
+        return results
+
+    def predict_tensors(self, arrays: List[np.ndarray]) -> List[List[Dict[str, Any]]]:
+        """
+        Score preprocessed CHW arrays in a single session run.
+
+        Args:
+            arrays: List of [3, H, W] arrays from preprocess()
+
+        Returns:
+            List of prediction lists, one per input
+        """
+        return self.format_batch(self.forward_tensors(arrays))
+
+    def format_batch(self, probs: np.ndarray) -> List[List[Dict[str, Any]]]:
+        """Prediction lists for an [N, num_classes] probability array"""
+        return [self.format_predictions(row) for row in probs.tolist()]
+
+    def forward_tensors(self, arrays: List[np.ndarray]) -> np.ndarray:
+        """Stack preprocessed CHW arrays and return [N, num_classes] probabilities"""
+        return self.run_batch(*self.load_batch(arrays))
+
+    def load_batch(self, arrays: List[np.ndarray]) -> Tuple[np.ndarray, int]:
+        """Stack CHW arrays into one batch (same contract as InferenceEngine.load_batch)"""
+        return np.stack(arrays), len(arrays)
+
+    def run_batch(self, batch: np.ndarray, n: int) -> np.ndarray:
+        """Score a batch from load_batch"""
+        return self.forward(batch)[:n]
+
+    def describe(self) -> Dict[str, Any]:
+        """Serving settings reported by health checks"""
+        return {
+            "backend": "onnx",
+            "ready": self.ready,
+            "warmup_ms": {size: round(ms, 1) for size, ms in self.warmup_timings.items()},
+            "onnx_model": self.model_name,
+            "providers": self.session.get_providers(),
+        }
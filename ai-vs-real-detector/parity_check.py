@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Parity check for optimized inference modes
+Scores a reference image set with the fp32 model and with the candidate
+mode, then reports how far the probabilities drift
+
+Usage:
+    python parity_check.py --dtype fp16 --images reference_images/
+    python parity_check.py --dtype bf16 --device cpu
+    python parity_check.py --dtype fp32 --fold --images reference_images/
+    python parity_check.py --dtype fp32 --fast-decode --images reference_images/
+    python parity_check.py --dtype fp32 --preprocessing tensor --images reference_images/
+"""
+import argparse
+import copy
+import io
+import json
+import os
+import sys
+from pathlib import Path
+from typing import List
+
+import timm
+import torch
+from PIL import Image
+
+from image_io import decode_image
+from model_utils import load_model_from_checkpoint, create_preprocessing_transform
+from inference_engine import InferenceEngine, parity_report, INFERENCE_DTYPES
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+
+
+def load_reference_images(images_dir: str = None, limit: int = 64) -> List[bytes]:
+    """
+    Load the reference image set as encoded bytes, or synthesize one if no folder is given
+
+    Args:
+        images_dir: Folder searched recursively for images
+        limit: Maximum number of images to use
+
+    Returns:
+        List of encoded images (decoded per pipeline so decode modes can be compared)
+    """
+    if images_dir:
+        paths = sorted(
+            p for p in Path(images_dir).rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS
+        )[:limit]
+        if not paths:
+            raise FileNotFoundError(f"No images found in {images_dir}")
+        return [p.read_bytes() for p in paths]
+
+    print("⚠ No --images folder given, using synthetic noise JPEGs")
+    images = []
+    for i in range(min(limit, 16)):
+        # Phone-photo sized, so reduced-size decoding actually kicks in
+        image = Image.effect_noise((2016, 1512), 32 + i).convert("RGB").rotate(i * 7)
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def load_parity_model(repo_path: str, device: torch.device, random_weights: bool = False):
+    """Load the detector from the repo checkpoint (or random weights for smoke tests)"""
+    if random_weights:
+        print("⚠ Using random weights: results only check that the mode runs")
+        model = timm.create_model("efficientformerv2_s1", pretrained=False, num_classes=2)
+        return model.to(device).eval(), {"idx_to_class": {0: "ai", 1: "real"}}
+
+    return load_model_from_checkpoint(
+        os.path.join(repo_path, "pytorch_model.bin"),
+        os.path.join(repo_path, "config.json"),
+        device=device,
+        verbose=False
+    )
+
+
+def load_serving_config(repo_path: str) -> dict:
+    """config.json next to this script (image_size, mean, std), or defaults"""
+    config_path = os.path.join(repo_path, "config.json")
+    if not os.path.exists(config_path):
+        return {}
+    with open(config_path, "r") as f:
+        return json.load(f)
+
+
+def score(engine: InferenceEngine, tensors: List[torch.Tensor], batch_size: int) -> torch.Tensor:
+    """Run the whole set through an engine in fixed-size batches"""
+    probs = []
+    for i in range(0, len(tensors), batch_size):
+        probs.append(engine.forward(torch.stack(tensors[i:i + batch_size])))
+    return torch.cat(probs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check optimized inference against fp32")
+    parser.add_argument("--dtype", choices=sorted(INFERENCE_DTYPES), default="fp16")
+    parser.add_argument("--fold", action="store_true",
+                        help="Fuse Conv+BN and fold Normalize into the stem (uint8 input)")
+    parser.add_argument("--fast-decode", action="store_true",
+                        help="Decode at reduced size (JPEG draft + reduce) instead of full resolution")
+    parser.add_argument("--preprocessing", choices=["pil", "tensor"], default="pil",
+                        help="tensor: decode to uint8 tensors and normalize the batch on the device")
+    parser.add_argument("--images", help="Folder of reference images")
+    parser.add_argument("--limit", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--tolerance", type=float, default=0.01,
+                        help="Maximum allowed absolute difference in any probability")
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--random-weights", action="store_true")
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    repo_path = os.path.dirname(os.path.abspath(__file__))
+
+    model, metadata = load_parity_model(repo_path, device, args.random_weights)
+    idx_to_class = metadata["idx_to_class"]
+
+    config = load_serving_config(repo_path)
+    reference_config = {**config, "inference_dtype": "fp32", "fold_preprocessing": False,
+                        "preprocessing": "pil", "compile": False}
+    candidate_config = {**config, "inference_dtype": args.dtype, "fold_preprocessing": args.fold,
+                        "preprocessing": args.preprocessing, "compile": False}
+
+    encoded = load_reference_images(args.images, args.limit)
+    decode_size = config.get("image_size", 224) if args.fast_decode else None
+    reference_images = [decode_image(data) for data in encoded]
+    candidate_images = [
+        decode_image(data, decode_size, as_tensor=args.preprocessing == "tensor") for data in encoded
+    ]
+
+    reference_transform = create_preprocessing_transform(reference_config)
+    candidate_transform = create_preprocessing_transform(candidate_config)
+
+    reference = InferenceEngine(copy.deepcopy(model), device, idx_to_class, reference_config)
+    candidate = InferenceEngine(model, device, idx_to_class, candidate_config)
+
+    report = parity_report(
+        score(reference, [reference_transform(image) for image in reference_images], args.batch_size),
+        score(candidate, [candidate_transform(image) for image in candidate_images], args.batch_size)
+    )
+
+    print("\n📊 Parity vs fp32")
+    print("=" * 60)
+    print(f"  Mode:            {candidate.dtype_name}{' + folded' if candidate.folded else ''}"
+          f"{' + fast decode' if args.fast_decode else ''}"
+          f"{' + tensor preprocessing' if candidate.tensor_preprocessing else ''} on {device}")
+    print(f"  Images:          {len(encoded)}")
+    print(f"  Max abs diff:    {report['max_abs_diff']:.6f}")
+    print(f"  Mean abs diff:   {report['mean_abs_diff']:.6f}")
+    print(f"  Top-1 agreement: {report['top1_agreement'] * 100:.2f}%")
+    print("=" * 60)
+
+    if report["max_abs_diff"] > args.tolerance:
+        print(f"❌ Exceeds tolerance of {args.tolerance}")
+        sys.exit(1)
+
+    print(f"✅ Within tolerance of {args.tolerance}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+"""
+Content-hash prediction cache
+Keyed by the SHA-256 of the image bytes and the model version, with a
+bounded in-memory LRU in front of an optional SQLite file or shared
+key-value store, plus single-flight coalescing of identical predictions
+still in progress
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+def content_hash(image_bytes: bytes) -> str:
+    """Hex SHA-256 of an upload's bytes"""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def model_version(config: Dict[str, Any], weights_path: Optional[str] = None) -> str:
+    """
+    Version tag that invalidates the cache when the model changes.
+
+    Uses config.json "model_version" when set, otherwise the first 16 hex
+    digits of the weights file's SHA-256.
+    """
+    if config.get("model_version"):
+        return str(config["model_version"])
+
+    digest = hashlib.sha256()
+    try:
+        with open(weights_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    except (OSError, TypeError):
+        return "unversioned"
+    return digest.hexdigest()[:16]
+
+
+class PredictionCache:
+    """
+    Tiered prediction cache.
+
+    The memory tier is an LRU of at most `max_entries` results. Behind it
+    sit an optional SQLite file (`path`), which outlives the process but
+    belongs to one host, and an optional shared store (`shared`), which
+    every replica reads and writes. All tiers expire entries after `ttl_s`.
+    Disk and shared hits are promoted to memory. Thread-safe.
+
+    The shared store is any object with get(key) / put(key, value), such
+    as a modal.Dict. Reads and writes run on background threads: a caller
+    waits at most `shared_timeout_s` for a read, and never for a write.
+    Store errors and slow reads count as misses. fetch_shared starts a
+    read early so it can overlap with decoding. The store also holds the
+    current model version under VERSION_KEY, so readers without the model
+    can build keys.
+
+    Args:
+        version: Model version, part of every key
+        max_entries: Memory tier size
+        ttl_s: Entry lifetime in seconds
+        path: SQLite file for the disk tier, or None
+        shared: Store shared across replicas, or None
+        shared_timeout_s: Longest wait for a shared-store read
+    """
+
+    # Expired disk rows are pruned once every this many writes
+    PRUNE_EVERY = 1000
+    # Shared-store key holding the version of the model writing to it
+    VERSION_KEY = "model_version"
+
+    def __init__(self, version: str, max_entries: int = 100_000, ttl_s: float = 7 * 24 * 3600,
+                 path: Optional[str] = None, shared: Any = None, shared_timeout_s: float = 0.05):
+        self.version = version
+        self.max_entries = max_entries
+        self.ttl = ttl_s
+        self.path = path
+        self.shared = shared
+        self.shared_timeout = shared_timeout_s
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._counters = {
+            "memory_hits": 0, "disk_hits": 0, "shared_hits": 0, "misses": 0,
+            "evictions": 0, "expirations": 0, "shared_errors": 0, "shared_timeouts": 0,
+        }
+        self._writes = 0
+
+        self._writer = self._reader = None
+        if shared is not None:
+            self._reader = ThreadPoolExecutor(max_workers=8, thread_name_prefix="cache-reader")
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-writer")
+            self._writer.submit(self._shared_put, self.VERSION_KEY, version)
+
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                "key TEXT PRIMARY KEY, predictions TEXT NOT NULL, created REAL NOT NULL)"
+            )
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], version: str, path: Optional[str] = None,
+                    shared: Any = None) -> Optional["PredictionCache"]:
+        """
+        Cache configured by config.json "prediction_cache", or None when disabled
+
+        Args:
+            config: Parsed config.json ("prediction_cache": {"enabled",
+                "max_entries", "ttl_s", "path", "shared_timeout_ms"})
+            version: Model version (see model_version)
+            path: Disk tier location, overriding the config's "path"
+            shared: Store shared across replicas (see the class docstring)
+        """
+        settings = config.get("prediction_cache", {})
+        if not settings.get("enabled", False):
+            return None
+        return cls(
+            version,
+            max_entries=settings.get("max_entries", 100_000),
+            ttl_s=settings.get("ttl_s", 7 * 24 * 3600),
+            path=path or settings.get("path"),
+            shared=shared,
+            shared_timeout_s=settings.get("shared_timeout_ms", 50) / 1000.0,
+        )
+
+    def key(self, digest: str) -> str:
+        """Cache key for a content hash under the current model version"""
+        return f"{self.version}:{digest}"
+
+    def get(self, digest: str, shared: bool = True) -> Optional[List[Dict[str, Any]]]:
+        """
+        Cached predictions for a content hash, or None
+
+        Args:
+            digest: Content hash
+            shared: Also try the shared store (waiting up to shared_timeout_s);
+                False checks the local tiers only, for callers that
+                fetch_shared separately (a miss is then counted there)
+
+        Returns:
+            The stored prediction list, each entry marked "cached": True
+        """
+        key = self.key(digest)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return [{**p, "cached": True} for p in entry[1]]
+                del self._memory[key]
+                self._counters["expirations"] += 1
+
+            row = None
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT predictions, created FROM predictions WHERE key = ? AND created >= ?",
+                    (key, now - self.ttl)
+                ).fetchone()
+
+            if row is not None:
+                predictions = json.loads(row[0])
+                self._counters["disk_hits"] += 1
+                self._insert(key, row[1], predictions)
+                return [{**p, "cached": True} for p in predictions]
+
+            if self.shared is None:
+                self._counters["misses"] += 1
+                return None
+            if not shared:
+                return None
+
+        return self.shared_result(self.fetch_shared(digest))
+
+    def fetch_shared(self, digest: str) -> Future:
+        """
+        Start a shared-store read in the background
+
+        Returns:
+            Future for the prediction list (marked "cached": True) or None;
+            pass it to shared_result to wait a bounded time
+        """
+        return self._reader.submit(self._fetch_shared, self.key(digest))
+
+    def shared_result(self, pending: Future) -> Optional[List[Dict[str, Any]]]:
+        """Result of fetch_shared, or None if it is not ready within shared_timeout_s"""
+        try:
+            return pending.result(timeout=self.shared_timeout)
+        except TimeoutError:
+            with self._lock:
+                self._counters["shared_timeouts"] += 1
+                self._counters["misses"] += 1
+            return None
+
+    def _fetch_shared(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """Read the shared store and promote a hit to memory (runs on a reader thread)"""
+        stored = self._shared_get(key, time.time())
+        with self._lock:
+            if stored is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["shared_hits"] += 1
+            self._insert(key, stored["created"], stored["predictions"])
+        return [{**p, "cached": True} for p in stored["predictions"]]
+
+    def put(self, digest: str, predictions: List[Dict[str, Any]]):
+        """Store a successful prediction list (entries with an "error" are skipped)"""
+        if not predictions or any("error" in p for p in predictions):
+            return
+
+        key = self.key(digest)
+        now = time.time()
+        predictions = [{k: v for k, v in p.items() if k != "cached"} for p in predictions]
+
+        with self._lock:
+            self._insert(key, now, predictions)
+
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO predictions (key, predictions, created) VALUES (?, ?, ?)",
+                    (key, json.dumps(predictions), now)
+                )
+                self._writes += 1
+                if self._writes % self.PRUNE_EVERY == 0:
+                    self._db.execute("DELETE FROM predictions WHERE created < ?", (now - self.ttl,))
+
+        if self._writer is not None:
+            self._writer.submit(self._shared_put, key, {
+                "predictions": predictions, "created": now, "expires": now + self.ttl,
+            })
+
+    def put_when_done(self, digest: str, future: Future):
+        """Store a Future's prediction list once it finishes (failures are not stored)"""
+        future.add_done_callback(
+            lambda done: self.put(digest, done.result()) if done.exception() is None else None
+        )
+
+    def _insert(self, key: str, created: float, predictions: List[Dict[str, Any]]):
+        """Add to the memory tier and evict the least recently used (lock held)"""
+        self._memory[key] = (created, predictions)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def _shared_get(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        """Unexpired shared-store entry, or None (store errors count as a miss)"""
+        try:
+            stored = self.shared.get(key)
+        except Exception:
+            with self._lock:
+                self._counters["shared_errors"] += 1
+            return None
+        if stored is None or stored["expires"] < now:
+            return None
+        return stored
+
+    def _shared_put(self, key: str, value: Any):
+        """Write to the shared store (runs on the writer thread)"""
+        try:
+            self.shared.put(key, value)
+        except Exception:
+            with self._lock:
+                self._counters["shared_errors"] += 1
+
+    def close(self):
+        """Finish pending shared writes and close the disk tier"""
+        if self._writer is not None:
+            self._reader.shutdown(wait=False, cancel_futures=True)
+            self._writer.shutdown(wait=True)
+            self._writer = self._reader = None
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit / miss / eviction counters for health checks"""
+        with self._lock:
+            hits = self._counters["memory_hits"] + self._counters["disk_hits"] + self._counters["shared_hits"]
+            lookups = hits + self._counters["misses"]
+            return {
+                "version": self.version,
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "persistent": self.path is not None or self.shared is not None,
+                "shared": self.shared is not None,
+                **self._counters,
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight work by key.
+
+    The first caller for a key starts the work; callers arriving while it
+    runs get the same Future instead of starting their own, so a burst of
+    N identical uploads costs one forward pass. The key is forgotten as
+    soon as the work finishes (the cache takes over from there).
+    Thread-safe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._leaders = 0
+        self._coalesced = 0
+
+    def run(self, key: str, start: Callable[[], Future]) -> Future:
+        """
+        Future for the work identified by `key`
+
+        Args:
+            key: Content hash of the input
+            start: Starts the work and returns its Future; only called by
+                the first caller for the key, outside the lock
+
+        Returns:
+            Future shared by every caller for the key. If `start` raises,
+            the exception is set on it.
+        """
+        with self._lock:
+            shared = self._inflight.get(key)
+            if shared is not None:
+                self._coalesced += 1
+                return shared
+            shared = Future()
+            self._inflight[key] = shared
+            self._leaders += 1
+
+        try:
+            work = start()
+        except Exception as e:
+            self._finish(key, shared, None, e)
+            return shared
+
+        work.add_done_callback(lambda done: self._finish(key, shared, done, done.exception()))
+        return shared
+
+    def _finish(self, key: str, shared: Future, done: Optional[Future], error: Optional[BaseException]):
+        """Forget the key, then hand the outcome to every waiter"""
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            shared.set_exception(error)
+        else:
+            shared.set_result(done.result())
+
+    def stats(self) -> Dict[str, Any]:
+        """Work started and duplicates coalesced, for health checks"""
+        with self._lock:
+            return {
+                "in_flight": len(self._inflight),
+                "leaders": self._leaders,
+                "coalesced": self._coalesced,
+            }
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+INT8 quantization for the CPU serving fleet
+Loads pytorch_model.bin through model_utils, exports it to ONNX and
+quantizes it with ONNX Runtime (dynamic, or static with a calibration folder).
+The INT8 graph is only written if it passes the accuracy gate.
+
+Usage:
+    python quantize_model.py --eval-dir eval_images/
+    python quantize_model.py --method static --calibration-dir calib_images/ --eval-dir eval_images/
+
+The eval folder needs one subfolder per class, named like config.json
+"idx_to_class" (e.g. eval_images/ai/, eval_images/real/). Serve the result
+with "backend": "onnx-int8" in config.json.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from model_utils import load_model_from_checkpoint
+from export_onnx import export_onnx
+from onnx_engine import OnnxEngine
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+
+
+def list_images(folder: str) -> List[Path]:
+    """All image files under a folder, sorted"""
+    return sorted(p for p in Path(folder).rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS)
+
+
+def load_eval_set(eval_dir: str, idx_to_class: Dict[int, str]) -> List[Tuple[Path, int]]:
+    """
+    Collect (image path, class index) pairs from per-class subfolders.
+
+    Args:
+        eval_dir: Folder with one subfolder per class name
+        idx_to_class: Class index to label mapping
+
+    Returns:
+        List of (path, label index)
+    """
+    samples = []
+    for idx, name in idx_to_class.items():
+        class_dir = Path(eval_dir) / name
+        if not class_dir.is_dir():
+            raise FileNotFoundError(f"Missing eval folder for class '{name}': {class_dir}")
+        samples.extend((path, idx) for path in list_images(class_dir))
+
+    if not samples:
+        raise FileNotFoundError(f"No eval images found in {eval_dir}")
+    return samples
+
+
+def balanced_accuracy(labels: List[int], preds: List[int], num_classes: int) -> float:
+    """Mean per-class recall, in percent (same scale as config.json metrics)"""
+    labels = np.asarray(labels)
+    preds = np.asarray(preds)
+
+    recalls = []
+    for cls in range(num_classes):
+        mask = labels == cls
+        if mask.any():
+            recalls.append((preds[mask] == cls).mean())
+
+    return float(np.mean(recalls) * 100.0)
+
+
+def evaluate(engine: OnnxEngine, samples: List[Tuple[Path, int]], batch_size: int = 32) -> float:
+    """Balanced accuracy of an ONNX engine on the eval set"""
+    labels, preds = [], []
+
+    for i in range(0, len(samples), batch_size):
+        chunk = samples[i:i + batch_size]
+        batch = np.stack([engine.preprocess(Image.open(path).convert("RGB")) for path, _ in chunk])
+        preds.extend(engine.forward(batch).argmax(axis=1).tolist())
+        labels.extend(label for _, label in chunk)
+
+    return balanced_accuracy(labels, preds, len(engine.idx_to_class))
+
+
+def accuracy_gate(accuracy: float, recorded: float, max_drop: float) -> Tuple[bool, float]:
+    """
+    Whether a quantized model's balanced accuracy is within max_drop points of the recorded one
+
+    Returns:
+        (passed, threshold), threshold being recorded - max_drop
+    """
+    threshold = recorded - max_drop
+    return accuracy >= threshold, threshold
+
+
+def make_calibration_reader(engine: OnnxEngine, calibration_dir: str, limit: int, batch_size: int = 8):
+    """Feed preprocessed calibration images to quantize_static"""
+    from onnxruntime.quantization import CalibrationDataReader
+
+    paths = list_images(calibration_dir)[:limit]
+    if not paths:
+        raise FileNotFoundError(f"No calibration images found in {calibration_dir}")
+
+    class ImageFolderReader(CalibrationDataReader):
+        def __init__(self):
+            self.batches = iter(range(0, len(paths), batch_size))
+
+        def get_next(self):
+            start = next(self.batches, None)
+            if start is None:
+                return None
+            batch = np.stack([
+                engine.preprocess(Image.open(p).convert("RGB")) for p in paths[start:start + batch_size]
+            ])
+            return {engine.input_name: batch}
+
+    print(f"✓ Calibrating on {len(paths)} images from {calibration_dir}")
+    return ImageFolderReader()
+
+
+def quantize(fp32_path: str, int8_path: str, method: str, fp32_engine: OnnxEngine,
+             calibration_dir: str = None, calibration_limit: int = 256):
+    """
+    Quantize an fp32 ONNX graph to INT8.
+
+    dynamic: INT8 weights, activations quantized on the fly (no data needed)
+    static:  INT8 weights and activations (QDQ, per-channel), calibrated on images
+    """
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+    if method == "dynamic":
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        return
+
+    if not calibration_dir:
+        raise ValueError("Static quantization needs --calibration-dir")
+
+    reader = make_calibration_reader(fp32_engine, calibration_dir, calibration_limit)
+    quantize_static(
+        fp32_path,
+        int8_path,
+        reader,
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize the detector to INT8 with an accuracy gate")
+    parser.add_argument("--checkpoint", default="pytorch_model.bin")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--output", default=None, help="Defaults to config.json \"int8_onnx_path\"")
+    parser.add_argument("--method", choices=["dynamic", "static"], default="dynamic")
+    parser.add_argument("--calibration-dir", help="Images used to calibrate static quantization")
+    parser.add_argument("--calibration-limit", type=int, default=256)
+    parser.add_argument("--eval-dir", required=True, help="Labeled images: one subfolder per class")
+    parser.add_argument("--max-drop", type=float, default=None,
+                        help="Allowed balanced accuracy drop in points (defaults to config.json)")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        config = json.load(f)
+
+    output = args.output or config.get("int8_onnx_path", "model.int8.onnx")
+    max_drop = args.max_drop if args.max_drop is not None else config.get("int8_max_accuracy_drop", 1.0)
+    recorded = config.get("metrics", {}).get("balanced_accuracy")
+    if recorded is None:
+        print("❌ config.json has no metrics.balanced_accuracy to gate against")
+        sys.exit(1)
+
+    model, metadata = load_model_from_checkpoint(args.checkpoint, args.config, device="cpu")
+    idx_to_class = metadata["idx_to_class"]
+    samples = load_eval_set(args.eval_dir, idx_to_class)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fp32_path = export_onnx(model, os.path.join(tmp, "model.fp32.onnx"),
+                                image_size=config.get("image_size", 224))
+        fp32_engine = OnnxEngine(fp32_path, idx_to_class, config)
+
+        int8_tmp = os.path.join(tmp, "model.int8.onnx")
+        quantize(fp32_path, int8_tmp, args.method, fp32_engine,
+                 args.calibration_dir, args.calibration_limit)
+        int8_engine = OnnxEngine(int8_tmp, idx_to_class, config)
+
+        fp32_acc = evaluate(fp32_engine, samples)
+        int8_acc = evaluate(int8_engine, samples)
+        passed, threshold = accuracy_gate(int8_acc, recorded, max_drop)
+
+        print("\n📊 Accuracy gate")
+        print("=" * 60)
+        print(f"  Eval images:                {len(samples)}")
+        print(f"  Recorded balanced accuracy: {recorded:.2f}%")
+        print(f"  fp32 ONNX on eval set:      {fp32_acc:.2f}%")
+        print(f"  INT8 ({args.method}) on eval set: {int8_acc:.2f}%")
+        print(f"  Required (recorded - {max_drop}): {threshold:.2f}%")
+        print("=" * 60)
+
+        if not passed:
+            print(f"❌ INT8 model refused: balanced accuracy {int8_acc:.2f}% < {threshold:.2f}%")
+            sys.exit(1)
+
+        shutil.move(int8_tmp, output)
+
+    print(f"✅ INT8 model written to {output}")
+    print('   Serve it with "backend": "onnx-int8" in config.json')
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,8 @@ CREATE TABLE IF NOT EXISTS public.detections (
     confidence FLOAT NOT NULL CHECK (confidence >= 0 AND confidence <= 1),
     predictions JSONB NOT NULL,
     processing_time_ms INTEGER,
+    content_hash TEXT CHECK (content_hash ~ '^[0-9a-f]{64}$'),
+    duplicate_of UUID REFERENCES public.detections(id) ON DELETE RESTRICT,
     metadata JSONB DEFAULT '{}'::jsonb,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
@@ -22,6 +24,24 @@ CREATE INDEX IF NOT EXISTS idx_detections_user_id ON public.detections(user_id);
 CREATE INDEX IF NOT EXISTS idx_detections_created_at ON public.detections(created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_detections_prediction ON public.detections(prediction);
 
+-- Deduplication: a user's rows are looked up by the SHA-256 of the image
+-- bytes. The user's first row for a hash owns the stored image and the
+-- prediction; their later uploads of the same bytes only add a reference
+-- row (duplicate_of). Rows are never shared between users.
+-- An original cannot be deleted while duplicates point at it (RESTRICT):
+-- delete the duplicates first, so none is left without its image.
+-- (ALTERs bring tables created by earlier versions of this schema up to date)
+ALTER TABLE public.detections ADD COLUMN IF NOT EXISTS content_hash TEXT
+    CHECK (content_hash ~ '^[0-9a-f]{64}$');
+ALTER TABLE public.detections ADD COLUMN IF NOT EXISTS duplicate_of UUID;
+ALTER TABLE public.detections DROP CONSTRAINT IF EXISTS detections_duplicate_of_fkey;
+ALTER TABLE public.detections ADD CONSTRAINT detections_duplicate_of_fkey
+    FOREIGN KEY (duplicate_of) REFERENCES public.detections(id) ON DELETE RESTRICT;
+DROP INDEX IF EXISTS public.idx_detections_content_hash;
+CREATE INDEX IF NOT EXISTS idx_detections_user_content_hash
+    ON public.detections(user_id, content_hash, created_at)
+    WHERE duplicate_of IS NULL;
+
 -- Enable Row Level Security
 ALTER TABLE public.detections ENABLE ROW LEVEL SECURITY;
 
@@ -155,6 +175,12 @@ $$ LANGUAGE plpgsql SECURITY DEFINER;
 -- ORDER BY created_at DESC 
 -- LIMIT 10;
 
+-- Find the user's stored original for an image (as the Vercel handler does)
+-- SELECT * FROM public.detections
+-- WHERE user_id = auth.uid() AND content_hash = '<sha256>' AND duplicate_of IS NULL
+-- ORDER BY created_at
+-- LIMIT 1;
+
 -- Get detection statistics
 -- SELECT * FROM public.detection_stats 
 -- WHERE user_id = auth.uid();
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Tests for the in-container micro-batcher
+Runs without a model: the batch function is a plain Python callable
+"""
+import sys
+import threading
+import time
+
+from batching import MicroBatcher, plan_cpu_threads
+
+
+def test_concurrent_requests_share_a_batch():
+    """Concurrent submits are grouped and each caller gets its own result"""
+    seen_batches = []
+
+    def double(items):
+        seen_batches.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(double, max_batch_size=8, max_wait_ms=50)
+    results = {}
+
+    def worker(i):
+        results[i] = batcher.submit(i)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.close()
+
+    assert results == {i: i * 2 for i in range(8)}, f"Wrong results: {results}"
+    assert len(seen_batches) < 8, f"Requests were not batched: {seen_batches}"
+    assert batcher.stats()["items"] == 8
+
+
+def test_max_batch_size_is_respected():
+    """No batch exceeds max_batch_size"""
+    sizes = []
+
+    def record(items):
+        sizes.append(len(items))
+        return items
+
+    batcher = MicroBatcher(record, max_batch_size=3, max_wait_ms=20)
+    futures = [batcher.submit_async(i) for i in range(10)]
+    assert [f.result(timeout=5) for f in futures] == list(range(10))
+    batcher.close()
+
+    assert max(sizes) <= 3, f"Batch too large: {sizes}"
+
+
+def test_single_request_waits_at_most_max_wait():
+    """A lone request is released once the wait window expires"""
+    batcher = MicroBatcher(lambda items: items, max_batch_size=16, max_wait_ms=20)
+
+    start = time.perf_counter()
+    assert batcher.submit("only") == "only"
+    elapsed = time.perf_counter() - start
+    batcher.close()
+
+    assert elapsed < 1.0, f"Single request took {elapsed:.3f}s"
+
+
+def test_batch_errors_reach_every_caller():
+    """An exception in the batch function is raised for each queued item"""
+    def fail(items):
+        raise ValueError("boom")
+
+    batcher = MicroBatcher(fail, max_batch_size=4, max_wait_ms=10)
+    futures = [batcher.submit_async(i) for i in range(3)]
+
+    for future in futures:
+        try:
+            future.result(timeout=5)
+        except ValueError as e:
+            assert str(e) == "boom"
+        else:
+            raise AssertionError("Expected ValueError")
+    batcher.close()
+
+
+def test_submit_many_shares_one_batch():
+    """Items queued together are scored in one batch, in order"""
+    seen_batches = []
+
+    def double(items):
+        seen_batches.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(double, max_batch_size=8, max_wait_ms=0)
+    futures = batcher.submit_many(list(range(6)))
+    results = [future.result(timeout=5) for future in futures]
+    batcher.close()
+
+    assert results == [i * 2 for i in range(6)], f"Wrong results: {results}"
+    assert seen_batches == [list(range(6))], f"Items were split: {seen_batches}"
+
+
+def test_stages_overlap_and_keep_order():
+    """Stages run on their own threads, so batch N+1 is loaded while N is processed"""
+    active = {"load": 0, "run": 0}
+    overlapped = []
+    lock = threading.Lock()
+
+    def track(stage, other, work):
+        with lock:
+            active[stage] += 1
+            if active[other]:
+                overlapped.append(stage)
+        time.sleep(0.02)
+        result = work()
+        with lock:
+            active[stage] -= 1
+        return result
+
+    load = lambda items: track("load", "run", lambda: list(items))
+    run = lambda items: track("run", "load", lambda: [item + 1 for item in items])
+
+    batcher = MicroBatcher(load, max_batch_size=2, max_wait_ms=1, stages=[("run", run)])
+    futures = [batcher.submit_async(i) for i in range(8)]
+    assert [f.result(timeout=5) for f in futures] == [i + 1 for i in range(8)]
+
+    stages = batcher.stats()["stages"]
+    batcher.close()
+
+    assert overlapped, "Loading never overlapped with the next stage"
+    assert set(stages) == {"batch", "run"}, f"Unexpected stage stats: {stages}"
+    assert stages["run"]["runs"] == stages["batch"]["runs"]
+
+
+def test_stage_errors_reach_every_caller():
+    """An exception in a later stage fails only that batch"""
+    def run(items):
+        if 0 in items:
+            raise ValueError("bad batch")
+        return items
+
+    batcher = MicroBatcher(list, max_batch_size=2, max_wait_ms=50, stages=[("run", run)])
+    bad = [batcher.submit_async(i) for i in (0, 1)]
+    good = batcher.submit_async(2)
+
+    for future in bad:
+        try:
+            future.result(timeout=5)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Expected ValueError")
+    assert good.result(timeout=5) == 2
+    batcher.close()
+
+
+def test_cpu_plan_does_not_oversubscribe():
+    """Decode workers and torch threads split the cores; explicit values win"""
+    assert plan_cpu_threads({}, "cuda", cpus=8) == (4, 4)
+    assert plan_cpu_threads({}, "cpu", cpus=8) == (2, 6)
+    assert plan_cpu_threads({}, "cpu", cpus=1) == (1, 1)
+    assert plan_cpu_threads({"decode_workers": 3, "torch_threads": 2}, "cpu", cpus=8) == (3, 2)
+
+
+if __name__ == "__main__":
+    print("🧪 Micro-batcher Test Suite")
+    print("=" * 60)
+
+    tests = [
+        test_concurrent_requests_share_a_batch,
+        test_max_batch_size_is_respected,
+        test_single_request_waits_at_most_max_wait,
+        test_batch_errors_reach_every_caller,
+        test_submit_many_shares_one_batch,
+        test_stages_overlap_and_keep_order,
+        test_stage_errors_reach_every_caller,
+        test_cpu_plan_does_not_oversubscribe,
+    ]
+
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+
+    print("=" * 60)
+    sys.exit(1 if failed else 0)
@@ -122,6 +122,44 @@ def test_predict_upload(image_path: str = None):
         return False
 
 
+def test_predict_lookup():
+    """Test the content-hash lookup (run after test_predict, which scores the same image)"""
+    print("\n" + "="*60)
+    print("Testing Lookup Endpoint")
+    print("="*60)
+    
+    import hashlib
+    from PIL import Image
+    import io
+    
+    # The synthetic image test_predict sent
+    img = Image.new('RGB', (224, 224), color='red')
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG')
+    sha256 = hashlib.sha256(buffer.getvalue()).hexdigest()
+    
+    response = requests.get(f"{API_URL}/predict/{sha256}")
+    print(f"Status Code: {response.status_code}")
+    if response.status_code != 200:
+        print(f"Error: {response.text}")
+        return False
+    
+    etag = response.headers.get("ETag")
+    print(f"  ETag: {etag}")
+    print(f"  Cache-Control: {response.headers.get('Cache-Control')}")
+    print(f"  Top Prediction: {response.json()['top_prediction']}")
+    
+    # Revalidation with the ETag is a 304 without a body
+    revalidated = requests.get(f"{API_URL}/predict/{sha256}", headers={"If-None-Match": etag})
+    print(f"  Revalidation Status Code: {revalidated.status_code}")
+    
+    # Unknown hashes are a 404
+    unknown = requests.get(f"{API_URL}/predict/{'0' * 64}")
+    print(f"  Unknown Hash Status Code: {unknown.status_code}")
+    
+    return revalidated.status_code == 304 and unknown.status_code == 404
+
+
 def main():
     """Run all tests"""
     print("\n" + "="*60)
@@ -133,6 +171,7 @@ def main():
         "Root": test_root(),
         "Health": test_health(),
         "Predict": test_predict(),
+        "Lookup": test_predict_lookup(),
         "Upload": test_predict_upload()
     }
     
@@ -2,9 +2,16 @@
 """
 Test script to verify model loading and inference works correctly
 Tests both local loading and handler initialization
+
+Run directly for a summary, or with pytest:
+
+    python test_loading.py
+    python -m pytest -q test_loading.py
 """
 import os
 import sys
+import traceback
+import unittest
 import torch
 from PIL import Image
 import io
@@ -52,6 +59,44 @@ def test_handler():
         total_prob = sum(r['score'] for r in result)
         assert 0.99 < total_prob < 1.01, f"Probabilities should sum to 1.0, got {total_prob}"
         
+        # Raw bytes skip base64 and must score the same (the same bytes
+        # again come from the prediction cache when it is enabled)
+        raw_result = handler({"inputs": img_byte_arr})
+        print("Raw bytes result:", raw_result)
+        strip = lambda preds: [{k: v for k, v in p.items() if k != "cached"} for p in preds]
+        assert strip(raw_result) == strip(result), "Raw bytes and base64 inputs should give the same scores"
+        
+        # The sampled frames of an animation share one forward pass
+        frames = [Image.new('RGB', (224, 224), color=(i * 20, 0, 0)) for i in range(12)]
+        gif = io.BytesIO()
+        frames[0].save(gif, format='GIF', save_all=True, append_images=frames[1:], duration=40)
+        before = handler.pipeline.stats()["batches"]
+        frame_result = handler({"inputs": gif.getvalue(), "parameters": {"num_frames": 8}})
+        batches = handler.pipeline.stats()["batches"] - before
+        print(f"Frames: {len(frame_result['frames'])} scored in {batches} batch(es)")
+        assert len(frame_result["frames"]) == 8, f"Expected 8 frames, got {frame_result}"
+        assert batches == 1, f"8 frames should be one batch, took {batches}"
+        
+        # A PIL image in frame mode is scored as a single frame
+        pil_frames = handler({"inputs": frames[3], "parameters": {"num_frames": 8}})
+        assert isinstance(pil_frames, dict), f"PIL input should be scored, got {pil_frames}"
+        assert pil_frames["frame_count"] == 1 and [f["index"] for f in pil_frames["frames"]] == [0]
+        
+        # So do the tiles and global view of a large image
+        large = io.BytesIO()
+        Image.effect_noise((900, 700), 40).convert('RGB').save(large, format='PNG')
+        before = handler.pipeline.stats()["batches"]
+        tile_result = handler({"inputs": large.getvalue(), "parameters": {"tiles": True, "max_tiles": 8}})
+        batches = handler.pipeline.stats()["batches"] - before
+        print(f"Tiles: {len(tile_result['tiles'])} + global scored in {batches} batch(es)")
+        assert len(tile_result["tiles"]) + 1 <= 8 and tile_result["global"] is not None
+        assert batches == 1, f"Tiles should be one batch, took {batches}"
+        
+        # A PIL image is tiled directly, giving the same grid as its bytes
+        pil_tiles = handler({"inputs": Image.open(large), "parameters": {"tiles": True, "max_tiles": 8}})
+        assert isinstance(pil_tiles, dict), f"PIL input should be tiled, got {pil_tiles}"
+        assert [t["box"] for t in pil_tiles["tiles"]] == [t["box"] for t in tile_result["tiles"]]
+        
         print("\n✅ Handler test PASSED!")
         return True
         
@@ -203,16 +248,830 @@ def test_direct_loading():
         return False
 
 
+def test_inference_engine_precision():
+    """Test that reduced precision stays close to fp32"""
+    print("\n" + "=" * 60)
+    print("Testing InferenceEngine precision modes")
+    print("=" * 60)
+    
+    import copy
+    import timm
+    from inference_engine import InferenceEngine, parity_report
+    
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    idx_to_class = {0: "ai", 1: "real"}
+    
+    # Weights do not matter for parity, so a random init is enough
+    model = timm.create_model("efficientformerv2_s1", pretrained=False, num_classes=2)
+    reference = InferenceEngine(copy.deepcopy(model), device, idx_to_class, {"inference_dtype": "fp32"})
+    
+    # fp16 on CUDA, bf16 on CPU
+    dtype = "fp16" if device.type == "cuda" else "bf16"
+    candidate = InferenceEngine(model, device, idx_to_class, {"inference_dtype": dtype})
+    
+    batch = torch.randn(4, 3, 224, 224)
+    report = parity_report(reference.forward(batch), candidate.forward(batch))
+    print(f"Parity ({candidate.dtype_name}): {report}")
+    
+    assert report["max_abs_diff"] < 0.01, f"Drift too large: {report['max_abs_diff']}"
+    
+    results = candidate.predict_tensors(list(batch))
+    assert len(results) == 4, "Should have one result per image"
+    assert all(len(r) == 2 for r in results), "Should have 2 classes per image"
+    
+    print("\n✅ Precision test PASSED!")
+
+
+def test_fold_preprocessing():
+    """Test that the Conv+BN fused, Normalize-folded model matches the original"""
+    print("\n" + "=" * 60)
+    print("Testing Conv+BN fusion and Normalize folding")
+    print("=" * 60)
+    
+    import copy
+    import timm
+    from model_utils import prepare_inference_model, create_preprocessing_transform
+    
+    model = timm.create_model("efficientformerv2_s1", pretrained=False, num_classes=2).eval()
+    
+    # Non-trivial BatchNorm statistics so fusion actually changes the weights
+    for module in model.modules():
+        if isinstance(module, torch.nn.BatchNorm2d):
+            module.running_mean.uniform_(-0.5, 0.5)
+            module.running_var.uniform_(0.5, 2.0)
+    
+    reference = copy.deepcopy(model)
+    folded = prepare_inference_model(model, {})
+    
+    test_image = Image.new('RGB', (300, 200), color='purple')
+    normalized = create_preprocessing_transform({})(test_image).unsqueeze(0)
+    pixels = create_preprocessing_transform({"fold_preprocessing": True})(test_image).unsqueeze(0)
+    assert pixels.dtype == torch.uint8, "Folded pipeline should produce uint8 tensors"
+    
+    with torch.no_grad():
+        expected = reference(normalized)
+        actual = folded(pixels.float())
+    
+    max_diff = (expected - actual).abs().max().item()
+    print(f"Max logit diff: {max_diff:.2e}")
+    assert max_diff < 1e-3, f"Folded model diverges: {max_diff}"
+    
+    remaining = sum(isinstance(m, torch.nn.BatchNorm2d) for m in folded.modules())
+    print(f"BatchNorm layers left: {remaining}")
+    
+    print("\n✅ Folding test PASSED!")
+
+
+def test_input_buffers():
+    """Test that channels_last pooled buffers give the same scores as a plain stack"""
+    print("\n" + "=" * 60)
+    print("Testing channels_last input buffers")
+    print("=" * 60)
+    
+    import copy
+    import timm
+    from inference_engine import InferenceEngine
+    from model_utils import create_preprocessing_transform
+    
+    model = timm.create_model("efficientformerv2_s1", pretrained=False, num_classes=2).eval()
+    idx_to_class = {0: "ai", 1: "real"}
+    config = {"max_batch_size": 4, "input_buffers": 1}
+    
+    plain = InferenceEngine(copy.deepcopy(model), torch.device("cpu"), idx_to_class, config)
+    pooled = InferenceEngine(model, torch.device("cpu"), idx_to_class, {**config, "channels_last": True})
+    
+    transform = create_preprocessing_transform({})
+    tensors = [transform(Image.new('RGB', (64 + i, 48), color=(40 * i, 90, 200))) for i in range(6)]
+    
+    expected = plain.forward(torch.stack(tensors))
+    # 6 images > max_batch_size, so this also covers chunking through one buffer
+    actual = pooled.forward_tensors(tensors)
+    
+    max_diff = (expected - actual).abs().max().item()
+    print(f"Max prob diff: {max_diff:.2e}, buffer misses: {pooled.buffer_misses}")
+    assert max_diff < 1e-4, f"channels_last engine diverges: {max_diff}"
+    assert pooled.buffer_misses == 0, "Sequential batches should reuse the pooled buffer"
+    
+    print("\n✅ Input buffer test PASSED!")
+
+
+def test_warmup():
+    """Test that the engine warms every serving batch size before reporting ready"""
+    print("\n" + "=" * 60)
+    print("Testing warmup and readiness")
+    print("=" * 60)
+    
+    import timm
+    from inference_engine import InferenceEngine
+    
+    model = timm.create_model("efficientformerv2_s1", pretrained=False, num_classes=2).eval()
+    idx_to_class = {0: "ai", 1: "real"}
+    
+    cold = InferenceEngine(model, torch.device("cpu"), idx_to_class, {"max_batch_size": 4, "warmup": False})
+    assert not cold.ready, "Engine should not be ready before warmup"
+    
+    warm = InferenceEngine(model, torch.device("cpu"), idx_to_class, {"max_batch_size": 4})
+    status = warm.describe()
+    print(f"Warmup timings (ms): {status['warmup_ms']}")
+    assert status["ready"], "Engine should be ready after warmup"
+    assert list(status["warmup_ms"]) == [1, 2, 4], f"Unexpected warmup sizes: {status['warmup_ms']}"
+    
+    print("\n✅ Warmup test PASSED!")
+
+
+def test_fast_decode():
+    """Test that reduced-size JPEG decoding stays close to a full decode"""
+    print("\n" + "=" * 60)
+    print("Testing reduced-size JPEG decode")
+    print("=" * 60)
+    
+    from image_io import decode_image
+    from model_utils import create_preprocessing_transform
+    
+    # Smooth gradient with mild noise, roughly like a phone photo
+    gradient = Image.linear_gradient('L').resize((4000, 3000))
+    photo = Image.merge('RGB', (gradient, gradient.rotate(90, expand=False), gradient.transpose(Image.FLIP_LEFT_RIGHT)))
+    photo = Image.blend(photo, Image.effect_noise((4000, 3000), 20).convert('RGB'), 0.2)
+    buffer = io.BytesIO()
+    photo.save(buffer, format='JPEG', quality=90)
+    data = buffer.getvalue()
+    
+    full = decode_image(data)
+    reduced = decode_image(data, 224)
+    print(f"Full decode: {full.size}, reduced decode: {reduced.size}")
+    assert min(reduced.size) >= 224, "Reduced decode went below the model input size"
+    assert reduced.width < full.width, "Draft mode did not shrink the JPEG"
+    
+    transform = create_preprocessing_transform({})
+    max_diff = (transform(full) - transform(reduced)).abs().max().item()
+    print(f"Max normalized pixel diff: {max_diff:.4f}")
+    assert max_diff < 0.1, f"Reduced decode diverges: {max_diff}"
+    
+    print("\n✅ Fast decode test PASSED!")
+
+
+def test_tensor_preprocessing():
+    """Test that uint8 tensor preprocessing matches the PIL + Normalize pipeline"""
+    print("\n" + "=" * 60)
+    print("Testing tensor-native preprocessing")
+    print("=" * 60)
+    
+    import copy
+    import timm
+    from image_io import decode_image
+    from inference_engine import InferenceEngine
+    from model_utils import create_preprocessing_transform
+    
+    model = timm.create_model("efficientformerv2_s1", pretrained=False, num_classes=2).eval()
+    idx_to_class = {0: "ai", 1: "real"}
+    pil_config = {"max_batch_size": 4}
+    tensor_config = {**pil_config, "preprocessing": "tensor"}
+    
+    pil_engine = InferenceEngine(copy.deepcopy(model), torch.device("cpu"), idx_to_class, pil_config)
+    tensor_engine = InferenceEngine(model, torch.device("cpu"), idx_to_class, tensor_config)
+    
+    encoded = []
+    for i, fmt in enumerate(["JPEG", "PNG", "WEBP"]):
+        buffer = io.BytesIO()
+        Image.effect_noise((640 + 32 * i, 480), 40).convert('RGB').save(buffer, format=fmt)
+        encoded.append(buffer.getvalue())
+    
+    pil_transform = create_preprocessing_transform(pil_config)
+    tensor_transform = create_preprocessing_transform(tensor_config)
+    tensors = [tensor_transform(decode_image(data, as_tensor=True)) for data in encoded]
+    assert all(t.dtype == torch.uint8 for t in tensors), "Tensor pipeline should stay in uint8"
+    
+    expected = pil_engine.forward_tensors([pil_transform(decode_image(data)) for data in encoded])
+    actual = tensor_engine.forward_tensors(tensors)
+    
+    max_diff = (expected - actual).abs().max().item()
+    print(f"Max prob diff: {max_diff:.2e}")
+    assert max_diff < 1e-3, f"Tensor preprocessing diverges: {max_diff}"
+    
+    print("\n✅ Tensor preprocessing test PASSED!")
+
+
+def test_input_limits():
+    """Test that oversized and malformed inputs are rejected from the header alone"""
+    print("\n" + "=" * 60)
+    print("Testing pre-decode input limits")
+    print("=" * 60)
+    
+    import base64
+    from image_io import ImageRejected, check_encoded_size, decode_image, input_limits
+    
+    limits = input_limits({"input_limits": {"max_pixels": 4_000_000, "max_frames": 5}})
+    
+    def encode(image, fmt, **kwargs):
+        buffer = io.BytesIO()
+        image.save(buffer, format=fmt, **kwargs)
+        return buffer.getvalue()
+    
+    frames = [Image.effect_noise((32, 32), 10 + i).convert('P') for i in range(8)]
+    rejected = {
+        "too many pixels": encode(Image.new('L', (4000, 4000)), 'PNG'),
+        "too many frames": encode(frames[0], 'GIF', save_all=True, append_images=frames[1:]),
+        "unsupported format": encode(Image.new('RGB', (64, 64)), 'TIFF'),
+        "not an image": b"definitely not an image",
+    }
+    
+    for name, data in rejected.items():
+        try:
+            decode_image(data, 224, limits=limits)
+        except ImageRejected as e:
+            print(f"  Rejected ({name}): {e}")
+        else:
+            raise AssertionError(f"Input with {name} was accepted")
+    
+    try:
+        check_encoded_size("A" * (limits["max_bytes"] * 2), limits)
+    except ImageRejected as e:
+        assert e.status_code == 413, "Oversized payloads should map to 413"
+    else:
+        raise AssertionError("Oversized base64 payload was accepted")
+    
+    ok = encode(Image.new('RGB', (640, 480), color='teal'), 'JPEG')
+    check_encoded_size(base64.b64encode(ok).decode(), limits)
+    assert min(decode_image(ok, 224, limits=limits).size) >= 224
+    
+    print("\n✅ Input limits test PASSED!")
+
+
+def test_frame_sampling():
+    """Test that animated inputs are sampled, decoded per frame and aggregated"""
+    print("\n" + "=" * 60)
+    print("Testing multi-frame sampling")
+    print("=" * 60)
+    
+    from frames import aggregate_predictions, decode_frames, uniform_indices
+    from image_io import decode_image
+    
+    # Three scenes of 10 frames each, with a little motion inside each scene
+    colors = ['red', 'green', 'blue']
+    frames = [
+        Image.new('RGB', (320, 240), color=colors[i // 10]).rotate(i % 10)
+        for i in range(30)
+    ]
+    for fmt in ('GIF', 'WEBP'):
+        buffer = io.BytesIO()
+        frames[0].save(buffer, format=fmt, save_all=True, append_images=frames[1:], duration=40)
+        data = buffer.getvalue()
+        
+        decoded, indices, total = decode_frames(data, 6, "uniform", target_size=224)
+        print(f"{fmt} uniform: {indices} of {total}")
+        assert total == 30, f"Expected 30 frames, got {total}"
+        assert indices == uniform_indices(30, 6) == [2, 7, 12, 17, 22, 27]
+        assert len(decoded) == 6 and all(min(frame.size) >= 224 for frame in decoded)
+        
+        _, scene_indices, _ = decode_frames(data, 3, "scene")
+        print(f"{fmt} scene: {scene_indices}")
+        assert scene_indices == [0, 10, 20], f"Scene cuts not found: {scene_indices}"
+        
+        # Single-image scoring keeps using the first frame on both decode paths
+        first = decode_image(data, 224, as_tensor=True)
+        assert first.shape[0] == 3 and first.ndim == 3, f"Expected one CHW frame, got {tuple(first.shape)}"
+    
+    # Still images have a single frame
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64)).save(buffer, format='PNG')
+    _, indices, total = decode_frames(buffer.getvalue(), 8, "scene")
+    assert indices == [0] and total == 1
+    
+    aggregate = aggregate_predictions([
+        [{"label": "AI", "score": 0.9}, {"label": "REAL", "score": 0.1}],
+        [{"label": "REAL", "score": 0.7}, {"label": "AI", "score": 0.3}],
+    ])
+    assert aggregate[0]["label"] == "AI" and abs(aggregate[0]["score"] - 0.6) < 1e-9
+    
+    print("\n✅ Frame sampling test PASSED!")
+
+
+def test_tiling():
+    """Test the tile grid, the latency-budget cap and the heatmap layout"""
+    print("\n" + "=" * 60)
+    print("Testing tiled inference")
+    print("=" * 60)
+    
+    from types import SimpleNamespace
+    import numpy as np
+    from model_utils import create_preprocessing_transform
+    from tiling import plan_tiles, score_tiles, tile_limit
+    
+    # 1000x700 needs a 5x4 grid; a limit of 12 thins it but keeps native-size tiles
+    rows, cols, boxes = plan_tiles(1000, 700, 224, 20)
+    assert (rows, cols) == (4, 5) and len(boxes) == 20
+    assert boxes[0][:2] == (0, 0) and boxes[-1][2:] == (1000, 700), "Grid should reach the edges"
+    rows, cols, boxes = plan_tiles(1000, 700, 224, 12)
+    print(f"Thinned grid: {rows}x{cols}")
+    assert rows * cols <= 12 and all(r - l == 224 and b - t == 224 for l, t, r, b in boxes)
+    assert plan_tiles(100, 80, 224, 16)[2] == [(0, 0, 100, 80)], "Small images are one tile"
+    
+    # 10 ms per image at batch 8 and a 50 ms budget allows 5 tiles
+    engine = SimpleNamespace(warmup_timings={1: 20.0, 8: 80.0})
+    assert tile_limit(engine, {"max_tiles": 16, "tile_budget_ms": 50}) == 5
+    assert tile_limit(engine, {"max_tiles": 4}) == 4
+    
+    calls = []
+    
+    def score(views):
+        calls.append(len(views))
+        return [[{"label": "AI", "score": 0.25 * i}, {"label": "REAL", "score": 1 - 0.25 * i}]
+                for i in range(len(views))]
+    
+    image = Image.effect_noise((700, 460), 40).convert('RGB')
+    for preprocessing in ("pil", "tensor"):
+        transform = create_preprocessing_transform({"preprocessing": preprocessing})
+        view = image if preprocessing == "pil" else torch.from_numpy(np.array(image)).permute(2, 0, 1)
+        result = score_tiles(view, transform, score, tile_size=224, max_tiles=7, global_view=True)
+        print(f"{preprocessing}: grid {result['grid']}, heatmap {result['heatmap']}")
+        assert calls[-1] == len(result["tiles"]) + 1 <= 7, "All views should be scored in one call"
+        assert result["grid"] == [2, 3] and len(result["heatmap"]) == 2 and len(result["heatmap"][0]) == 3
+        assert result["heatmap"][1][0] == 0.75 and result["global"][0]["score"] == 1.5
+    
+    # The global view counts against max_tiles; a cap of 1 keeps one tile and no global view
+    result = score_tiles(image, transform, score, tile_size=224, max_tiles=1, global_view=True)
+    assert calls[-1] == 1 and len(result["tiles"]) == 1 and result["global"] is None
+    result = score_tiles(image, transform, score, tile_size=224, max_tiles=2, global_view=True)
+    assert calls[-1] == 2 and len(result["tiles"]) == 1 and result["global"] is not None
+    
+    print("\n✅ Tiling test PASSED!")
+
+
+def test_provenance():
+    """Test that generator metadata is read from the header and matched against the rules"""
+    print("\n" + "=" * 60)
+    print("Testing provenance-metadata fast path")
+    print("=" * 60)
+    
+    import struct
+    from PIL import PngImagePlugin
+    from provenance import ProvenanceCheck, read_provenance
+    
+    image = Image.new('RGB', (64, 64), color='gray')
+    
+    def encode(fmt, **kwargs):
+        buffer = io.BytesIO()
+        image.save(buffer, format=fmt, **kwargs)
+        return buffer.getvalue()
+    
+    exif = Image.Exif()
+    exif[0x0131] = "Midjourney v6"
+    png_info = PngImagePlugin.PngInfo()
+    png_info.add_text("parameters", "a cat\nSteps: 20, Sampler: Euler a, CFG scale: 7")
+    xmp = (b'<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF><rdf:Description '
+           b'Iptc4xmpExt:DigitalSourceType="http://cv.iptc.org/newscodes/digitalsourcetype/'
+           b'trainedAlgorithmicMedia"/></rdf:RDF></x:xmpmeta>')
+    # Minimal C2PA JUMBF payload in a JPEG APP11 segment
+    manifest = (b"jumb\x00c2pa\x00\x6fclaim_generator\x67ChatGPT"
+                b"http://cv.iptc.org/newscodes/digitalsourcetype/trainedAlgorithmicMedia")
+    plain = encode('JPEG')
+    c2pa = plain[:2] + b"\xff\xeb" + struct.pack(">H", len(manifest) + 2) + manifest + plain[2:]
+    
+    expected = {
+        "exif software": (encode('JPEG', exif=exif), "generator-software"),
+        "png parameters": (encode('PNG', pnginfo=png_info), "diffusion-parameters"),
+        "xmp source type": (encode('JPEG', xmp=xmp), "xmp-generated"),
+        "c2pa manifest": (c2pa, "c2pa-generated"),
+    }
+    
+    check = ProvenanceCheck({"provenance": {"enabled": True}}, ["ai", "real"])
+    for name, (data, rule) in expected.items():
+        result = check(data)
+        print(f"  {name}: {read_provenance(data)} -> {result[0]['evidence']['rule']}")
+        assert result[0]["label"] == "AI" and result[0]["source"] == "metadata"
+        assert result[0]["evidence"]["rule"] == rule
+        assert abs(sum(r["score"] for r in result) - 1.0) < 1e-6
+    
+    assert check(plain) is None, "Untagged images must go to the model"
+    assert check.stats()["checked"] == 5 and sum(check.stats()["hits"].values()) == 4
+    assert read_provenance(c2pa)["c2pa_claim_generator"] == "ChatGPT"
+    
+    # Disabled by default; custom rules replace the defaults
+    assert ProvenanceCheck({}, ["ai", "real"])(expected["exif software"][0]) is None
+    camera = ProvenanceCheck({"provenance": {"enabled": True, "rules": [
+        {"name": "trusted-camera", "field": "make", "pattern": "^Leica$", "label": "real", "score": 0.9}
+    ]}}, ["ai", "real"])
+    exif = Image.Exif()
+    exif[0x010F] = "Leica"
+    result = camera(encode('JPEG', exif=exif))
+    assert result[0]["label"] == "REAL" and result[0]["score"] == 0.9
+    assert camera(expected["exif software"][0]) is None
+    
+    print("\n✅ Provenance test PASSED!")
+
+
+def test_prediction_cache():
+    """Test the content-hash prediction cache: LRU, TTL, disk and shared tiers and versioning"""
+    print("\n" + "=" * 60)
+    print("Testing prediction cache")
+    print("=" * 60)
+    
+    import tempfile
+    import time
+    from prediction_cache import PredictionCache, content_hash, model_version
+    
+    predictions = [{"label": "AI", "score": 0.9}, {"label": "REAL", "score": 0.1}]
+    digests = [content_hash(bytes([i]) * 100) for i in range(3)]
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "predictions.sqlite")
+        
+        cache = PredictionCache("v1", max_entries=2, path=path)
+        assert cache.get(digests[0]) is None
+        for digest in digests:
+            cache.put(digest, predictions)
+        hit = cache.get(digests[2])
+        assert hit == [{**p, "cached": True} for p in predictions]
+        
+        # The oldest entry left memory but is still on disk
+        assert cache.stats()["evictions"] == 1
+        assert cache.get(digests[0]) is not None and cache.stats()["disk_hits"] == 1
+        
+        # Errors are never stored
+        cache.put(content_hash(b"bad"), [{"error": "Prediction failed"}])
+        assert cache.get(content_hash(b"bad")) is None
+        cache.close()
+        
+        # The disk tier survives a restart; another model version starts cold
+        restarted = PredictionCache("v1", path=path)
+        assert restarted.get(digests[1]) is not None
+        assert PredictionCache("v2", path=path).get(digests[1]) is None
+        stats = restarted.stats()
+        print(f"  Stats after restart: {stats}")
+        assert stats["disk_hits"] == 1 and stats["misses"] == 0
+        
+        # Entries expire after ttl_s
+        expiring = PredictionCache("v1", ttl_s=0.05)
+        expiring.put(digests[0], predictions)
+        time.sleep(0.1)
+        assert expiring.get(digests[0]) is None and expiring.stats()["expirations"] == 1
+    
+    class SharedStore(dict):
+        """Dict with modal.Dict's get / put, optionally unreachable or slow"""
+        down = False
+        delay = 0.0
+        reads = 0
+        
+        def get(self, key, default=None):
+            self.reads += 1
+            time.sleep(self.delay)
+            if self.down:
+                raise ConnectionError("store unreachable")
+            return super().get(key, default)
+        
+        def put(self, key, value):
+            self[key] = value
+    
+    # One replica's results are hits for another, and the version is published
+    store = SharedStore()
+    writer = PredictionCache("v1", shared=store)
+    writer.put(digests[0], predictions)
+    writer.close()
+    assert store[PredictionCache.VERSION_KEY] == "v1" and writer.key(digests[0]) in store
+    reader = PredictionCache("v1", shared=store)
+    assert reader.get(digests[0]) == [{**p, "cached": True} for p in predictions]
+    assert reader.get(digests[0]) is not None, "Shared hits should be promoted to memory"
+    assert PredictionCache("v2", shared=store).get(digests[0]) is None
+    stats = reader.stats()
+    assert stats["shared_hits"] == 1 and stats["memory_hits"] == 1 and stats["shared"]
+    
+    # Expired shared entries and an unreachable store are misses, not failures
+    store[writer.key(digests[1])] = {"predictions": predictions, "created": 0.0, "expires": 1.0}
+    assert reader.get(digests[1]) is None
+    store.down = True
+    assert reader.get(digests[2]) is None and reader.stats()["shared_errors"] == 1
+    store.down = False
+    
+    # A slow store costs at most shared_timeout_s, and local-only reads never reach it
+    store.delay = 0.5
+    started = time.perf_counter()
+    assert reader.get(content_hash(b"slow")) is None
+    assert time.perf_counter() - started < 0.3 and reader.stats()["shared_timeouts"] == 1
+    reads = store.reads
+    assert reader.get(content_hash(b"local"), shared=False) is None and store.reads == reads
+    
+    # An early fetch overlaps with other work and is picked up afterwards
+    store.delay = 0.1
+    store[reader.key(content_hash(b"early"))] = {"predictions": predictions, "created": time.time(), "expires": time.time() + 60}
+    pending = reader.fetch_shared(content_hash(b"early"))
+    time.sleep(0.15)
+    assert reader.shared_result(pending) == [{**p, "cached": True} for p in predictions]
+    reader.close()
+    
+    # Disabled unless configured; the version follows the weights unless pinned
+    assert PredictionCache.from_config({}, "v1") is None
+    assert model_version({"model_version": "2025-10"}) == "2025-10"
+    with tempfile.NamedTemporaryFile() as weights:
+        weights.write(b"weights")
+        weights.flush()
+        assert model_version({}, weights.name) == content_hash(b"weights")[:16]
+    
+    print("\n✅ Prediction cache test PASSED!")
+
+
+def test_single_flight():
+    """Test that identical in-flight predictions are coalesced into one"""
+    print("\n" + "=" * 60)
+    print("Testing single-flight coalescing")
+    print("=" * 60)
+    
+    import threading
+    from concurrent.futures import Future
+    from prediction_cache import SingleFlight
+    
+    inflight = SingleFlight()
+    work = Future()
+    starts = []
+    
+    def start():
+        starts.append(1)
+        return work
+    
+    # A burst of identical requests while the first is still running
+    shared = []
+    threads = [threading.Thread(target=lambda: shared.append(inflight.run("abc", start))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(starts) == 1, f"Work should start once, started {len(starts)} times"
+    assert all(future is shared[0] for future in shared)
+    assert inflight.stats() == {"in_flight": 1, "leaders": 1, "coalesced": 7}
+    
+    predictions = [{"label": "AI", "score": 0.9}, {"label": "REAL", "score": 0.1}]
+    work.set_result(predictions)
+    assert all(future.result() == predictions for future in shared)
+    assert inflight.stats()["in_flight"] == 0
+    
+    # Finished keys are forgotten; failures reach every waiter
+    def fail():
+        raise ValueError("bad image")
+    failed = inflight.run("abc", fail)
+    assert isinstance(failed.exception(), ValueError) and inflight.stats()["leaders"] == 2
+    
+    print(f"  Stats: {inflight.stats()}")
+    print("\n✅ Single-flight test PASSED!")
+
+
+def test_near_duplicates():
+    """Test that re-encoded copies match by perceptual hash and unrelated images do not"""
+    print("\n" + "=" * 60)
+    print("Testing near-duplicate index")
+    print("=" * 60)
+    
+    import time
+    import numpy as np
+    from image_io import decode_image
+    from near_duplicates import NearDuplicateIndex, dhash, hamming_distances, _POPCOUNT
+    
+    rng = np.random.default_rng(0)
+    
+    def textured(seed):
+        pixels = np.random.default_rng(seed).integers(0, 256, (8, 12, 3), dtype=np.uint8)
+        return Image.fromarray(pixels).resize((1200, 800), Image.BICUBIC)
+    
+    def encode(image, fmt, **kwargs):
+        buffer = io.BytesIO()
+        image.save(buffer, format=fmt, **kwargs)
+        return buffer.getvalue()
+    
+    original = textured(1)
+    copies = {
+        "resized": encode(original.resize((600, 400)), 'PNG'),
+        "recompressed": encode(original, 'JPEG', quality=40),
+        "webp": encode(original.resize((900, 600)), 'WEBP', quality=60),
+    }
+    
+    index = NearDuplicateIndex(["ai", "real"], max_distance=6, max_entries=4)
+    predictions = [{"label": "AI", "score": 0.8}, {"label": "REAL", "score": 0.2}]
+    index.add(dhash(decode_image(encode(original, 'PNG'), 224)), predictions)
+    
+    for name, data in copies.items():
+        for as_tensor in (False, True):
+            match = index.lookup(dhash(decode_image(data, 224, as_tensor=as_tensor)))
+            print(f"  {name} (tensor={as_tensor}): distance {match and match[0]['match_distance']}")
+            assert match is not None and match[0]["label"] == "AI" and match[0]["cached"]
+            assert abs(match[0]["score"] - 0.8) < 1e-6
+    
+    assert index.lookup(dhash(textured(2))) is None, "Unrelated images must not match"
+    assert index.lookup(dhash(Image.new('RGB', (64, 64), 'red'))) is None, "Flat images are never matched"
+    
+    # Oldest entries are overwritten once full
+    for i in range(5):
+        index.add(int(rng.integers(1, 2**63)), predictions)
+    assert index.stats()["entries"] == 4 and index.stats()["evictions"] == 2
+    
+    # Popcount fallback agrees with np.bitwise_count
+    hashes = rng.integers(0, 2**63, 1000, dtype=np.int64).astype(np.uint64)
+    fallback = _POPCOUNT[np.bitwise_xor(hashes, np.uint64(12345)).view(np.uint8)].reshape(-1, 8).sum(axis=1)
+    assert (hamming_distances(hashes, 12345) == fallback).all()
+    
+    # Lookup cost at a million entries
+    large = NearDuplicateIndex(["ai", "real"], max_entries=1_000_000)
+    large._hashes[:] = rng.integers(0, 2**63, 1_000_000, dtype=np.int64).astype(np.uint64)
+    large._size = 1_000_000
+    start = time.perf_counter()
+    large.lookup(dhash(original))
+    print(f"  Lookup over 1M entries: {(time.perf_counter() - start) * 1000:.1f} ms")
+    
+    # A match in the last scan chunk is found; lookups run alongside adds
+    target = dhash(original)
+    large._hashes[999_999] = target ^ 0b101
+    large._scores[999_999] = [0.3, 0.7]
+    assert large.lookup(target)[0]["match_distance"] == 2
+    
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(8) as pool:
+        start = time.perf_counter()
+        adds = [pool.submit(large.add, int(rng.integers(1, 2**63)), predictions) for _ in range(8)]
+        found = list(pool.map(lambda _: large.lookup(target), range(16)))
+        elapsed = (time.perf_counter() - start) * 1000
+        [add.result() for add in adds]
+    print(f"  16 concurrent lookups over 1M entries: {elapsed:.1f} ms")
+    assert all(match is not None and match[0]["label"] == "REAL" for match in found)
+    
+    print("\n✅ Near-duplicate test PASSED!")
+
+
+def test_autotune():
+    """Test that the autotuner picks a backend that matches fp32"""
+    print("\n" + "=" * 60)
+    print("Testing backend autotuner")
+    print("=" * 60)
+    
+    import timm
+    from autotune import autotune
+    
+    model = timm.create_model("efficientformerv2_s1", pretrained=False, num_classes=2).eval()
+    config = {
+        "max_batch_size": 2,
+        "autotune_candidates": ["fp32", "reduced", "onnx"],
+        "autotune_iterations": 1,
+    }
+    
+    engine, transform, report = autotune(model, torch.device("cpu"), {0: "ai", 1: "real"}, config)
+    
+    for row in report["candidates"]:
+        print(f"  {row['name']:16s} {row['status']}")
+    print(f"Selected: {report['selected']}")
+    
+    names = [row["name"] for row in report["candidates"]]
+    assert names[0] == "torch-fp32", "fp32 reference should run first"
+    assert report["selected"] in names, "Selected backend missing from the timing table"
+    
+    preds = engine.predict_tensors([transform(Image.new('RGB', (300, 200), color='orange'))])[0]
+    assert {p["label"] for p in preds} == {"AI", "REAL"}, f"Unexpected labels: {preds}"
+    
+    print("\n✅ Autotune test PASSED!")
+
+
+def test_onnx_backend():
+    """Test that the ONNX Runtime engine matches the PyTorch engine"""
+    print("\n" + "=" * 60)
+    print("Testing ONNX export and OnnxEngine")
+    print("=" * 60)
+    
+    try:
+        import tempfile
+        import timm
+        from export_onnx import export_onnx
+        from inference_engine import InferenceEngine
+        from onnx_engine import OnnxEngine
+        from model_utils import create_preprocessing_transform
+    except ImportError as e:
+        raise unittest.SkipTest(f"{e}, skipping ONNX test")
+    
+    idx_to_class = {0: "ai", 1: "real"}
+    model = timm.create_model("efficientformerv2_s1", pretrained=False, num_classes=2).eval()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        onnx_path = export_onnx(model, os.path.join(tmp, "model.onnx"))
+        onnx_engine = OnnxEngine(onnx_path, idx_to_class, {})
+        torch_engine = InferenceEngine(model, torch.device("cpu"), idx_to_class, {})
+        
+        transform = create_preprocessing_transform()
+        images = [Image.new('RGB', (320, 240), color=c) for c in ('red', 'green', 'blue')]
+        
+        # Dynamic batch axis: score all three in one run
+        onnx_results = onnx_engine.predict_tensors([onnx_engine.preprocess(img) for img in images])
+        torch_results = torch_engine.predict_tensors([transform(img) for img in images])
+    
+    for onnx_preds, torch_preds in zip(onnx_results, torch_results):
+        print(f"ONNX: {onnx_preds}  Torch: {torch_preds}")
+        assert onnx_preds[0]["label"] == torch_preds[0]["label"], "Top label should match"
+        assert abs(onnx_preds[0]["score"] - torch_preds[0]["score"]) < 1e-4, "Scores should match"
+    
+    print("\n✅ ONNX backend test PASSED!")
+
+
+def test_int8_gate():
+    """Test balanced accuracy and the INT8 accuracy gate in quantize_model"""
+    print("\n" + "=" * 60)
+    print("Testing INT8 accuracy gate")
+    print("=" * 60)
+    
+    try:
+        import tempfile
+        import numpy as np
+        from quantize_model import accuracy_gate, balanced_accuracy, evaluate, load_eval_set
+    except ImportError as e:
+        raise unittest.SkipTest(f"{e}, skipping INT8 gate test")
+    
+    # 8 AI / 2 REAL: always answering AI is 80% accurate but 50% balanced
+    labels = [0] * 8 + [1] * 2
+    assert balanced_accuracy(labels, [0] * 10, 2) == 50.0
+    assert balanced_accuracy(labels, labels, 2) == 100.0
+    assert abs(balanced_accuracy(labels, [0] * 7 + [1] * 3, 2) - 93.75) < 1e-9
+    # Classes absent from the eval set are left out of the mean
+    assert balanced_accuracy([0, 0], [0, 1], 3) == 50.0
+    
+    assert accuracy_gate(98.5, recorded=99.0, max_drop=1.0) == (True, 98.0)
+    assert accuracy_gate(98.0, recorded=99.0, max_drop=1.0)[0], "Exactly at the tolerance should pass"
+    assert not accuracy_gate(97.9, recorded=99.0, max_drop=1.0)[0]
+    
+    class StandInEngine:
+        """Scores red as AI and everything else as REAL, optionally misreading blue"""
+        idx_to_class = {0: "ai", 1: "real"}
+        
+        def __init__(self, degraded):
+            self.degraded = degraded
+        
+        def preprocess(self, image):
+            return np.asarray(image, dtype=np.float32).mean(axis=(0, 1))
+        
+        def forward(self, batch):
+            is_red = batch[:, 0] > batch[:, 2]
+            is_blue = batch[:, 2] > batch[:, 0]
+            ai = is_red | (is_blue & self.degraded)
+            return np.stack([ai, ~ai], axis=1).astype(np.float32)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, colors in (("ai", ["red"] * 4), ("real", ["green", "green", "blue", "blue"])):
+            os.makedirs(os.path.join(tmp, name))
+            for i, color in enumerate(colors):
+                Image.new('RGB', (32, 32), color=color).save(os.path.join(tmp, name, f"{i}.png"))
+        
+        samples = load_eval_set(tmp, StandInEngine.idx_to_class)
+        fp32_acc = evaluate(StandInEngine(degraded=False), samples, batch_size=3)
+        int8_acc = evaluate(StandInEngine(degraded=True), samples, batch_size=3)
+    
+    print(f"fp32: {fp32_acc:.2f}%  int8: {int8_acc:.2f}%")
+    assert fp32_acc == 100.0 and int8_acc == 75.0
+    
+    assert accuracy_gate(fp32_acc, recorded=99.0, max_drop=1.0)[0], "Unchanged model should pass"
+    passed, threshold = accuracy_gate(int8_acc, recorded=99.0, max_drop=1.0)
+    assert not passed and threshold == 98.0, "Quantized model 24 points down should be refused"
+    
+    print("\n✅ INT8 gate test PASSED!")
+
+
+def run(name, test):
+    """
+    Run one test for the summary below
+    Returns:
+        True if it passed, False if it returned False or raised, None if skipped
+    """
+    try:
+        result = test()
+    except unittest.SkipTest as e:
+        print(f"⚠ {e}")
+        return None
+    except Exception as e:
+        print(f"\n❌ {name} test FAILED: {e}")
+        traceback.print_exc()
+        return False
+    return True if result is None else result
+
+
 if __name__ == "__main__":
     print("🧪 AI vs Real Detector - Model Loading Test Suite")
     print("=" * 60)
     
-    results = []
+    tests = [
+        ("Handler", test_handler),
+        ("Model Utils", test_model_utils),
+        ("Direct Loading", test_direct_loading),
+        ("Engine Precision", test_inference_engine_precision),
+        ("Folded Model", test_fold_preprocessing),
+        ("Input Buffers", test_input_buffers),
+        ("ONNX Backend", test_onnx_backend),
+        ("INT8 Gate", test_int8_gate),
+        ("Warmup", test_warmup),
+        ("Fast Decode", test_fast_decode),
+        ("Tensor Preprocessing", test_tensor_preprocessing),
+        ("Input Limits", test_input_limits),
+        ("Frame Sampling", test_frame_sampling),
+        ("Tiling", test_tiling),
+        ("Provenance", test_provenance),
+        ("Prediction Cache", test_prediction_cache),
+        ("Single Flight", test_single_flight),
+        ("Near Duplicates", test_near_duplicates),
+        ("Autotune", test_autotune),
+    ]
     
     # Run all tests
-    results.append(("Handler", test_handler()))
-    results.append(("Model Utils", test_model_utils()))
-    results.append(("Direct Loading", test_direct_loading()))
+    results = [(name, run(name, test)) for name, test in tests]
     
     # Summary
     print("\n" + "=" * 60)
@@ -50,6 +50,205 @@ def test_prediction():
             print(f"❌ Unexpected result format: {result}")
             return False
 
+def test_app_registration():
+    # The web app and the model class must both be deployed functions
+    registered = list(app.registered_functions)
+    print(f"✓ Registered functions: {registered}")
+    assert "fastapi_app" in registered, "fastapi_app is not registered on the app"
+    assert "AIDetectorModel.*" in registered, "AIDetectorModel is not registered on the app"
+    assert "predict_lookup" not in registered, "Routes must not be registered as Modal functions"
+
+
+def test_lookup_endpoint():
+    # GET /predict/{sha256} reads the shared prediction store, without Modal
+    import time
+    from fastapi.testclient import TestClient
+    import modal_app
+    from prediction_cache import PredictionCache
+
+    class AsyncGet:
+        def __init__(self, values):
+            self.values = values
+
+        async def aio(self, key):
+            return self.values.get(key)
+
+    class Store:
+        def __init__(self, values):
+            self.get = AsyncGet(values)
+
+    sha256 = "ab" * 32
+    predictions = [{"label": "AI", "score": 0.9}, {"label": "REAL", "score": 0.1}]
+    store = Store({
+        PredictionCache.VERSION_KEY: "v1",
+        f"v1:{sha256}": {"predictions": predictions, "created": time.time(), "expires": time.time() + 60},
+        f"v1:{'cd' * 32}": {"predictions": predictions, "created": 0.0, "expires": 1.0},
+    })
+
+    original = modal_app.prediction_store
+    modal_app.prediction_store = store
+    try:
+        client = TestClient(modal_app.web_app)
+
+        hit = client.get(f"/predict/{sha256.upper()}")
+        print(f"✓ Lookup hit: {hit.status_code} {hit.json()}")
+        assert hit.status_code == 200 and hit.json()["top_prediction"] == "AI"
+        assert hit.json()["cached"] is True and hit.json()["model_version"] == "v1"
+        assert hit.headers["etag"] == f'"v1-{sha256}"'
+
+        revalidated = client.get(f"/predict/{sha256}", headers={"If-None-Match": hit.headers["etag"]})
+        assert revalidated.status_code == 304
+
+        assert client.get(f"/predict/{'cd' * 32}").status_code == 404, "Expired entries are misses"
+        missing = client.get(f"/predict/{'ef' * 32}")
+        assert missing.status_code == 404 and missing.headers["cache-control"] == "no-store"
+        assert client.get("/predict/not-a-hash").status_code == 422
+    finally:
+        modal_app.prediction_store = original
+
+
+class StubModel:
+    """
+    Stands in for AIDetectorModel() in the web endpoints: predict and
+    predict_batch answer through .remote.aio and record what they were sent
+    """
+
+    def __init__(self):
+        self.calls = []
+        test = self
+
+        class Method:
+            def __init__(self, name, answer):
+                self.remote = self
+                self.name, self.answer = name, answer
+
+            async def aio(self, *args):
+                test.calls.append((self.name, args))
+                return self.answer(*args)
+
+            def __call__(self, *args):
+                raise AssertionError(f"Blocking {self.name}.remote() called from an async endpoint")
+
+        self.predict = Method("predict", self.score)
+        self.predict_batch = Method("predict_batch", lambda images: [self.score(image) for image in images])
+
+    @staticmethod
+    def score(image_bytes):
+        assert isinstance(image_bytes, bytes), "The model should be sent raw bytes"
+        if not image_bytes.startswith(b"\x89PNG"):
+            return [{"error": "Prediction failed: cannot identify image file"}]
+        return [{"label": "AI", "score": 0.75}, {"label": "REAL", "score": 0.25}]
+
+
+def _stub_client():
+    """TestClient for the web app with AIDetectorModel replaced by a StubModel"""
+    from fastapi.testclient import TestClient
+    import modal_app
+
+    stub = StubModel()
+    modal_app.AIDetectorModel = lambda: stub
+    return TestClient(modal_app.web_app), stub
+
+
+def _png(color="red"):
+    from PIL import Image
+    import io
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (32, 32), color=color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_batch_endpoint():
+    # /predict/batch streams its body into predict_batch chunks and validates it
+    import gc
+    import warnings
+    import modal_app
+
+    original = modal_app.AIDetectorModel
+    try:
+        client, stub = _stub_client()
+        image = base64.b64encode(_png()).decode()
+
+        # Six images: chunks of BATCH_IN_FLIGHT, malformed base64 answered in place
+        images = [image, image, "not base64!", f"data:image/png;base64,{image}", image, image]
+        response = client.post("/predict/batch", json={"images": images})
+        results = response.json()["results"]
+        print(f"✓ Batch of {len(images)}: {[r.get('top_prediction', 'error') for r in results]}")
+        assert response.status_code == 200 and len(results) == 6
+        assert "error" in results[2] and all(r["top_prediction"] == "AI" for i, r in enumerate(results) if i != 2)
+        assert [len(args[0]) for name, args in stub.calls] == [modal_app.BATCH_IN_FLIGHT, 1]
+        assert {name for name, _ in stub.calls} == {"predict_batch"}
+
+        # Bytes that are not an image come back as a per-item error from the model
+        junk = base64.b64encode(b"plain text").decode()
+        results = client.post("/predict/batch", json={"images": [junk, image]}).json()["results"]
+        assert "error" in results[0] and results[1]["top_prediction"] == "AI"
+
+        # Missing, empty or mistyped "images" and invalid JSON are refused
+        assert client.post("/predict/batch", json={"other": 1}).status_code == 422
+        assert client.post("/predict/batch", json={"images": []}).status_code == 422
+        assert client.post("/predict/batch", json={"images": [1]}).status_code == 400
+        assert client.post("/predict/batch", content=b'{"images": [', headers={
+            "Content-Type": "application/json"}).status_code == 400
+
+        # Over the cap: rejected, with nothing left unawaited
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            response = client.post("/predict/batch", json={"images": [image] * (modal_app.MAX_BATCH_IMAGES + 2)})
+            gc.collect()
+        assert response.status_code == 400
+        unawaited = [w for w in caught if "never awaited" in str(w.message)]
+        assert not unawaited, f"Unawaited coroutines: {unawaited}"
+
+        # Oversized images are refused before decoding
+        from image_io import DEFAULT_INPUT_LIMITS
+        too_big = "A" * (DEFAULT_INPUT_LIMITS["max_bytes"] * 4 // 3 + 8)
+        assert client.post("/predict/batch", json={"images": [too_big]}).status_code == 413
+    finally:
+        modal_app.AIDetectorModel = original
+
+
+def test_raw_and_upload_endpoints():
+    # /predict/raw, /predict/upload and /predict/batch/upload send raw bytes without blocking
+    import modal_app
+
+    original = modal_app.AIDetectorModel
+    try:
+        client, stub = _stub_client()
+        png = _png()
+
+        raw = client.post("/predict/raw?return_all_scores=false", content=png,
+                          headers={"Content-Type": "application/octet-stream"})
+        print(f"✓ Raw: {raw.status_code} {raw.json()}")
+        assert raw.status_code == 200 and raw.json()["top_prediction"] == "AI"
+        assert len(raw.json()["predictions"]) == 1
+        assert stub.calls[-1] == ("predict", (png,)), "The body should reach the model as-is"
+        assert client.post("/predict/raw", content=png, headers={"Content-Type": "text/plain"}).status_code == 415
+        assert client.post("/predict/raw", content=b"not an image", headers={
+            "Content-Type": "application/octet-stream"}).status_code == 400
+
+        upload = client.post("/predict/upload", files={"file": ("red.png", png, "image/png")})
+        assert upload.status_code == 200 and upload.json()["filename"] == "red.png"
+        assert client.post("/predict/upload", files={"file": ("a.txt", b"text", "text/plain")}).status_code == 400
+
+        files = [("files", (f"{i}.png", _png(color), "image/png")) for i, color in enumerate(["red", "green", "blue"] * 2)]
+        batch = client.post("/predict/batch/upload", files=files)
+        print(f"✓ Batch upload: {batch.status_code}, {len(batch.json()['results'])} results")
+        assert batch.status_code == 200 and len(batch.json()["results"]) == 6
+        assert [len(args[0]) for name, args in stub.calls if name == "predict_batch"] == [modal_app.BATCH_IN_FLIGHT, 2]
+        too_many = [files[0]] * (modal_app.MAX_BATCH_IMAGES + 1)
+        assert client.post("/predict/batch/upload", files=too_many).status_code == 400
+        mixed = [files[0], ("files", ("bad.png", b"not an image", "image/png"))]
+        assert client.post("/predict/batch/upload", files=mixed).status_code == 400
+    finally:
+        modal_app.AIDetectorModel = original
+
+
 if __name__ == "__main__":
+    test_app_registration()
+    test_raw_and_upload_endpoints()
+    test_lookup_endpoint()
+    test_batch_endpoint()
     success = test_prediction()
     exit(0 if success else 1)
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Tests for the Vercel handler's deduplication
+Images are posted to the handler over HTTP with Modal replaced by a
+counting function. The in-memory store always runs; the Postgres test
+loads supabase_schema.sql (with minimal auth / storage schemas standing in
+for Supabase's) into the database named by TEST_DATABASE_URL, and is
+skipped without it or without psycopg:
+
+    TEST_DATABASE_URL=postgresql://postgres@localhost/detector_test python -m pytest test_vercel_integration.py
+
+The Postgres test drops and recreates public.detections, auth and storage in that database.
+"""
+import base64
+import io
+import os
+import sys
+import threading
+import uuid
+from datetime import datetime, timezone
+from http.server import HTTPServer
+from pathlib import Path
+
+import pytest
+import requests
+from PIL import Image
+
+import vercel_integration
+
+# Just enough of Supabase's auth and storage schemas for supabase_schema.sql to load
+SUPABASE_STAND_IN = """
+DROP TABLE IF EXISTS public.detections CASCADE;
+DROP SCHEMA IF EXISTS auth CASCADE;
+DROP SCHEMA IF EXISTS storage CASCADE;
+CREATE SCHEMA auth;
+CREATE TABLE auth.users (id UUID PRIMARY KEY);
+CREATE FUNCTION auth.uid() RETURNS UUID AS $$ SELECT NULL::uuid $$ LANGUAGE sql;
+CREATE SCHEMA storage;
+CREATE TABLE storage.buckets (id TEXT PRIMARY KEY, name TEXT, public BOOLEAN);
+CREATE TABLE storage.objects (bucket_id TEXT, name TEXT);
+CREATE FUNCTION storage.foldername(name TEXT) RETURNS TEXT[] AS $$ SELECT string_to_array(name, '/') $$ LANGUAGE sql;
+"""
+
+USERS = ["11111111-1111-1111-1111-111111111111", "22222222-2222-2222-2222-222222222222"]
+
+
+class MemoryDetectionStore:
+    """The store interface over a list of rows and a dict of uploads (no database)"""
+
+    def __init__(self):
+        self.rows = []
+        self.uploads = {}
+
+    def find_original(self, content_hash, user_id):
+        matches = [
+            row for row in self.rows
+            if row['user_id'] == user_id and row['content_hash'] == content_hash
+            and row.get('duplicate_of') is None
+        ]
+        return matches[0] if matches else None
+
+    def upload_image(self, storage_path, image_bytes, content_type):
+        self.uploads[storage_path] = image_bytes
+        return f"memory://{vercel_integration.STORAGE_BUCKET}/{storage_path}"
+
+    def insert_detection(self, row):
+        row = {'id': uuid.uuid4(), 'created_at': datetime.now(timezone.utc), **row}
+        self.rows.append(row)
+        return row
+
+
+def _image_base64(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), color=color).save(buffer, format='JPEG')
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def _post_uploads(store, monkeypatch):
+    """
+    Post red (user 0), red again (user 0), red (user 1) and blue (user 0)
+    to the handler; returns the four responses and the Modal calls made
+    """
+    modal_calls = []
+
+    def predict(image_base64):
+        modal_calls.append(image_base64)
+        return {
+            "predictions": [{"label": "AI", "score": 0.9}, {"label": "REAL", "score": 0.1}],
+            "top_prediction": "AI",
+            "confidence": 0.9,
+        }
+
+    monkeypatch.setattr(vercel_integration, "store", store)
+    monkeypatch.setattr(vercel_integration, "modal_predict", predict)
+
+    server = HTTPServer(("127.0.0.1", 0), vercel_integration.handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    try:
+        post = lambda image, user, filename: requests.post(
+            url, json={"image": image, "user_id": user, "filename": filename}
+        ).json()
+
+        red = _image_base64('red')
+        responses = [
+            post(red, USERS[0], "red.jpg"),
+            post(red, USERS[0], "red-again.jpg"),
+            post(red, USERS[1], "their-red.jpg"),
+            post(_image_base64('blue'), USERS[0], "blue.jpg"),
+        ]
+    finally:
+        server.shutdown()
+
+    return responses, modal_calls
+
+
+def _check_responses(responses, modal_calls):
+    """A user's repeat is deduplicated; the same bytes from another user are not"""
+    first, repeat, other_user, other_image = responses
+
+    assert [r["deduplicated"] for r in responses] == [False, True, False, False]
+    assert repeat["image_url"] == first["image_url"]
+    assert repeat["top_prediction"] == "AI" and repeat["predictions"] == first["predictions"]
+    assert other_user["image_url"] != first["image_url"], "Another user's image URL must not be reused"
+    assert len(modal_calls) == 3, f"Modal should be called once per user and image, got {len(modal_calls)}"
+
+
+def test_deduplication_in_memory(monkeypatch):
+    """Byte-identical uploads reuse the same user's stored image and prediction"""
+    store = MemoryDetectionStore()
+    responses, modal_calls = _post_uploads(store, monkeypatch)
+
+    _check_responses(responses, modal_calls)
+    assert len(store.uploads) == 3
+    assert store.rows[1]['duplicate_of'] == str(store.rows[0]['id'])
+
+
+def test_anonymous_uploads_are_not_deduplicated():
+    """Without a user there is no owner to match, so every upload is scored"""
+    store = MemoryDetectionStore()
+    image_bytes = base64.b64decode(_image_base64('green'))
+    prediction = lambda image_base64: {
+        "predictions": [{"label": "REAL", "score": 0.8}], "top_prediction": "REAL", "confidence": 0.8,
+    }
+
+    results = [
+        vercel_integration.record_detection(store, image_bytes, None, "anon.jpg", predict=prediction)
+        for _ in range(2)
+    ]
+    assert [r["deduplicated"] for r in results] == [False, False]
+
+
+@pytest.fixture
+def connection():
+    """Scratch Postgres loaded with supabase_schema.sql (skips without TEST_DATABASE_URL or psycopg)"""
+    database_url = os.environ.get("TEST_DATABASE_URL")
+    if not database_url:
+        pytest.skip("Set TEST_DATABASE_URL to a scratch Postgres database to run this test")
+    psycopg = pytest.importorskip("psycopg")
+
+    connection = psycopg.connect(database_url)
+    schema = (Path(__file__).parent / "supabase_schema.sql").read_text()
+    with connection.cursor() as cursor:
+        cursor.execute(SUPABASE_STAND_IN)
+        cursor.execute(schema)
+        cursor.executemany("INSERT INTO auth.users (id) VALUES (%s)", [(user,) for user in USERS])
+    connection.commit()
+
+    yield connection
+    connection.close()
+
+
+def test_deduplication_postgres(connection, tmp_path, monkeypatch):
+    """The same flow against supabase_schema.sql, including the delete rule"""
+    responses, modal_calls = _post_uploads(
+        vercel_integration.PostgresDetectionStore(connection, str(tmp_path)), monkeypatch
+    )
+
+    _check_responses(responses, modal_calls)
+    stored = [path for path in tmp_path.rglob("*") if path.is_file()]
+    assert len(stored) == 3, f"Expected 3 stored images, found {len(stored)}"
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT id, user_id::text, content_hash, duplicate_of FROM public.detections ORDER BY created_at"
+        )
+        rows = cursor.fetchall()
+    connection.commit()
+
+    assert len(rows) == 4, f"Expected 4 detections, found {len(rows)}"
+    assert rows[1][3] == rows[0][0], "The repeat should reference the user's first detection"
+    assert rows[2][1] == USERS[1] and rows[2][2] == rows[0][2] and rows[2][3] is None
+    assert rows[3][3] is None
+
+    # An original with references cannot be deleted out from under them
+    import psycopg
+    with pytest.raises(psycopg.errors.ForeignKeyViolation):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM public.detections WHERE id = %s", (rows[0][0],))
+    connection.rollback()
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
@@ -0,0 +1,164 @@
+"""
+Tiled inference for high-resolution images
+Scores native-resolution crops instead of one squashed thumbnail, so
+high-frequency generator artifacts survive, and maps the scores back
+onto the image as a heatmap
+"""
+import math
+from typing import Any, Callable, Dict, List, Sequence, Tuple, Union
+
+from PIL import Image
+
+from frames import aggregate_predictions
+
+
+def tile_limit(engine: Any, config: Dict[str, Any]) -> int:
+    """
+    Most tiles one request may score.
+
+    Starts from config "max_tiles" and, when "tile_budget_ms" is set,
+    caps it at the number of images the engine scores within that budget,
+    estimated from its warmup timing at the largest batch size.
+
+    Args:
+        engine: InferenceEngine or OnnxEngine (reads "warmup_timings")
+        config: Parsed config.json
+
+    Returns:
+        Tile count, at least 1
+    """
+    limit = config.get("max_tiles", 16)
+    budget = config.get("tile_budget_ms")
+    timings = getattr(engine, "warmup_timings", {})
+
+    if budget and timings:
+        batch_size = max(timings)
+        per_tile = timings[batch_size] / batch_size
+        limit = min(limit, int(budget / per_tile))
+
+    return max(1, limit)
+
+
+def _positions(length: int, tile_size: int, count: int) -> List[int]:
+    """`count` tile offsets spread evenly from one edge to the other"""
+    if count == 1 or length <= tile_size:
+        return [max(0, (length - tile_size) // 2)]
+    step = (length - tile_size) / (count - 1)
+    return [round(i * step) for i in range(count)]
+
+
+def plan_tiles(width: int, height: int, tile_size: int, max_tiles: int) -> Tuple[int, int, List[Tuple[int, int, int, int]]]:
+    """
+    Lay out a grid of tile_size crops over a width x height image.
+
+    The grid covers the image (neighbouring tiles overlap when the size is
+    not a multiple of tile_size). Past max_tiles the grid is thinned along
+    its denser axis, so tiles stay at native resolution and spread over the
+    whole image, with gaps between them.
+
+    Args:
+        width, height: Image size in pixels
+        tile_size: Side of each crop (the model input size)
+        max_tiles: Most tiles to return
+
+    Returns:
+        (rows, cols, boxes) with boxes as (left, top, right, bottom), row by row
+    """
+    cols = max(1, math.ceil(width / tile_size))
+    rows = max(1, math.ceil(height / tile_size))
+
+    while rows * cols > max(1, max_tiles):
+        # Drop a column or a row, whichever axis has more tiles per pixel
+        if cols * height >= rows * width:
+            cols -= 1
+        else:
+            rows -= 1
+
+    boxes = [
+        (left, top, min(left + tile_size, width), min(top + tile_size, height))
+        for top in _positions(height, tile_size, rows)
+        for left in _positions(width, tile_size, cols)
+    ]
+    return rows, cols, boxes
+
+
+def crop_tiles(image: Union[Image.Image, "torch.Tensor"],
+               boxes: Sequence[Tuple[int, int, int, int]]) -> List[Union[Image.Image, "torch.Tensor"]]:
+    """Crop boxes out of a PIL image or a uint8 [3, H, W] tensor (tensor crops are views)"""
+    if isinstance(image, Image.Image):
+        return [image.crop(box) for box in boxes]
+    return [image[:, top:bottom, left:right] for left, top, right, bottom in boxes]
+
+
+def image_size(image: Union[Image.Image, "torch.Tensor"]) -> Tuple[int, int]:
+    """(width, height) of a PIL image or a [3, H, W] tensor"""
+    if isinstance(image, Image.Image):
+        return image.size
+    return image.shape[-1], image.shape[-2]
+
+
+def tile_heatmap(tile_predictions: Sequence[List[Dict[str, Any]]], rows: int, cols: int,
+                 label: str = "AI") -> List[List[float]]:
+    """
+    rows x cols grid of each tile's score for `label`
+
+    Args:
+        tile_predictions: One prediction list per tile, row by row
+        rows, cols: Grid shape from plan_tiles
+        label: Class whose score is mapped (labels are upper-cased)
+
+    Returns:
+        Nested list of scores, heatmap[row][col]
+    """
+    scores = [
+        next((p["score"] for p in predictions if p["label"] == label.upper()), 0.0)
+        for predictions in tile_predictions
+    ]
+    return [scores[row * cols:(row + 1) * cols] for row in range(rows)]
+
+
+def score_tiles(
+    image: Union[Image.Image, "torch.Tensor"],
+    transform: Callable,
+    score: Callable[[List[Any]], List[List[Dict[str, Any]]]],
+    tile_size: int,
+    max_tiles: int,
+    global_view: bool = True
+) -> Dict[str, Any]:
+    """
+    Tile a full-resolution image, score every view together and assemble the result.
+
+    Args:
+        image: Decoded RGB image (PIL) or uint8 [3, H, W] tensor, not downscaled
+        transform: Per-view preprocessing (the serving transform)
+        score: Scores a list of preprocessed views at once, e.g. by queueing
+            them on the micro-batcher together
+        tile_size: Tile side (the model input size)
+        max_tiles: Most views to score, including the global view
+        global_view: Also score the whole image downscaled to the input size
+            (dropped when max_tiles is 1, which leaves room for one tile only)
+
+    Returns:
+        Dict with per-tile boxes and predictions ("tiles"), the "heatmap" of
+        AI scores on the tile grid, the "global" view's predictions and the
+        mean over all views ("aggregate")
+    """
+    width, height = image_size(image)
+    global_view = global_view and max_tiles > 1
+    rows, cols, boxes = plan_tiles(width, height, tile_size, max_tiles - int(global_view))
+
+    views = crop_tiles(image, boxes) + ([image] if global_view else [])
+    predictions = score([transform(view) for view in views])
+    tile_predictions = predictions[:len(boxes)]
+
+    return {
+        "tiles": [
+            {"box": list(box), "predictions": tile}
+            for box, tile in zip(boxes, tile_predictions)
+        ],
+        "heatmap": tile_heatmap(tile_predictions, rows, cols),
+        "grid": [rows, cols],
+        "global": predictions[-1] if global_view else None,
+        "aggregate": aggregate_predictions(predictions),
+        "image_size": [width, height],
+    }
@@ -11,17 +11,195 @@ File: api/detect.py (for Python runtime) or api/detect.ts (for Node.js)
 from http.server import BaseHTTPRequestHandler
 import json
 import base64
+import hashlib
 import os
 import requests
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
 from urllib.parse import parse_qs
-from supabase import create_client, Client
 
 # Initialize Supabase
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
 MODAL_API_URL = os.environ.get("MODAL_API_URL")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+STORAGE_BUCKET = 'detection-images'
+
+
+class SupabaseDetectionStore:
+    """The detections table and detection-images bucket, through the Supabase client"""
+    
+    def __init__(self, client):
+        self.client = client
+    
+    def find_original(self, content_hash: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """The user's oldest detection that owns a stored image with this hash, or None"""
+        response = (
+            self.client.table('detections')
+            .select('*')
+            .eq('user_id', user_id)
+            .eq('content_hash', content_hash)
+            .is_('duplicate_of', 'null')
+            .order('created_at')
+            .limit(1)
+            .execute()
+        )
+        return response.data[0] if response.data else None
+    
+    def upload_image(self, storage_path: str, image_bytes: bytes, content_type: str) -> str:
+        """Store an image and return its public URL"""
+        bucket = self.client.storage.from_(STORAGE_BUCKET)
+        bucket.upload(storage_path, image_bytes, {'content-type': content_type})
+        return bucket.get_public_url(storage_path)
+    
+    def insert_detection(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Insert a detections row and return it"""
+        return self.client.table('detections').insert(row).execute().data[0]
+
+
+class PostgresDetectionStore:
+    """
+    The same operations against a plain Postgres loaded with
+    supabase_schema.sql, with images written under a local directory
+    (for running the handler without a Supabase project)
+    """
+    
+    def __init__(self, connection, storage_dir: str):
+        """
+        Args:
+            connection: DB-API connection (e.g. psycopg.connect(...))
+            storage_dir: Directory standing in for the storage bucket
+        """
+        self.connection = connection
+        self.storage_dir = Path(storage_dir)
+    
+    def _fetch_one(self, query: str, params: tuple) -> Optional[Dict[str, Any]]:
+        with self.connection.cursor() as cursor:
+            cursor.execute(query, params)
+            row = cursor.fetchone()
+            columns = [column[0] for column in cursor.description]
+        self.connection.commit()
+        return dict(zip(columns, row)) if row else None
+    
+    def find_original(self, content_hash: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """The user's oldest detection that owns a stored image with this hash, or None"""
+        return self._fetch_one(
+            "SELECT * FROM public.detections WHERE user_id = %s AND content_hash = %s "
+            "AND duplicate_of IS NULL ORDER BY created_at LIMIT 1",
+            (user_id, content_hash)
+        )
+    
+    def upload_image(self, storage_path: str, image_bytes: bytes, content_type: str) -> str:
+        """Store an image and return its file URL"""
+        path = self.storage_dir / STORAGE_BUCKET / storage_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(image_bytes)
+        return path.resolve().as_uri()
+    
+    def insert_detection(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Insert a detections row and return it"""
+        row = {**row, 'predictions': json.dumps(row['predictions'])}
+        columns = ", ".join(row)
+        values = ", ".join("%s::jsonb" if column == 'predictions' else "%s" for column in row)
+        return self._fetch_one(
+            f"INSERT INTO public.detections ({columns}) VALUES ({values}) RETURNING *",
+            tuple(row.values())
+        )
+
+
+def content_hash(image_bytes: bytes) -> str:
+    """Hex SHA-256 of the image bytes (the detections.content_hash column)"""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def modal_predict(image_base64: str) -> Dict[str, Any]:
+    """Call Modal API for prediction"""
+    modal_response = requests.post(
+        f"{MODAL_API_URL}/predict",
+        json={"image": image_base64},
+        timeout=30
+    )
+    modal_response.raise_for_status()
+    return modal_response.json()
+
+
+def record_detection(
+    store,
+    image_bytes: bytes,
+    user_id: Optional[str],
+    filename: str,
+    predict: Optional[Callable[[str], Dict[str, Any]]] = None
+) -> Dict[str, Any]:
+    """
+    Store and score an image once per distinct content
+    
+    A byte-identical image the same user already has on record reuses
+    that record's storage object and prediction: only a reference row
+    (duplicate_of) is written, with no upload and no Modal call. Records
+    are never shared between users, so one user's image URL and metadata
+    are not exposed to another; anonymous uploads are not deduplicated.
+    
+    Args:
+        store: SupabaseDetectionStore or PostgresDetectionStore
+        image_bytes: Decoded image
+        user_id: Owner of the new row, or None (anonymous)
+        filename: Original file name
+        predict: Scores a base64 image (defaults to modal_predict)
+    
+    Returns:
+        Response payload with the detection id, image URL, prediction and
+        "deduplicated"
+    """
+    digest = content_hash(image_bytes)
+    original = store.find_original(digest, user_id) if user_id else None
+    
+    if original is not None:
+        public_url = original['image_url']
+        prediction_result = {
+            'predictions': original['predictions'],
+            'top_prediction': original['prediction'],
+            'confidence': original['confidence'],
+        }
+        db_data = {'duplicate_of': str(original['id'])}
+    else:
+        # Upload to Supabase Storage
+        storage_path = f"{user_id}/{filename}" if user_id else filename
+        public_url = store.upload_image(storage_path, image_bytes, 'image/jpeg')
+        prediction_result = (predict or modal_predict)(base64.b64encode(image_bytes).decode())
+        db_data = {}
+    
+    # Store in Supabase database
+    detection = store.insert_detection({
+        'user_id': user_id,
+        'image_url': public_url,
+        'image_filename': filename,
+        'prediction': prediction_result['top_prediction'],
+        'confidence': prediction_result['confidence'],
+        'predictions': prediction_result['predictions'],
+        'content_hash': digest,
+        **db_data
+    })
+    
+    return {
+        'success': True,
+        'detection_id': str(detection['id']),
+        'image_url': public_url,
+        'deduplicated': original is not None,
+        **prediction_result
+    }
+
+
+# Created on first request; replace with a PostgresDetectionStore to run locally
+store = None
+
+
+def get_store():
+    """The module's detection store (Supabase unless replaced)"""
+    global store
+    if store is None:
+        from supabase import create_client
+        store = SupabaseDetectionStore(create_client(SUPABASE_URL, SUPABASE_KEY))
+    return store
 
 
 class handler(BaseHTTPRequestHandler):
@@ -42,47 +220,12 @@ class handler(BaseHTTPRequestHandler):
                 self._send_error(400, "No image provided")
                 return
             
-            # Upload to Supabase Storage
+            # A user's byte-identical images reuse their stored object and prediction
             image_bytes = base64.b64decode(image_base64)
-            storage_path = f"{user_id}/{filename}" if user_id else filename
-            
-            storage_response = supabase.storage.from_('detection-images').upload(
-                storage_path,
-                image_bytes,
-                {'content-type': 'image/jpeg'}
-            )
-            
-            # Get public URL
-            public_url = supabase.storage.from_('detection-images').get_public_url(storage_path)
-            
-            # Call Modal API for prediction
-            modal_response = requests.post(
-                f"{MODAL_API_URL}/predict",
-                json={"image": image_base64},
-                timeout=30
-            )
-            modal_response.raise_for_status()
-            prediction_result = modal_response.json()
-            
-            # Store in Supabase database
-            db_data = {
-                'user_id': user_id,
-                'image_url': public_url,
-                'image_filename': filename,
-                'prediction': prediction_result['top_prediction'],
-                'confidence': prediction_result['confidence'],
-                'predictions': prediction_result['predictions']
-            }
-            
-            db_response = supabase.table('detections').insert(db_data).execute()
+            result = record_detection(get_store(), image_bytes, user_id, filename)
             
             # Send success response
-            self._send_response(200, {
-                'success': True,
-                'detection_id': db_response.data[0]['id'],
-                'image_url': public_url,
-                **prediction_result
-            })
+            self._send_response(200, result)
             
         except Exception as e:
             self._send_error(500, str(e))
@@ -93,7 +236,7 @@ class handler(BaseHTTPRequestHandler):
         self.send_header('Content-type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', '*')
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
+        self.wfile.write(json.dumps(data, default=str).encode())
     
     def _send_error(self, status_code, message):
         """Send error response"""